@@ -1,3 +1,5 @@
+from collections.abc import Mapping
+
 import customtkinter as ctk
 
 from .data_manager import DataManager
@@ -10,6 +12,7 @@ from .pages.card_page import CardPage
 from .pages.rooms_page import RoomsPage
 from .ui.ui_components import PageManager
 from .user_manager import UserManager
+from .user_store import SQLiteUserStore
 
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
@@ -18,17 +21,18 @@ ctk.set_default_color_theme("blue")
 class CarApp(ctk.CTk):
     """Главное приложение CarRoulette для Forza."""
     
-    def __init__(self):
+    def __init__(self, user_db: str = None):
         super().__init__()
         self.title("CarRoulette for Forza")
         self.geometry("1200x800")
         
         # Менеджеры
         self.data_manager = DataManager()
-        self.user_manager = UserManager()
+        # С user_db зарегистрированные пользователи сохраняются между запусками
+        self.user_manager = UserManager(SQLiteUserStore(user_db) if user_db else None)
         self.current_user_id = None  # Создадим "текущего пользователя"
         self.room_manager = RoomManager()  # Менеджер комнат
-        self.game_manager = GameManager()  # Менеджер игр
+        self.game_manager = GameManager(self.data_manager)  # Менеджер игр
         
         # UI компоненты
         self.pages = {}
@@ -167,7 +171,7 @@ class CarApp(ctk.CTk):
         dlg = LoginDialog(self, user_manager=self.user_manager)
         dlg.show()
         user = dlg.get_result()
-        if user and isinstance(user, dict):
+        if user and isinstance(user, Mapping):
             self.current_user_id = user.get("id", self.current_user_id)
             # Обновим страницу комнат, чтобы она увидела нового пользователя
             if self.rooms_page:
@@ -178,13 +182,9 @@ class CarApp(ctk.CTk):
         dlg.show()
         data = dlg.get_result()
         if data and isinstance(data, dict):
-            # После регистрации можно сразу авторизовать пользователя
-            new_user = None
-            # Попробуем найти созданного пользователя в списке
-            for u in self.user_manager.list_users():
-                if u.get("name") == data.get("nickname"):
-                    new_user = u
-                    break
+            # После регистрации сразу авторизуем созданного пользователя (не ищем по имени:
+            # запись есть только при успешном создании)
+            new_user = data.get("user")
             if new_user:
                 self.current_user_id = new_user.get("id")
                 if self.rooms_page:
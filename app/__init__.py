@@ -1,12 +1,17 @@
+# Только модули ядра: UI (App, pages, dialogs, ui) требует customtkinter
+# и импортируется напрямую, например в run_app.py
 __all__ = [
-    "App",
-    "Data",
-    "DataManager",
-    "GameManager",
-    "ModuleApp",
-    "UserManager",
-    "Page.CarPage",
-    "Page.CardPage",
-    "Page.RoomsPage",
-    "Page.UIComponents",
-]
\ No newline at end of file
+    "archive",
+    "data_manager",
+    "game_manager",
+    "metrics",
+    "passwords",
+    "random_tools",
+    "records",
+    "room_manager",
+    "sessions",
+    "snapshot",
+    "user_manager",
+    "user_store",
+    "wal",
+]
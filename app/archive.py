@@ -0,0 +1,129 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class RecordArchive:
+    """Архив записей в файле: только дозапись, одна JSON-запись на строку.
+
+    В памяти хранится лишь смещение каждой записи в файле (id -> offset),
+    сами записи читаются с диска по запросу.
+    """
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.key = key
+        self._offsets: Dict[int, int] = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a+b")
+        self._load_index()
+
+    def _load_index(self):
+        """Строит индекс смещений по уже существующему файлу"""
+        self._file.seek(0)
+        offset = 0
+        for line in self._file:
+            try:
+                record = json.loads(line)
+                self._offsets[record[self.key]] = offset
+            except (ValueError, KeyError, TypeError):
+                # Недописанная строка (например, после аварийного завершения)
+                pass
+            offset += len(line)
+
+    def append(self, record: Dict):
+        """Дописывает запись в конец архива"""
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(line)
+        self._file.flush()
+        self._offsets[record[self.key]] = offset
+
+    def extend(self, records: List[Dict]):
+        """Дописывает несколько записей одной операцией записи"""
+        if not records:
+            return
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        chunks = []
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+            self._offsets[record[self.key]] = offset
+            offset += len(line)
+            chunks.append(line)
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        """Читает запись из архива по id"""
+        offset = self._offsets.get(record_id)
+        if offset is None:
+            return None
+        self._file.seek(offset)
+        return json.loads(self._file.readline())
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def ids(self) -> Iterator[int]:
+        return iter(self._offsets)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class RetentionQueue:
+    """Очередь завершенных записей в порядке завершения.
+
+    Запись покидает горячую память, когда пролежала дольше ttl секунд
+    или когда завершенных записей больше max_items. Проверка идет с
+    начала очереди, поэтому стоит O(1) на каждую вытесненную запись.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_items: Optional[int] = None):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._closed: "OrderedDict[int, float]" = OrderedDict()
+
+    def push(self, record_id: int, now: float = None):
+        self._closed[record_id] = time.monotonic() if now is None else now
+
+    def discard(self, record_id: int):
+        self._closed.pop(record_id, None)
+
+    def pop_expired(self, now: float = None) -> List[int]:
+        """Возвращает id записей, которые пора убрать из памяти"""
+        if self.ttl is None and self.max_items is None:
+            return []
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self._closed:
+            record_id, closed_at = next(iter(self._closed.items()))
+            too_many = self.max_items is not None and len(self._closed) > self.max_items
+            too_old = self.ttl is not None and now - closed_at >= self.ttl
+            if not (too_many or too_old):
+                break
+            self._closed.popitem(last=False)
+            expired.append(record_id)
+        return expired
+
+    def entries(self) -> List[Tuple[int, float]]:
+        """Содержимое очереди: (id, время завершения) в порядке завершения"""
+        return list(self._closed.items())
+
+    def load(self, entries: Iterable[Tuple[int, float]]):
+        """Заменяет содержимое очереди (например, при восстановлении из снимка)"""
+        self._closed = OrderedDict(entries)
+
+    def __len__(self) -> int:
+        return len(self._closed)
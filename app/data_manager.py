@@ -1,23 +1,64 @@
 import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
 
 class DataManager:
     """Класс для управления данными приложения"""
-    
+
     def __init__(self):
         self.data_sources = {
             'forza5': "app/data/cars_forza5.json",
-            'forza4': "app/data/cars_forza4.json", 
+            'forza4': "app/data/cars_forza4.json",
             'cards': "app/data/cards.json"
         }
-    
+        # Кэш каталогов: ключ -> (mtime_ns, size, данные)
+        self._cache: Dict[str, Tuple[int, int, List]] = {}
+        # Версия каталога растет при каждой перезагрузке файла
+        self._versions: Dict[str, int] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
     def get_data(self, source_key):
-        """Получение данных по ключу из JSON-файла"""
-        print(f"Получение данных по ключу: {source_key}")
+        """Получение данных по ключу из JSON-файла (с кэшированием в памяти)"""
+        log.debug("Получение данных по ключу: %s", source_key)
         try:
             if source_key in self.data_sources:
-                with open(self.data_sources[source_key], 'r', encoding='utf-8') as file:
-                    return json.load(file)
+                path = self.data_sources[source_key]
+                st = os.stat(path)
+                cached = self._cache.get(source_key)
+                if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                    self.cache_hits += 1
+                    return cached[2]
+
+                self.cache_misses += 1
+                with open(path, 'r', encoding='utf-8') as file:
+                    data = json.load(file)
+                self._cache[source_key] = (st.st_mtime_ns, st.st_size, data)
+                self._versions[source_key] = self._versions.get(source_key, 0) + 1
+                return data
             return []
         except Exception as e:
-            print(f"Ошибка при чтении данных: {e}")
-            return []
\ No newline at end of file
+            log.error("Ошибка при чтении данных: %s", e)
+            return []
+
+    def get_version(self, source_key) -> int:
+        """Версия каталога: меняется каждый раз, когда файл был перечитан"""
+        return self._versions.get(source_key, 0)
+
+    def invalidate(self, source_key: Optional[str] = None):
+        """Сбрасывает кэш одного каталога или всех сразу"""
+        if source_key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(source_key, None)
+
+    def get_cache_stats(self) -> Dict:
+        """Статистика кэша: попадания, промахи и загруженные каталоги"""
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "cached": list(self._cache.keys()),
+        }
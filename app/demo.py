@@ -1,3 +1,4 @@
+from .log import configure_logging
 from .network.game_server_system import GameServerSystem
 
 def demo_system():
@@ -52,4 +53,5 @@ def demo_system():
     print("\n=== ДЕМОНСТРАЦИЯ ЗАВЕРШЕНА ===")
 
 if __name__ == "__main__":
+    configure_logging(queued=False)
     demo_system()
\ No newline at end of file
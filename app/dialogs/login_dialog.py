@@ -19,6 +19,8 @@ class LoginDialog(Box):
 
         self.user_manager = user_manager
         self.result = None
+        # Проверка пароля идет в пуле хеширования; окно опрашивает ее по таймеру
+        self._pending = None
 
     def create_content(self, container):
         # Настройка сетки
@@ -119,6 +121,8 @@ class LoginDialog(Box):
 
     def on_submit(self):
         """Обработчик входа"""
+        if self._pending is not None:
+            return
         errors = self.validate_form()
         
         if errors:
@@ -129,16 +133,30 @@ class LoginDialog(Box):
         nickname = self.nickname_entry.get().strip()
         password = self.password_entry.get()
 
-        # Если доступен user_manager, выполним проверку
+        # Если доступен user_manager, выполним проверку (не блокируя окно)
         if self.user_manager is not None:
-            user = self.user_manager.authenticate_user(nickname, password)
-            if not user:
-                self.status_label.configure(text="Неверный никнейм или пароль")
-                return
-            self.result = user
-        else:
-            self.result = {'nickname': nickname}
+            self.status_label.configure(text="Проверка...")
+            self._pending = self.user_manager.authenticate_future(nickname, password)
+            self.after(20, self._check_login, nickname)
+            return
+
+        self.result = {'nickname': nickname}
+        self._finish(nickname)
+
+    def _check_login(self, nickname):
+        """Ждет результат проверки пароля"""
+        if not self._pending.done():
+            self.after(20, self._check_login, nickname)
+            return
+        user = self._pending.result()
+        self._pending = None
+        if not user:
+            self.status_label.configure(text="Неверный никнейм или пароль")
+            return
+        self.result = user
+        self._finish(nickname)
 
+    def _finish(self, nickname):
         print(f"Вход пользователя: {nickname}")
         self._on_close()
 
@@ -20,6 +20,8 @@ class RegDialog(Box):
         self.user_manager = user_manager
         self.submit_btn = None
         self.result = None
+        # Хеш пароля считается в пуле хеширования; окно опрашивает его по таймеру
+        self._pending = None
 
     def create_content(self, container):
         # Настройка сетки
@@ -114,6 +116,8 @@ class RegDialog(Box):
 
     def on_submit(self):
         """Обработчик отправки формы"""
+        if self._pending is not None:
+            return
         errors = self.validate_form()
         
         if errors:
@@ -129,10 +133,31 @@ class RegDialog(Box):
 
         if self.user_manager is not None:
             print(f"Регистрация пользователя: {self.result['nickname']}")
-            self.user_manager.create_user(self.result['nickname'], self.result['password'])
-        else:
-            print("Не удалось создать пользователя")
+            self.status_label.configure(text="Регистрация...")
+            self.submit_btn.configure(state="disabled")
+            self._pending = self.user_manager.hasher.hash_future(self.result['password'])
+            self.after(20, self._check_hash)
+            return
+
+        print("Не удалось создать пользователя")
+        self._on_close()
 
+    def _check_hash(self):
+        """Ждет хеш пароля и создает пользователя"""
+        if not self._pending.done():
+            self.after(20, self._check_hash)
+            return
+        password_hash = self._pending.result()
+        self._pending = None
+        # Пользователь создается в потоке окна: менеджер не потокобезопасен
+        user = self.user_manager.create_user_hashed(self.result['nickname'], password_hash)
+        if user is None:
+            # Имя заняли (в том числе пока считался хеш): окно остается открытым
+            self.result = None
+            self.status_label.configure(text="• Этот никнейм уже занят")
+            self.submit_btn.configure(state="normal")
+            return
+        self.result['user'] = user
         self._on_close()
 
     def get_result(self):
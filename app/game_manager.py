@@ -1,49 +1,84 @@
-from typing import Optional, List, Dict, Tuple
-from datetime import datetime
+import time
+from typing import Optional, Iterable, List, Dict, Tuple
+
+from .archive import RecordArchive, RetentionQueue
+from .random_tools import CardDeck, RngStream, new_seed
+from .records import GAME_ACTIVE, GAME_ENDED, ROOM_CLOSED, ROOM_STARTED, GameRecord
 
 
 class GameManager:
-    def __init__(self):
-        self.games: List[Dict] = []
+    def __init__(self, data_manager=None, archive: RecordArchive = None, retention_ttl: float = None, retention_max: int = None):
+        # Игры по id_game и индекс активной игры по комнате
+        self.games: Dict[int, GameRecord] = {}
+        self._active_by_room: Dict[int, int] = {}
         self.next_games_id = 1
+        # Шаг выдачи id (при шардировании у каждого шарда свой остаток по модулю)
+        self.id_step = 1
+        # Источник каталога карточек для колод игр (DataManager)
+        self.data_manager = data_manager
+        # Колоды активных игр: id_game -> CardDeck (создаются при первом выборе)
+        self.decks: Dict[int, CardDeck] = {}
+        # Потоки случайных чисел игр: id_game -> RngStream (создаются при первом
+        # обращении по зерну из записи игры)
+        self.rngs: Dict[int, RngStream] = {}
+        # Завершенные игры уходят в архив по TTL или по количеству (если архив задан)
+        self.archive = archive
+        self._retention = RetentionQueue(retention_ttl, retention_max)
+        # Журнал предзаписи изменений (WriteAheadLog), если задан
+        self.journal = None
 
     def get_game_by_id(self, game_id: int) -> Optional[Dict]:
-        for game in self.games:
-            if game["id_game"] == game_id:
-                return game
-        return None
-
-    def get_game_by_room(self, room_id: int) -> Optional[Dict]:
-        for game in self.games:
-            if game["room_id"] == room_id and game["status"] == "active":
-                return game
-        return None
-
-    def start_game(self, room_id: int, user_id: int, room_manager) -> Tuple[bool, str]:
-        """Запускает игру из комнаты. Меняет статус комнаты на 'started'."""
+        game = self.games.get(game_id)
+        if game is None and self.archive is not None:
+            # Завершенная игра могла уже уйти в архив
+            return self.archive.get(game_id)
+        return game
+
+    def get_game_by_room(self, room_id: int) -> Optional[GameRecord]:
+        game_id = self._active_by_room.get(room_id)
+        return self.games.get(game_id) if game_id is not None else None
+
+    def count_active_games(self) -> int:
+        return len(self._active_by_room)
+
+    def archive_ended_games(self, now: float = None) -> int:
+        """Переносит в архив завершенные игры, вышедшие за пределы хранения."""
+        if self.archive is None:
+            return 0
+
+        records = [self.games.pop(game_id).to_dict() for game_id in self._retention.pop_expired(now)
+                   if game_id in self.games]
+        self.archive.extend(records)
+        return len(records)
+
+    def start_game(self, room_id: int, user_id: int, room_manager, seed: int = None) -> Tuple[bool, str]:
+        """Запускает игру из комнаты. Меняет статус комнаты на 'started'.
+
+        seed задает зерно потока случайных чисел игры; по умолчанию
+        генерируется новое. Зерно сохраняется в записи игры для повтора.
+        """
         room = room_manager.get_room_by_id(room_id)
-        if not room:
+        if room is None:
             return False, "Комната не найдена"
-        if room["owner_id"] != user_id:
+        if room.owner_id != user_id:
             return False, "Запустить игру может только владелец комнаты"
-        if room["status"] == "closed":
+        if room.status_code == ROOM_CLOSED:
             return False, "Комната закрыта"
-        if room["status"] == "started":
+        if room.status_code == ROOM_STARTED:
             return False, "Игра уже запущена"
 
-        game = {
-            "id_game": self.next_games_id,
-            "room_id": room_id,
-            "owner_id": user_id,
-            "participants_id": list(room.get("participants_id", [])),
-            "created_at": datetime.now().strftime("%H:%M:%S"),
-            "status": "active",
-        }
-        self.games.append(game)
-        self.next_games_id += 1
+        game_id = self.next_games_id
+        game = GameRecord(game_id, room_id, user_id, list(room.participants_id),
+                          new_seed() if seed is None else int(seed))
+        self.games[game_id] = game
+        self._active_by_room[room_id] = game_id
+        self.next_games_id += self.id_step
+        if self.journal is not None:
+            # Зерно пишется явно: при повторе из журнала игра получит тот же поток случайных чисел
+            self.journal.append("start_game", room_id, user_id, game.seed)
 
-        room["status"] = "started"
-        return True, f"Игра #{game['id_game']} в комнате #{room_id} запущена"
+        room_manager.set_room_status(room_id, "started")
+        return True, f"Игра #{game_id} в комнате #{room_id} запущена"
 
     def close_game(self, game_id: int, user_id: int, room_manager) -> Tuple[bool, str]:
         """Завершает игру и закрывает связанную комнату."""
@@ -55,12 +90,77 @@ class GameManager:
         if game["status"] != "active":
             return False, "Игра уже завершена"
 
-        game["status"] = "ended"
-        game["ended_at"] = datetime.now().strftime("%H:%M:%S")
+        game.status_code = GAME_ENDED
+        game.ended = time.monotonic()
+        self.decks.pop(game_id, None)
+        self.rngs.pop(game_id, None)
+        if self._active_by_room.get(game["room_id"]) == game_id:
+            del self._active_by_room[game["room_id"]]
+        if self.archive is not None:
+            self._retention.push(game_id)
+            self.archive_ended_games()
 
         # Закрываем комнату
         ok, msg = room_manager.room_end(game["room_id"], user_id)
+        if self.journal is not None:
+            # Запись идет после записи room_end: при повторе комната закрывается раньше,
+            # и вложенный room_end в close_game ничего не меняет
+            self.journal.append("close_game", game_id, user_id)
         if not ok:
             # Комната может быть уже закрыта; возвращаем статус игры как завершенной
             return True, f"Игра #{game_id} завершена, но комнату закрыть не удалось: {msg}"
-        return True, f"Игра #{game_id} завершена и комната #{game['room_id']} закрыта"
\ No newline at end of file
+        return True, f"Игра #{game_id} завершена и комната #{game['room_id']} закрыта"
+
+    def get_rng(self, game_id: int, key=None) -> Optional[RngStream]:
+        """Поток случайных чисел игры (или его подпоток по ключу, например id игрока)."""
+        rng = self.rngs.get(game_id)
+        if rng is None:
+            game = self.get_game_by_id(game_id)
+            if not game or game.get("seed") is None:
+                return None
+            # Восстанавливаем поток по сохраненному зерну
+            rng = self.rngs[game_id] = RngStream(game["seed"])
+        return rng if key is None else rng.substream(key)
+
+    def get_deck(self, game_id: int) -> Optional[CardDeck]:
+        """Колода карточек активной игры; создается при первом обращении."""
+        deck = self.decks.get(game_id)
+        if deck is not None:
+            return deck
+
+        game = self.get_game_by_id(game_id)
+        if not game or game["status"] != "active" or self.data_manager is None:
+            return None
+
+        cards = self.data_manager.get_data("cards")
+        if not cards:
+            return None
+
+        deck = CardDeck(cards)
+        self.decks[game_id] = deck
+        return deck
+
+    def draw_card(self, game_id: int) -> Optional[Dict]:
+        """Вытягивает карточку из колоды игры без повторов до конца колоды."""
+        deck = self.get_deck(game_id)
+        if deck is None or len(deck) == 0:
+            return None
+        return deck.draw(self.get_rng(game_id, "deck"))
+
+    def dump_state(self) -> Tuple[List[GameRecord], int, List[Tuple[int, float]]]:
+        """Игры, следующий id и очередь на архивацию - для снимка состояния"""
+        return list(self.games.values()), self.next_games_id, self._retention.entries()
+
+    def load_state(self, games: Iterable[GameRecord], next_games_id: int, retained: Iterable[Tuple[int, float]] = ()):
+        """Заменяет игры восстановленными из снимка.
+
+        Колоды не сохраняются и создаются заново, потоки случайных чисел
+        восстанавливаются по зерну при первом обращении.
+        """
+        self.games = {game.id_game: game for game in games}
+        self.next_games_id = next_games_id
+        self._active_by_room = {game.room_id: game_id for game_id, game in self.games.items()
+                                if game.status_code == GAME_ACTIVE}
+        self.decks.clear()
+        self.rngs.clear()
+        self._retention.load(retained)
@@ -0,0 +1,123 @@
+"""Журналирование приложения поверх стандартного logging.
+
+Модули берут логгер через logging.getLogger(__name__) и передают
+аргументы сообщения отдельно (log.debug("... %s", value)): строка
+форматируется, только если уровень включен. Дополнительные поля
+записи передаются через extra=fields(...) и попадают в структурный
+вывод.
+
+Пока configure_logging() не вызван, к логгеру "app" подключен только
+NullHandler, и все, что ниже WARNING, отбрасывается одной проверкой уровня.
+После настройки записи уходят в очередь, а в поток вывода их пишет
+отдельный поток QueueListener, поэтому вызывающий код не ждет stdout.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Dict, Optional, TextIO
+
+ROOT_LOGGER = "app"
+FORMAT_PLAIN = "plain"  # только текст сообщения, как прежний print
+FORMAT_TEXT = "text"    # время, уровень, модуль, сообщение и поля key=value
+FORMAT_JSON = "json"    # одна JSON-запись на строку
+LOG_FORMATS = (FORMAT_PLAIN, FORMAT_TEXT, FORMAT_JSON)
+
+logging.getLogger(ROOT_LOGGER).addHandler(logging.NullHandler())
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+
+
+def fields(**values) -> Dict:
+    """Поля структурной записи: log.info("...", extra=fields(user_id=1))"""
+    return {"fields": values}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, plain: bool = False):
+        super().__init__(None if plain else "%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+        self.plain = plain
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extra = getattr(record, "fields", None)
+        if extra and not self.plain:
+            text += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """Уровни модулей из строки вида "app.network=DEBUG,app.user_manager=WARNING" """
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        if not level:
+            raise ValueError(f"Ожидалось модуль=УРОВЕНЬ: {item}")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level: str = "INFO", module_levels: Dict[str, str] = None, fmt: str = FORMAT_PLAIN,
+                      stream: TextIO = None, queued: bool = True):
+    """Включает вывод журнала приложения; повторный вызов заменяет прежние настройки.
+
+    level - общий уровень логгера "app", module_levels - уровни отдельных
+    модулей (имя логгера -> уровень), fmt - plain, text или json.
+    queued=False пишет записи сразу в вызывающем потоке: так вывод журнала
+    не перемешивается с print сценариев вроде demo.
+    """
+    global _listener, _handler
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"Неизвестный формат журнала: {fmt}")
+
+    root = logging.getLogger(ROOT_LOGGER)
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == FORMAT_JSON else TextFormatter(plain=fmt == FORMAT_PLAIN))
+
+    if queued:
+        log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        _handler = logging.handlers.QueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+    else:
+        _handler = output
+
+    root.addHandler(_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level.upper() if isinstance(module_level, str) else module_level)
+
+
+def shutdown_logging():
+    """Дописывает очередь и отключает обработчик, установленный configure_logging"""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+        _handler = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Границы корзин гистограммы задержек, в секундах (1 мкс .. 1 с)
+DEFAULT_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0,
+)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+log = logging.getLogger(__name__)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class Gauge:
+    """Текущее значение; с func значение вычисляется при чтении"""
+
+    __slots__ = ("value", "func")
+
+    def __init__(self, func: Callable[[], float] = None):
+        self.value = 0
+        self.func = func
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def get(self):
+        return self.func() if self.func is not None else self.value
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: observe - один bisect и два сложения"""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # Последняя ячейка - значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля сверху: граница корзины, в которую он попадает"""
+        total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def get(self) -> Dict:
+        count = self.count
+        return {
+            "count": count,
+            "sum": self.sum,
+            "avg": self.sum / count if count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """Реестр метрик: счетчики, датчики и гистограммы задержек с метками.
+
+    Метрика создается при первом обращении и дальше возвращается та же,
+    поэтому ссылки на нее можно сохранить и обновлять без поиска в реестре.
+    """
+
+    def __init__(self, namespace: str = "carroulette"):
+        self.namespace = namespace
+        self._metrics: Dict[str, Dict[Labels, object]] = {}
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+
+    def _get(self, kind: str, name: str, help_text: str, labels: Dict[str, str], factory):
+        known = self._types.get(name)
+        if known is None:
+            self._types[name] = kind
+            self._help[name] = help_text
+            self._metrics[name] = {}
+        elif known != kind:
+            raise ValueError(f"Метрика {name} уже зарегистрирована как {known}")
+        key: Labels = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        family = self._metrics[name]
+        metric = family.get(key)
+        if metric is None:
+            metric = family[key] = factory()
+        return metric
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get(COUNTER, name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str = "", func: Callable[[], float] = None, **labels) -> Gauge:
+        return self._get(GAUGE, name, help_text, labels, lambda: Gauge(func))
+
+    def histogram(self, name: str, help_text: str = "", buckets: Iterable[float] = DEFAULT_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get(HISTOGRAM, name, help_text, labels, lambda: Histogram(buckets))
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Текущие значения: {имя: {"метка=значение,...": значение}}; пустые гистограммы пропускаются"""
+        result: Dict[str, Dict[str, object]] = {}
+        for name, family in self._metrics.items():
+            values = {}
+            for labels, metric in family.items():
+                if isinstance(metric, Histogram) and not any(metric.counts):
+                    continue
+                values[",".join(f"{k}={v}" for k, v in labels)] = metric.get()
+            if values:
+                result[name] = values
+        return result
+
+    def render_text(self) -> str:
+        """Текстовая выгрузка в формате Prometheus"""
+        lines: List[str] = []
+        for name, family in self._metrics.items():
+            full = f"{self.namespace}_{name}"
+            kind = self._types[name]
+            if self._help[name]:
+                lines.append(f"# HELP {full} {self._help[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, metric in family.items():
+                if kind == HISTOGRAM:
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float("inf"),), metric.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{full}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{full}_sum{_format_labels(labels)} {metric.sum}")
+                    lines.append(f"{full}_count{_format_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{full}{_format_labels(labels)} {metric.get()}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _public_methods(obj) -> List[str]:
+    cls = type(obj)
+    return [name for name in dir(cls)
+            if not name.startswith("_") and callable(getattr(cls, name)) and not isinstance(getattr(cls, name), type)]
+
+
+def instrument(obj, registry: MetricsRegistry, component: str, methods: Iterable[str] = None):
+    """Оборачивает публичные методы объекта замером времени.
+
+    Для каждого метода ведется гистограмма call_duration_seconds (ее count -
+    число вызовов) и счетчик call_errors_total для исключений. Обертки ставятся
+    на экземпляр, сам класс не меняется.
+    """
+    for name in methods or _public_methods(obj):
+        method = getattr(obj, name)
+        histogram = registry.histogram("call_duration_seconds", "Время выполнения публичных методов",
+                                       component=component, method=name)
+        errors = registry.counter("call_errors_total", "Исключения в публичных методах",
+                                  component=component, method=name)
+        setattr(obj, name, _timed(method, histogram, errors))
+
+
+def _timed(method, histogram: Histogram, errors: Counter):
+    perf_counter = time.perf_counter
+    observe = histogram.observe
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            errors.value += 1
+            observe(perf_counter() - start)
+            raise
+        observe(perf_counter() - start)
+        return result
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+async def start_metrics_server(registry: MetricsRegistry, host: str = "127.0.0.1",
+                               port: int = 0) -> asyncio.AbstractServer:
+    """HTTP-эндпоинт с текстовой выгрузкой метрик: любой GET возвращает render_text()"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Заголовки запроса не нужны, дочитываем их до пустой строки
+            while (await reader.readline()).strip():
+                pass
+            body = registry.render_text().encode("utf-8")
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                         b"Connection: close\r\n\r\n" + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    log.info("Метрики доступны на http://%s:%s/metrics", host, server.sockets[0].getsockname()[1])
+    return server
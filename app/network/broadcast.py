@@ -0,0 +1,179 @@
+import asyncio
+from collections import deque
+from typing import Dict, Iterable, Optional, Set
+
+# Политики для медленных получателей, когда очередь отправки заполнена
+POLICY_DROP_NEW = "drop_new"        # новое сообщение отбрасывается
+POLICY_DROP_OLDEST = "drop_oldest"  # вытесняется самое старое сообщение в очереди
+POLICY_DISCONNECT = "disconnect"    # получатель отключается
+SLOW_CONSUMER_POLICIES = (POLICY_DROP_NEW, POLICY_DROP_OLDEST, POLICY_DISCONNECT)
+
+
+class SendQueue:
+    """Ограниченная очередь исходящих кадров одного подключения.
+
+    Кадры пишет отдельная задача, поэтому медленный получатель ждет
+    drain() только в своей задаче и не задерживает остальных. Ответы на
+    запросы (forced) никогда не вытесняются: клиент ждет их по id.
+    """
+
+    __slots__ = ("writer", "frames", "max_frames", "dropped", "forced", "_wakeup", "_task", "_closed")
+
+    def __init__(self, writer: asyncio.StreamWriter, max_frames: int):
+        self.writer = writer
+        self.frames: deque = deque()
+        self.max_frames = max_frames
+        self.dropped = 0
+        # id кадров-ответов, которые сейчас лежат в очереди
+        self.forced: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.frames) >= self.max_frames
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def put(self, frame: bytes, forced: bool = False):
+        if self._closed:
+            return
+        if forced:
+            self.forced.add(id(frame))
+        self.frames.append(frame)
+        self._wakeup.set()
+
+    def drop_oldest(self) -> bool:
+        """Вытесняет самый старый кадр, кроме ответов; False - вытеснять нечего"""
+        frames = self.frames
+        if not self.forced:
+            if not frames:
+                return False
+            frames.popleft()
+            self.dropped += 1
+            return True
+        for index, frame in enumerate(frames):
+            if id(frame) not in self.forced:
+                del frames[index]
+                self.dropped += 1
+                return True
+        return False
+
+    def close(self, abort: bool = False):
+        """Закрывает очередь; abort=True рвет соединение, не дожидаясь отправки буфера"""
+        self._closed = True
+        self.frames.clear()
+        self.forced.clear()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        if abort:
+            self.writer.transport.abort()
+        elif not self.writer.is_closing():
+            self.writer.close()
+
+    async def _write_loop(self):
+        writer = self.writer
+        frames = self.frames
+        try:
+            while not self._closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                # Все накопленные кадры пишем одним пакетом, затем ждем drain
+                if frames:
+                    batch = list(frames)
+                    frames.clear()
+                    self.forced.clear()
+                    writer.writelines(batch)
+                    await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+
+class Broadcaster:
+    """Рассылка сообщений по подключениям.
+
+    Сообщение кодируется один раз, и один и тот же объект bytes
+    ставится в очередь каждого получателя.
+    """
+
+    def __init__(self, max_queue: int = 256, policy: str = POLICY_DROP_OLDEST):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Неизвестная политика: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queues: Dict[int, SendQueue] = {}  # id подключения -> очередь
+        self.broadcasts = 0
+        self.frames_sent = 0
+        self.dropped_total = 0
+        self.slow_disconnects = 0
+
+    def register(self, conn_id: int, writer: asyncio.StreamWriter) -> SendQueue:
+        queue = SendQueue(writer, self.max_queue)
+        queue.start()
+        self.queues[conn_id] = queue
+        return queue
+
+    def unregister(self, conn_id: int):
+        queue = self.queues.pop(conn_id, None)
+        if queue is not None:
+            self.dropped_total += queue.dropped
+            queue.close()
+
+    def enqueue(self, queue: SendQueue, frame: bytes, force: bool = False) -> bool:
+        """Ставит кадр в очередь с учетом политики для медленных получателей.
+
+        force=True используется для ответов на запросы: они не отбрасываются
+        и не вытесняются, но переполнение вдвое сверх лимита все равно
+        отключает получателя.
+        """
+        if queue.is_full:
+            if force:
+                if len(queue) >= 2 * queue.max_frames:
+                    self._disconnect(queue)
+                    return False
+            elif self.policy == POLICY_DROP_NEW:
+                queue.dropped += 1
+                return False
+            elif self.policy == POLICY_DISCONNECT:
+                self._disconnect(queue)
+                return False
+            elif not queue.drop_oldest():
+                # В очереди одни ответы на запросы: отбрасывается новый кадр
+                queue.dropped += 1
+                return False
+
+        queue.put(frame, force)
+        self.frames_sent += 1
+        return True
+
+    def broadcast(self, queues: Iterable[SendQueue], frame: bytes) -> int:
+        """Рассылает уже закодированный кадр; возвращает число принятых получателей"""
+        self.broadcasts += 1
+        delivered = 0
+        for queue in queues:
+            if self.enqueue(queue, frame):
+                delivered += 1
+        return delivered
+
+    def _disconnect(self, queue: SendQueue):
+        self.slow_disconnects += 1
+        queue.close(abort=True)
+
+    def get_stats(self) -> Dict:
+        depths = [len(q) for q in self.queues.values()]
+        return {
+            "connections": len(depths),
+            "queued_frames": sum(depths),
+            "max_queue_depth": max(depths) if depths else 0,
+            "queue_limit": self.max_queue,
+            "policy": self.policy,
+            "broadcasts": self.broadcasts,
+            "frames_sent": self.frames_sent,
+            "dropped_frames": self.dropped_total + sum(q.dropped for q in self.queues.values()),
+            "slow_disconnects": self.slow_disconnects,
+        }
@@ -1,8 +1,13 @@
+import logging
 from typing import Dict
 
 from .network_manager import NetworkManager
+from .transport import HEARTBEAT_INTERVAL, ClientConnection
 from ..user_manager import UserManager
 
+log = logging.getLogger(__name__)
+
+
 class Client:
     def __init__(self, network_manager: NetworkManager, user_manager: UserManager):
         self.player = {"id": None, "name": None, "password": None}
@@ -10,67 +15,177 @@ class Client:
         self.user_manager = user_manager
         self.is_connected = False
         self.current_network_id = None
+        # Токен сессии из последнего входа: повторный вход без проверки пароля
+        self.session_token = None
+        # Асинхронное подключение к удаленному серверу (TransportServer)
+        self.connection: ClientConnection = None
 
     def register_player(self, name: str, password: str) -> bool:
         user = self.user_manager.create_user(name, password)
 
         if user:
             self.player = user
-            print(f"Участник создан: {name} (ID: {user['id']})")
+            log.info("Участник создан: %s (ID: %s)", name, user['id'])
             return True
 
-        print("Ошибка создания участника")
+        log.warning("Ошибка создания участника")
         return False
 
     def login(self, name: str, password: str) -> bool:
         user = self.user_manager.authenticate_user(name, password)
         if user:
             self.player = user
-            print(f"Вход выполнен: {name} (ID: {user['id']})")
+            self.session_token = self.user_manager.open_session(user["id"])
+            log.info("Вход выполнен: %s (ID: %s)", name, user['id'])
             return True
-        print("Неверные данные для входа")
+        log.warning("Неверные данные для входа")
         return False
 
     def connect(self, network_id: int = None) -> bool:
         if not self.player["id"]:
-            print("Сначала войдите в систему")
+            log.info("Сначала войдите в систему")
             return False
             
         if self.is_connected:
-            print("Уже подключен к сети")
+            log.info("Уже подключен к сети")
             return False
 
-        info = self.network_manager.simulate_connection(self.player["id"])
+        # Оборванное подключение возобновляется, а не создается заново
+        info = self.network_manager.resume_connection(self.player["id"]) \
+            or self.network_manager.simulate_connection(self.player["id"])
         self.is_connected = True
-        self.current_network_id = network_id or 1
+        self.current_network_id = network_id or info["network_id"] or 1
+        self.network_manager.set_network(self.player["id"], self.current_network_id)
 
-        print(f"Участник {self.player['name']} присоединился к сети {self.current_network_id}")
-        print(f"Подключение: {info['ip']}:{info['port']}")
+        log.info("Участник %s присоединился к сети %s", self.player['name'], self.current_network_id)
+        log.info("Подключение: %s:%s", info['ip'], info['port'])
+        return True
+
+    def reconnect(self) -> bool:
+        """Возвращается по токену сессии: без пароля, с прежней сетью, за O(1)"""
+        user = self.user_manager.authenticate_token(self.session_token)
+        if not user:
+            log.info("Сессия не найдена или истекла, войдите заново")
+            self.session_token = None
+            return False
+
+        self.player = user
+        manager = self.network_manager
+        info = manager.resume_connection(user["id"]) or manager.get_connection_info(user["id"])
+        if info is None:
+            # Запись подключения уже забыта: подключаемся заново, без прежней сети
+            info = manager.simulate_connection(user["id"])
+        self.is_connected = True
+        self.current_network_id = info["network_id"]
+        log.info("Участник %s снова подключен (сеть %s)", user["name"], self.current_network_id)
         return True
 
     def disconnect(self) -> bool:
         if not self.is_connected:
-            print("Не подключен к сети")
+            log.info("Не подключен к сети")
             return False
         ok = self.network_manager.disconnect_user(self.player["id"])
         if ok:
             self.is_connected = False
             self.current_network_id = None
-            print(f"Участник {self.player['name']} вышел")
+            log.info("Участник %s вышел", self.player['name'])
             return True
-        print("Ошибка отключения")
+        log.warning("Ошибка отключения")
         return False
 
     def send_message_to_server(self, message: str) -> bool:
         if not self.is_connected:
-            print("Не подключен к серверу")
+            log.info("Не подключен к серверу")
             return False
-        print(f"Сообщение от {self.player['name']} серверу: {message}")
+        log.info("Сообщение от %s серверу: %s", self.player['name'], message)
         return True
 
     def receive_notification(self, message: str):
         if self.is_connected:
-            print(f"Уведомление для {self.player['name']}: {message}")
+            log.info("Уведомление для %s: %s", self.player['name'], message)
+
+    async def connect_remote(self, host: str, port: int, name: str, password: str, network_id: int = None,
+                             network_password: str = None) -> bool:
+        """Подключается к удаленному серверу по TCP, входит и при необходимости вступает в сеть"""
+        if self.connection is not None and self.connection.is_open:
+            log.info("Уже подключен к серверу")
+            return False
+
+        connection = ClientConnection(on_notify=self.receive_notification, heartbeat_interval=HEARTBEAT_INTERVAL)
+        try:
+            await connection.open(host, port)
+        except OSError as e:
+            log.warning("Не удалось подключиться к %s:%s: %s", host, port, e)
+            return False
+
+        ok, data = await connection.request("login", name=name, password=password)
+        if not ok:
+            log.warning("Ошибка входа: %s", data)
+            await connection.close()
+            return False
+
+        self.connection = connection
+        self.player = {"id": data["id"], "name": data["name"], "password": None}
+        self.session_token = data.get("token")
+        self.is_connected = True
+
+        if network_id is not None:
+            ok, data = await connection.request("join", network_id=network_id, password=network_password)
+            if not ok:
+                log.warning("Ошибка подключения к сети: %s", data)
+            else:
+                self.current_network_id = network_id
+
+        log.info("Участник %s подключен к серверу %s:%s", self.player['name'], host, port)
+        return True
+
+    async def reconnect_remote(self, host: str, port: int) -> bool:
+        """Переподключается к удаленному серверу по токену сессии, без проверки пароля"""
+        if self.session_token is None:
+            log.info("Нет токена сессии, войдите заново")
+            return False
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+        connection = ClientConnection(on_notify=self.receive_notification, heartbeat_interval=HEARTBEAT_INTERVAL)
+        try:
+            await connection.open(host, port)
+        except OSError as e:
+            log.warning("Не удалось подключиться к %s:%s: %s", host, port, e)
+            return False
+
+        ok, data = await connection.request("login_token", token=self.session_token)
+        if not ok:
+            log.warning("Ошибка входа по токену: %s", data)
+            self.session_token = None
+            await connection.close()
+            return False
+
+        self.connection = connection
+        self.session_token = data["token"]
+        self.is_connected = True
+        self.current_network_id = data.get("network_id")
+        log.info("Участник %s снова подключен к серверу %s:%s", self.player['name'], host, port)
+        return True
+
+    async def send_message_remote(self, message: str) -> bool:
+        if self.connection is None or not self.connection.is_open or self.current_network_id is None:
+            log.info("Не подключен к серверу")
+            return False
+        ok, _ = await self.connection.request("fire", network_id=self.current_network_id, message=message)
+        return ok
+
+    async def disconnect_remote(self) -> bool:
+        if self.connection is None:
+            log.info("Не подключен к серверу")
+            return False
+        await self.connection.close()
+        self.connection = None
+        self.is_connected = False
+        self.current_network_id = None
+        log.info("Участник %s вышел", self.player['name'])
+        return True
 
     def get_status(self) -> Dict:
         return {
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Callable, Dict, Hashable, List, Optional
+
+
+class NotificationCoalescer:
+    """Склеивает уведомления за короткое окно в одно обновление.
+
+    События копятся по ключу (id сети или комнаты) и уходят одним вызовом
+    flush_callback(key, messages, collapsed) по окончании окна window
+    (window=0 - в конце текущей итерации цикла событий). Если событий за
+    окно больше max_events, collapsed=True: получатели получают один
+    снимок состояния вместо списка сообщений.
+
+    Без запущенного цикла событий (например, в UI или demo) уведомления
+    отправляются сразу, как и раньше.
+    """
+
+    def __init__(self, flush_callback: Callable[[Hashable, List[str], bool], None],
+                 window: float = 0.0, max_events: int = 16):
+        self.flush_callback = flush_callback
+        self.window = window
+        self.max_events = max_events
+        self._pending: Dict[Hashable, List[str]] = {}
+        self._handle: Optional[asyncio.Handle] = None
+        self.events_in = 0
+        self.flushes_out = 0
+
+    def add(self, key: Hashable, message: str):
+        self.events_in += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flushes_out += 1
+            self.flush_callback(key, [message], False)
+            return
+
+        self._pending.setdefault(key, []).append(message)
+        if self._handle is None:
+            if self.window > 0:
+                self._handle = loop.call_later(self.window, self.flush)
+            else:
+                self._handle = loop.call_soon(self.flush)
+
+    def discard(self, key: Hashable):
+        self._pending.pop(key, None)
+
+    def flush(self):
+        """Отправляет все накопленные события"""
+        self._handle = None
+        pending, self._pending = self._pending, {}
+        for key, messages in pending.items():
+            self.flushes_out += 1
+            self.flush_callback(key, messages, len(messages) > self.max_events)
+
+    def get_stats(self) -> Dict:
+        return {
+            "window": self.window,
+            "max_events": self.max_events,
+            "events_in": self.events_in,
+            "flushes_out": self.flushes_out,
+            "pending_keys": len(self._pending),
+        }
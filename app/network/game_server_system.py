@@ -1,29 +1,147 @@
-from typing import Dict
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
 
+from ..archive import RecordArchive
+from ..metrics import MetricsRegistry, instrument
+from ..passwords import DEFAULT_COST, PasswordHasher
+from ..snapshot import SNAPSHOT_FILE, SnapshotStore
 from ..user_manager import UserManager
+from ..user_store import SQLiteUserStore
+from ..wal import WriteAheadLog
 from ..room_manager import RoomManager
+from ..game_manager import GameManager
 
 from ..network.client import Client
 from ..network.server import Server
 from ..network.network_manager import NetworkManager
 
+log = logging.getLogger(__name__)
+
 
 class GameServerSystem:
-    def __init__(self):
-        self.user_manager = UserManager()
-        self.network_manager = NetworkManager()
-        self.room_manager = RoomManager()
-        self.server = Server(self.network_manager, self.user_manager, self.game_manager)
+    def __init__(self, shard_index: int = 0, shard_count: int = 1, archive_dir: str = None,
+                 retention_ttl: float = None, retention_max: int = None, max_participants: int = 10,
+                 metrics: bool = True, snapshot_dir: str = None, snapshot_interval: float = None,
+                 wal: bool = False, user_db: str = None, password_cost: int = DEFAULT_COST,
+                 password_workers: int = None, idle_timeout: float = None, coalesce_window: float = None):
+        # Пользователи в файле SQLite (user_db) переживают перезапуск и без снимков;
+        # хеши паролей считаются в пуле из password_workers потоков
+        self.user_manager = UserManager(SQLiteUserStore(user_db) if user_db else None,
+                                        PasswordHasher(password_workers, password_cost))
+        # Подключения без heartbeat дольше idle_timeout секунд снимает reaper_loop
+        self.network_manager = NetworkManager(idle_timeout=idle_timeout)
+
+        # Архив закрытых комнат и завершенных игр (только если задан каталог)
+        room_archive = game_archive = None
+        if archive_dir:
+            room_archive = RecordArchive(os.path.join(archive_dir, "rooms.jsonl"), "id_room")
+            game_archive = RecordArchive(os.path.join(archive_dir, "games.jsonl"), "id_game")
+        self.room_manager = RoomManager(room_archive, retention_ttl, retention_max)
+        self.game_manager = GameManager(archive=game_archive, retention_ttl=retention_ttl, retention_max=retention_max)
+
+        # Склейка уведомлений сети за coalesce_window секунд (None - отправлять сразу)
+        self.server = Server(self.network_manager, self.user_manager, self.room_manager, coalesce_window)
+        self.server.max_participants = max_participants
+
+        # Шард выдает id сетей, комнат и игр вида shard_index + 1 + k * shard_count,
+        # поэтому шард-владелец любого id вычисляется как (id - 1) % shard_count
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        for owner, attr in ((self.server, "next_network_id"), (self.room_manager, "next_room_id"),
+                            (self.game_manager, "next_games_id")):
+            setattr(owner, attr, shard_index + 1)
+            owner.id_step = shard_count
+
+        # Снимки состояния: восстановление при старте, сохранение по расписанию
+        # (snapshot_loop) и при shutdown_system. Журнал изменений (wal) хранится
+        # рядом со снимком и проигрывается поверх него
+        self.snapshots: Optional[SnapshotStore] = None
+        self.journal: Optional[WriteAheadLog] = None
+        self.snapshot_interval = snapshot_interval
+        if wal and not snapshot_dir:
+            raise ValueError("Журнал изменений (wal) требует каталог снимков snapshot_dir")
+        if snapshot_dir:
+            if wal:
+                self.journal = WriteAheadLog(os.path.join(snapshot_dir, "wal"))
+            self.snapshots = SnapshotStore(os.path.join(snapshot_dir, SNAPSHOT_FILE), self.journal)
+            self.snapshots.load(self)
+            # Журнал подключается после повтора, иначе повтор записался бы заново
+            for manager in (self.user_manager, self.room_manager, self.game_manager):
+                manager.journal = self.journal
+
+        # Метрики: время и число вызовов всех публичных методов менеджеров и сервера.
+        # Датчики берут исходные методы до установки оберток, чтобы чтение
+        # метрик не попадало в статистику вызовов
+        self.metrics = MetricsRegistry()
+        for name, func in (("users", self.user_manager.count_users),
+                           ("active_connections", lambda: len(self.network_manager.active_connections)),
+                           ("active_networks", lambda: len(self.server.active_networks)),
+                           ("active_rooms", self.room_manager.count_active_rooms),
+                           ("active_games", self.game_manager.count_active_games)):
+            self.metrics.gauge(name, func=func)
+        network_manager = self.network_manager
+        self.metrics.gauge("reaped_connections", "Подключений, снятых по тайм-ауту",
+                           func=lambda: network_manager.reaped)
+        if self.journal is not None:
+            journal = self.journal
+            self.metrics.gauge("journal_entries", "Записей в журнале с запуска", func=lambda: journal.appended)
+            self.metrics.gauge("journal_fsyncs", "Групп записей, сброшенных на диск", func=lambda: journal.batches)
+        store = self.user_manager.store
+        if isinstance(store, SQLiteUserStore):
+            self.metrics.gauge("user_cache_hits", "Поиски пользователей, обслуженные кэшем", func=lambda: store.hits)
+            self.metrics.gauge("user_cache_misses", "Поиски пользователей в базе", func=lambda: store.misses)
+            self.metrics.gauge("user_db_batches", "Транзакций вставки пользователей", func=lambda: store.batches)
+        if metrics:
+            for component, obj in (("user_manager", self.user_manager), ("room_manager", self.room_manager),
+                                   ("game_manager", self.game_manager), ("server", self.server),
+                                   ("network_manager", self.network_manager)):
+                instrument(obj, self.metrics, component)
+
+    async def snapshot_loop(self):
+        """Сохраняет снимок состояния каждые snapshot_interval секунд (если снимки включены)"""
+        if self.snapshots is None or not self.snapshot_interval:
+            return
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.snapshots.save_async(self)
+            except OSError:
+                log.exception("Не удалось сохранить снимок состояния")
+
+    async def reaper_loop(self):
+        """Каждый тик снимает неактивные подключения: участники выходят из сетей и комнат.
+
+        Заодно переносит в архив закрытые комнаты и завершенные игры с истекшим
+        retention_ttl - иначе они ждали бы следующего закрытия.
+        """
+        while True:
+            await asyncio.sleep(self.network_manager.tick)
+            try:
+                self.room_manager.archive_closed_rooms()
+                self.game_manager.archive_ended_games()
+            except OSError:
+                log.exception("Не удалось дописать архив")
+            if self.server.reap_idle() and self.journal is not None:
+                # Выход из комнат попадает в журнал, как и по запросу клиента
+                try:
+                    await self.journal.sync()
+                except OSError:
+                    log.exception("Не удалось сбросить журнал на диск")
 
     def create_client(self) -> Client:
         return Client(self.network_manager, self.user_manager)
 
     def get_system_status(self) -> Dict:
         return {
-            "users_count": len(self.user_manager.list_users()),
+            "users_count": self.user_manager.count_users(),
             "active_connections": len(self.network_manager.active_connections),
             "active_networks": len(self.server.active_networks),
-            "active_rooms": len(self.room_manager.get_active_rooms()),
+            "active_rooms": self.room_manager.count_active_rooms(),
+            "broadcast": self.server.transport.broadcaster.get_stats() if self.server.transport else None,
+            "coalescing": self.server.coalescer.get_stats() if self.server.coalescer else None,
+            "metrics": self.metrics.snapshot(),
             "server_info": {
                 "networks": self.server.list_active_networks(),
                 "rooms": self.room_manager.get_active_rooms(),
@@ -31,13 +149,25 @@ class GameServerSystem:
         }
 
     def shutdown_system(self):
-        print("Система безопасно отключается...")
+        log.info("Система безопасно отключается...")
+
+        if self.snapshots is not None:
+            self.snapshots.save(self)
 
         for nid in list(self.server.active_networks.keys()):
             net = self.server.active_networks[nid]
             self.server.close_server(nid, net["owner_id"])
-            
-        for room in list(self.room_manager.get_active_rooms()):
-            self.room_manager.room_end(room["id_room"], room["owner_id"])
-            
-        print("Система отключена")
\ No newline at end of file
+
+        # Со снимками комнаты продолжат работу после перезапуска, их не закрываем
+        if self.snapshots is None:
+            for room in list(self.room_manager.get_active_rooms()):
+                self.room_manager.room_end(room["id_room"], room["owner_id"])
+
+        for archive in (self.room_manager.archive, self.game_manager.archive):
+            if archive is not None:
+                archive.close()
+        self.user_manager.close()
+        if self.journal is not None:
+            self.journal.close()
+
+        log.info("Система отключена")
\ No newline at end of file
@@ -1,31 +1,216 @@
-from typing import Optional, Dict
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Dict, List
 from datetime import datetime
 
+# Сколько секунд оборванное подключение можно возобновить (как срок токена сессии)
+RESUME_WINDOW = 300.0
+# Шаг колеса таймеров простоя, секунд
+IDLE_TICK = 1.0
+
+
 class NetworkManager:
-    def __init__(self):
+    """Подключения пользователей.
+
+    Если задан idle_timeout, подключение без heartbeat дольше idle_timeout
+    секунд снимается reap_idle. Сроки хранятся в колесе таймеров: ячейка
+    на каждый тик, подключение лежит в ячейке тика, когда истечет его срок.
+    heartbeat только запоминает время и колесо не трогает; подключение,
+    которое за это время подавало признаки жизни, при разборе ячейки
+    переносится в ячейку своего нового срока. Поэтому тик стоит O(1) плюс
+    число подключений в его ячейке, а каждое живое подключение
+    разбирается не чаще раза за idle_timeout.
+    """
+
+    def __init__(self, resume_window: float = RESUME_WINDOW, idle_timeout: float = None, tick: float = IDLE_TICK):
         self.active_connections: Dict[int, Dict] = {}  # user_id -> info
         self.connection_counter = 0
+        # Оборванные подключения: user_id -> info в порядке обрыва. Запись
+        # возвращается в active_connections целиком (с сетью и комнатой)
+        self.suspended: "OrderedDict[int, Dict]" = OrderedDict()
+        self.resume_window = resume_window
+        # Вызывается с записью оборванного подключения, которое заменяет новое
+        # (срок возобновления истек): Server освобождает сеть и комнату из нее
+        self.on_release: Optional[Callable[[Dict], None]] = None
+        # Колесо таймеров простоя (пустое - тайм-аут выключен)
+        self.idle_timeout: Optional[float] = None
+        self.tick = tick
+        self._wheel: List[List[Dict]] = []
+        self._tick_no = 0
+        self.reaped = 0
+        if idle_timeout is not None:
+            self.enable_idle_timeout(idle_timeout, tick)
 
-    def simulate_connection(self, user_id: int) -> Dict:
+    def enable_idle_timeout(self, idle_timeout: float, tick: float = IDLE_TICK):
+        """Включает снятие подключений без heartbeat дольше idle_timeout секунд"""
+        self.idle_timeout = idle_timeout
+        self.tick = tick
+        # Срок любого подключения не дальше idle_timeout / tick + 2 тиков от текущего
+        self._wheel = [[] for _ in range(int(idle_timeout / tick) + 3)]
+        self._tick_no = int(time.monotonic() / tick)
+        for info in self.active_connections.values():
+            self._schedule(info)
+
+    def _schedule(self, info: Dict):
+        # Первый тик, к которому срок уже прошел. Тик запоминается в записи:
+        # копии записи, оставшиеся в прежних ячейках, при разборе пропускаются
+        due = max(int((info["last_seen"] + self.idle_timeout) / self.tick) + 1, self._tick_no + 1)
+        self._wheel[due % len(self._wheel)].append(info)
+        info["timer"] = due
+
+    def _new_connection(self, user_id: int, ip: str, port: int) -> Dict:
         self.connection_counter += 1
-        
+
         info = {
             "connection_id": self.connection_counter,
             "user_id": user_id,
             "status": "connected",
             "connected_at": datetime.now().strftime("%H:%M:%S"),
-            "ip": f"192.168.1.{user_id}",
-            "port": 8080 + user_id,
+            "ip": ip,
+            "port": port,
+            # Где пользователь состоит: восстанавливается при возобновлении подключения
+            "network_id": None,
+            "room_id": None,
+            "last_seen": time.monotonic(),
         }
+        if self.suspended:
+            stale = self.suspended.pop(user_id, None)
+            if stale is not None and self.on_release is not None:
+                self.on_release(stale)
         self.active_connections[user_id] = info
+        if self._wheel:
+            self._schedule(info)
 
         return info
 
+    def simulate_connection(self, user_id: int) -> Dict:
+        return self._new_connection(user_id, f"192.168.1.{user_id}", 8080 + user_id)
+
+    def register_connection(self, user_id: int, ip: str, port: int) -> Dict:
+        """Регистрирует реальное сетевое подключение пользователя"""
+        return self._new_connection(user_id, ip, port)
+
+    def heartbeat(self, user_id: int) -> bool:
+        """Отмечает, что подключение живо; False, если пользователь не подключен"""
+        info = self.active_connections.get(user_id)
+        if info is None:
+            return False
+        info["last_seen"] = time.monotonic()
+        return True
+
+    def suspend_connection(self, user_id: int) -> bool:
+        """Подключение оборвалось: запись сохраняется на resume_window секунд.
+
+        Истекшие записи снимает reap_idle (или purge_suspended) - вызывающий
+        освобождает сеть и комнату пользователя.
+        """
+        info = self.active_connections.pop(user_id, None)
+        if info is None:
+            return False
+        info["status"] = "suspended"
+        info["suspended_at"] = time.monotonic()
+        info["timer"] = None
+        self.suspended[user_id] = info
+        return True
+
+    def resume_connection(self, user_id: int, ip: str = None, port: int = None) -> Optional[Dict]:
+        """Возвращает оборванное подключение в active_connections; None, если возобновлять нечего.
+
+        Истекшая запись не возобновляется, но и не теряется: ее сеть и комната
+        освобождаются через on_release (как при purge_suspended).
+        """
+        info = self.suspended.pop(user_id, None)
+        if info is None:
+            return None
+        if info.pop("suspended_at") + self.resume_window <= time.monotonic():
+            if self.on_release is not None:
+                self.on_release(info)
+            return None
+        info["status"] = "connected"
+        info["last_seen"] = time.monotonic()
+        if ip is not None:
+            info["ip"], info["port"] = ip, port
+        self.active_connections[user_id] = info
+        if self._wheel:
+            self._schedule(info)
+        return info
+
+    def purge_suspended(self, now: float = None) -> List[Dict]:
+        """Забывает оборванные подключения старше resume_window; возвращает их записи"""
+        deadline = (time.monotonic() if now is None else now) - self.resume_window
+        suspended = self.suspended
+        removed = []
+        while suspended:
+            info = next(iter(suspended.values()))
+            if info["suspended_at"] > deadline:
+                break
+            suspended.popitem(last=False)
+            removed.append(info)
+        return removed
+
+    def reap_idle(self, now: float = None) -> List[Dict]:
+        """Снимает подключения без heartbeat дольше idle_timeout и истекшие оборванные.
+
+        Возвращает снятые записи: по network_id и room_id вызывающий
+        освобождает место пользователя в сети и комнате.
+        """
+        now = time.monotonic() if now is None else now
+        reaped = self.purge_suspended(now)
+        wheel = self._wheel
+        if wheel:
+            active = self.active_connections
+            deadline = now - self.idle_timeout
+            target = int(now / self.tick)
+            # После долгой паузы хватает одного оборота: все ячейки будут разобраны
+            self._tick_no = max(self._tick_no, target - len(wheel))
+            size = len(wheel)
+            while self._tick_no < target:
+                self._tick_no += 1
+                tick_no = self._tick_no
+                slot = tick_no % size
+                bucket = wheel[slot]
+                if not bucket:
+                    continue
+                wheel[slot] = []
+                for info in bucket:
+                    # Копия из прежней ячейки или запись уже отключенного пользователя
+                    due = info["timer"]
+                    if due is None or due % size != slot or active.get(info["user_id"]) is not info:
+                        continue
+                    if due > tick_no:
+                        # Поставлена больше чем на оборот вперед (reap_idle долго не вызывался)
+                        wheel[slot].append(info)
+                        continue
+                    if info["last_seen"] > deadline:
+                        self._schedule(info)
+                        continue
+                    info["timer"] = None
+                    info["status"] = "idle"
+                    del active[info["user_id"]]
+                    reaped.append(info)
+        self.reaped += len(reaped)
+        return reaped
+
+    def set_network(self, user_id: int, network_id: Optional[int]):
+        """Запоминает сеть пользователя в записи подключения"""
+        info = self.active_connections.get(user_id)
+        if info is not None:
+            info["network_id"] = network_id
+
+    def set_room(self, user_id: int, room_id: Optional[int]):
+        """Запоминает комнату пользователя в записи подключения"""
+        info = self.active_connections.get(user_id)
+        if info is not None:
+            info["room_id"] = room_id
+
     def disconnect_user(self, user_id: int) -> bool:
+        # Запись в колесе таймеров остается и пропускается при разборе ячейки
+        if self.suspended:
+            self.suspended.pop(user_id, None)
         return self.active_connections.pop(user_id, None) is not None
 
     def is_user_connected(self, user_id: int) -> bool:
         return user_id in self.active_connections
 
     def get_connection_info(self, user_id: int) -> Optional[Dict]:
-        return self.active_connections.get(user_id)
\ No newline at end of file
+        return self.active_connections.get(user_id)
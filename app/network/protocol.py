@@ -0,0 +1,404 @@
+"""Компактный бинарный протокол сообщений клиент-сервер.
+
+Сообщение: байт версии, байт типа и поля по схеме типа. Идентификаторы
+передаются как целые фиксированной ширины, статусы и тип доступа -
+как индексы в таблицах интернированных строк. Записи комнат, игр и
+сетей в ответах кодируются собственными схемами без имен полей.
+
+Старый текстовый формат (JSON) по-прежнему поддерживается: первый байт
+JSON-сообщения всегда '{', поэтому формат определяется автоматически.
+"""
+
+import json
+import struct
+from collections.abc import Mapping
+from typing import Dict, List, Tuple
+
+PROTOCOL_VERSION = 1
+
+CODEC_BINARY = "binary"
+CODEC_JSON = "json"
+
+
+class ProtocolError(ValueError):
+    """Сообщение не соответствует протоколу"""
+
+
+# Интернированные строки: значение передается одним байтом-индексом
+STATUSES = ("waiting", "started", "closed", "active", "ended", "connected")
+ACCESS_TYPES = ("public", "private")
+
+_U8 = struct.Struct(">B")
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_U64 = struct.Struct(">Q")
+_I64 = struct.Struct(">q")
+_F64 = struct.Struct(">d")
+_HEADER = struct.Struct(">BB")
+
+_NONE_STR = 0xFFFF
+# Наибольшая вложенность списков, словарей и записей в значении: глубже -
+# ProtocolError, а не RecursionError на кадре клиента
+MAX_VALUE_DEPTH = 32
+
+# Типы сообщений: op -> (код, схема полей). Поле "id" - номер запроса.
+MESSAGE_TYPES: Dict[str, Tuple[int, Tuple[Tuple[str, str], ...]]] = {
+    "login": (1, (("id", "u32"), ("name", "str"), ("password", "optstr"))),
+    "result": (2, (("id", "optu32"), ("ok", "bool"), ("data", "value"))),
+    "notify": (3, (("message", "text"),)),
+    "ping": (4, (("id", "u32"),)),
+    "create_server": (5, (("id", "u32"), ("name", "str"), ("password", "optstr"))),
+    "close_server": (6, (("id", "u32"), ("network_id", "u32"))),
+    "join": (7, (("id", "u32"), ("network_id", "u32"), ("password", "optstr"))),
+    "leave": (8, (("id", "u32"), ("network_id", "u32"))),
+    "fire": (9, (("id", "u32"), ("network_id", "u32"), ("message", "text"))),
+    "room_join": (10, (("id", "u32"), ("room_id", "u32"), ("password", "optstr"))),
+    "room_leave": (11, (("id", "u32"), ("room_id", "u32"))),
+    "start_game": (12, (("id", "u32"), ("room_id", "u32"))),
+    "close_game": (13, (("id", "u32"), ("game_id", "u32"))),
+    "notify_batch": (14, (("network_id", "u32"), ("messages", "value"))),
+    "state": (15, (("network_id", "u32"), ("events", "u32"), ("data", "value"))),
+    "register": (16, (("id", "u32"), ("name", "str"), ("password", "optstr"))),
+    "room_create": (17, (("id", "u32"), ("access", "access"), ("password", "optstr"),
+                         ("maxplayers", "u16"), ("name", "optstr"))),
+    "list_rooms": (18, (("id", "u32"),)),
+    "login_token": (19, (("id", "u32"), ("token", "str"))),
+    "register_hashed": (20, (("id", "u32"), ("name", "str"), ("password_hash", "str"))),
+    # Признак жизни подключения: без номера запроса, сервер не отвечает
+    "heartbeat": (21, ()),
+    # Вход служебного подключения роутера шардов по ключу, выданному при запуске шарда
+    "admin_login": (22, (("id", "u32"), ("key", "str"))),
+    # Токен сессии пользователя для роутера (пароль уже проверил другой шард)
+    "session_token": (23, (("id", "u32"), ("user_id", "u32"))),
+}
+
+# Схемы записей: (поле, тип, обязательно ли поле)
+ROOM_SCHEMA = (
+    ("id_room", "u32", True),
+    ("owner_id", "u32", True),
+    ("access", "access", True),
+    ("password", "optstr", False),
+    ("maxplayers", "u16", True),
+    ("name", "str", True),
+    ("participants_id", "ids", True),
+    ("status", "status", True),
+    ("created_at", "str", True),
+)
+GAME_SCHEMA = (
+    ("id_game", "u32", True),
+    ("room_id", "u32", True),
+    ("owner_id", "u32", True),
+    ("participants_id", "ids", True),
+    ("created_at", "str", True),
+    ("status", "status", True),
+    ("seed", "u64", False),
+    ("ended_at", "str", False),
+)
+NETWORK_SCHEMA = (
+    ("id", "u32", True),
+    ("name", "str", True),
+    ("owner_id", "u32", True),
+    ("participants_id", "ids", True),
+    ("status", "status", True),
+    ("created_at", "str", True),
+    ("max_participants", "u16", True),
+)
+
+# Теги значений произвольного вида (поле "value")
+TAG_NONE, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STR, TAG_LIST, TAG_DICT = range(8)
+TAG_ROOM, TAG_GAME, TAG_NETWORK = 8, 9, 10
+_RECORD_SCHEMAS = ((TAG_ROOM, ROOM_SCHEMA), (TAG_GAME, GAME_SCHEMA), (TAG_NETWORK, NETWORK_SCHEMA))
+
+
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+_ACCESS_CODES = {access: code for code, access in enumerate(ACCESS_TYPES)}
+
+
+def _write_str(out: bytearray, value: str):
+    data = value.encode("utf-8")
+    if len(data) >= _NONE_STR:
+        raise ProtocolError("Строка слишком длинная")
+    out += _U16.pack(len(data))
+    out += data
+
+
+def _write_text(out: bytearray, value: str):
+    data = value.encode("utf-8")
+    out += _U32.pack(len(data))
+    out += data
+
+
+def _write_optstr(out: bytearray, value):
+    if value is None:
+        out += _U16.pack(_NONE_STR)
+    else:
+        _write_str(out, value)
+
+
+def _write_optu32(out: bytearray, value):
+    if value is None:
+        out += b"\x00"
+    else:
+        out += b"\x01" + _U32.pack(value)
+
+
+def _write_ids(out: bytearray, value):
+    out += _U16.pack(len(value))
+    out += struct.pack(f">{len(value)}I", *value)
+
+
+# Запись полей: тип поля -> функция(out, value)
+_WRITERS = {
+    "u32": lambda out, v: out.extend(_U32.pack(v)),
+    "u16": lambda out, v: out.extend(_U16.pack(v)),
+    "u64": lambda out, v: out.extend(_U64.pack(v)),
+    "bool": lambda out, v: out.extend(b"\x01" if v else b"\x00"),
+    "str": _write_str,
+    "text": _write_text,
+    "optstr": _write_optstr,
+    "optu32": _write_optu32,
+    "status": lambda out, v: out.extend(_U8.pack(_STATUS_CODES[v])),
+    "access": lambda out, v: out.extend(_U8.pack(_ACCESS_CODES[v])),
+    "ids": _write_ids,
+    "value": lambda out, v: _write_value(out, v),
+}
+
+
+def _compile(schema) -> Tuple:
+    """Заменяет имена типов полей на функции записи/чтения"""
+    return tuple((field, _WRITERS[kind], _READERS[kind], req) for field, kind, req in schema)
+
+
+def _try_write_record(out: bytearray, value: Dict) -> bool:
+    keys = value.keys()
+    for tag, compiled, required, allowed in _RECORDS:
+        if not (required <= keys and keys <= allowed):
+            continue
+        chunk = bytearray(_U8.pack(tag))
+        present = 0
+        optional_bit = 1
+        for field, _, _, req in compiled:
+            if not req:
+                if field in value:
+                    present |= optional_bit
+                optional_bit <<= 1
+        chunk += _U8.pack(present)
+        try:
+            for field, write, _, req in compiled:
+                if req or field in value:
+                    write(chunk, value[field])
+        except (struct.error, ValueError, TypeError, KeyError):
+            # Значения не укладываются в схему (например, None вместо id)
+            continue
+        out += chunk
+        return True
+    return False
+
+
+def _write_value(out: bytearray, value):
+    if value is None:
+        out += _U8.pack(TAG_NONE)
+    elif value is True:
+        out += _U8.pack(TAG_TRUE)
+    elif value is False:
+        out += _U8.pack(TAG_FALSE)
+    elif isinstance(value, int):
+        out += _U8.pack(TAG_INT) + _I64.pack(value)
+    elif isinstance(value, float):
+        out += _U8.pack(TAG_FLOAT) + _F64.pack(value)
+    elif isinstance(value, str):
+        out += _U8.pack(TAG_STR)
+        _write_text(out, value)
+    elif isinstance(value, (list, tuple)):
+        out += _U8.pack(TAG_LIST) + _U32.pack(len(value))
+        for item in value:
+            _write_value(out, item)
+    elif isinstance(value, dict):
+        if _try_write_record(out, value):
+            return
+        out += _U8.pack(TAG_DICT) + _U32.pack(len(value))
+        for key, item in value.items():
+            _write_str(out, str(key))
+            _write_value(out, item)
+    elif isinstance(value, Mapping):
+        # Записи менеджеров (app.records) уходят как обычные словари
+        _write_value(out, dict(value))
+    else:
+        raise ProtocolError(f"Неподдерживаемый тип значения: {type(value).__name__}")
+
+
+class _Reader:
+    __slots__ = ("buf", "pos", "depth")
+
+    def __init__(self, buf: bytes, pos: int = 0):
+        self.buf = buf
+        self.pos = pos
+        self.depth = 0
+
+    def unpack(self, fmt: struct.Struct):
+        value = fmt.unpack_from(self.buf, self.pos)[0]
+        self.pos += fmt.size
+        return value
+
+    def read_bytes(self, length: int) -> bytes:
+        end = self.pos + length
+        if end > len(self.buf):
+            raise ProtocolError("Сообщение обрезано")
+        data = self.buf[self.pos:end]
+        self.pos = end
+        return data
+
+    def read_str(self) -> str:
+        return self.read_bytes(self.unpack(_U16)).decode("utf-8")
+
+    def read_text(self) -> str:
+        return self.read_bytes(self.unpack(_U32)).decode("utf-8")
+
+    def read_optstr(self):
+        length = self.unpack(_U16)
+        if length == _NONE_STR:
+            return None
+        return self.read_bytes(length).decode("utf-8")
+
+    def read_optu32(self):
+        return self.unpack(_U32) if self.unpack(_U8) else None
+
+    def read_ids(self) -> List[int]:
+        count = self.unpack(_U16)
+        values = list(struct.unpack_from(f">{count}I", self.buf, self.pos))
+        self.pos += 4 * count
+        return values
+
+    def read_value(self):
+        tag = self.unpack(_U8)
+        if tag == TAG_NONE:
+            return None
+        if tag == TAG_TRUE:
+            return True
+        if tag == TAG_FALSE:
+            return False
+        if tag == TAG_INT:
+            return self.unpack(_I64)
+        if tag == TAG_FLOAT:
+            return self.unpack(_F64)
+        if tag == TAG_STR:
+            return self.read_text()
+        if self.depth >= MAX_VALUE_DEPTH:
+            raise ProtocolError(f"Вложенность значения больше {MAX_VALUE_DEPTH}")
+        self.depth += 1
+        try:
+            return self._read_container(tag)
+        finally:
+            self.depth -= 1
+
+    def _read_container(self, tag: int):
+        if tag == TAG_LIST:
+            return [self.read_value() for _ in range(self.unpack(_U32))]
+        if tag == TAG_DICT:
+            count = self.unpack(_U32)
+            result = {}
+            for _ in range(count):
+                key = self.read_str()
+                result[key] = self.read_value()
+            return result
+        compiled = _RECORDS_BY_TAG.get(tag)
+        if compiled is None:
+            raise ProtocolError(f"Неизвестный тег значения: {tag}")
+        present = self.unpack(_U8)
+        record = {}
+        optional_bit = 1
+        for field, _, read, req in compiled:
+            if not req:
+                has_field = present & optional_bit
+                optional_bit <<= 1
+                if not has_field:
+                    continue
+            record[field] = read(self)
+        return record
+
+
+# Чтение полей: тип поля -> функция(reader)
+_READERS = {
+    "u32": lambda r: r.unpack(_U32),
+    "u16": lambda r: r.unpack(_U16),
+    "u64": lambda r: r.unpack(_U64),
+    "bool": lambda r: r.unpack(_U8) != 0,
+    "str": _Reader.read_str,
+    "text": _Reader.read_text,
+    "optstr": _Reader.read_optstr,
+    "optu32": _Reader.read_optu32,
+    "status": lambda r: STATUSES[r.unpack(_U8)],
+    "access": lambda r: ACCESS_TYPES[r.unpack(_U8)],
+    "ids": _Reader.read_ids,
+    "value": _Reader.read_value,
+}
+
+_RECORDS = [
+    (tag, _compile(schema), frozenset(f for f, _, req in schema if req), frozenset(f for f, _, _ in schema))
+    for tag, schema in _RECORD_SCHEMAS
+]
+_RECORDS_BY_TAG = {tag: compiled for tag, compiled, _, _ in _RECORDS}
+_MESSAGES = {op: (code, _compile((field, kind, True) for field, kind in fields))
+             for op, (code, fields) in MESSAGE_TYPES.items()}
+_MESSAGES_BY_CODE = {code: (op, compiled) for op, (code, compiled) in _MESSAGES.items()}
+
+
+def encode_binary(message: Dict) -> bytes:
+    op = message.get("op")
+    entry = _MESSAGES.get(op)
+    if entry is None:
+        raise ProtocolError(f"Неизвестный тип сообщения: {op}")
+    code, compiled = entry
+    out = bytearray(_HEADER.pack(PROTOCOL_VERSION, code))
+    try:
+        for field, write, _, _ in compiled:
+            write(out, message.get(field))
+    except (struct.error, TypeError, ValueError, KeyError) as e:
+        raise ProtocolError(f"Поле сообщения {op} не соответствует схеме: {e}") from e
+    return bytes(out)
+
+
+def decode_binary(payload: bytes) -> Dict:
+    if len(payload) < _HEADER.size:
+        raise ProtocolError("Сообщение обрезано")
+    version, code = _HEADER.unpack_from(payload, 0)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Неподдерживаемая версия протокола: {version}")
+    entry = _MESSAGES_BY_CODE.get(code)
+    if entry is None:
+        raise ProtocolError(f"Неизвестный код сообщения: {code}")
+    op, compiled = entry
+    reader = _Reader(payload, _HEADER.size)
+    message = {"op": op}
+    try:
+        for field, _, read, _ in compiled:
+            message[field] = read(reader)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ProtocolError(f"Повреждено сообщение {op}: {e}") from e
+    return message
+
+
+def _json_default(value):
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Неподдерживаемый тип значения: {type(value).__name__}")
+
+
+def detect_codec(payload: bytes) -> str:
+    return CODEC_JSON if payload[:1] == b"{" else CODEC_BINARY
+
+
+def encode_message(message: Dict, codec: str = CODEC_BINARY) -> bytes:
+    if codec == CODEC_JSON:
+        return json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+    return encode_binary(message)
+
+
+def decode_message(payload: bytes) -> Dict:
+    """Декодирует сообщение, определяя формат по первому байту"""
+    if detect_codec(payload) == CODEC_JSON:
+        try:
+            return json.loads(payload)
+        except RecursionError as e:
+            raise ProtocolError("Слишком глубокая вложенность JSON") from e
+    return decode_binary(payload)
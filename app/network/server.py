@@ -1,113 +1,212 @@
-from datetime import datetime
-from typing import Dict, Optional, List
+import logging
+from typing import Dict, Iterable, Optional, List, Tuple
 
+from ..log import fields
+from ..records import NETWORK_CLOSED, ROOM_CLOSED, NetworkRecord
 from ..room_manager import RoomManager
 from ..user_manager import UserManager
+from .coalescer import NotificationCoalescer
 from .network_manager import NetworkManager
 
+log = logging.getLogger(__name__)
+
+
 class Server:
-    def __init__(self, network_manager: NetworkManager, user_manager: UserManager, room_manager: RoomManager):
+    def __init__(self, network_manager: NetworkManager, user_manager: UserManager, room_manager: RoomManager,
+                 coalesce_window: float = None, coalesce_max_events: int = 16):
         self.network_manager = network_manager
         self.user_manager = user_manager
         self.room_manager = room_manager
-        self.active_networks: Dict[int, Dict] = {}
+        self.active_networks: Dict[int, NetworkRecord] = {}
         self.next_network_id = 1
+        # Шаг выдачи id (при шардировании у каждого шарда свой остаток по модулю)
+        self.id_step = 1
+        # Лимит участников новой сети
+        self.max_participants = 10
+        # Сетевой транспорт (TransportServer); без него уведомления только логируются
+        self.transport = None
+        # Склейка уведомлений сети за окно coalesce_window (None - отправлять сразу)
+        self.coalescer: Optional[NotificationCoalescer] = None
+        if coalesce_window is not None:
+            self.enable_coalescing(coalesce_window, coalesce_max_events)
+        # Оборванное подключение, замененное новым: освобождаем сеть и комнату,
+        # но не закрываем TCP-подключение - оно уже новое
+        network_manager.on_release = lambda info: self._release(info, close=False)
+
+    def attach_transport(self, transport):
+        self.transport = transport
 
-    def create_server(self, owner_id: int, name: str = "Новая сеть", password: str = None) -> Optional[Dict]:
+    def enable_coalescing(self, window: float = 0.0, max_events: int = 16):
+        """Включает склейку уведомлений: window=0 - одна рассылка на итерацию цикла событий"""
+        self.coalescer = NotificationCoalescer(self._deliver_notifications, window, max_events)
+
+    def create_server(self, owner_id: int, name: str = "Новая сеть", password: str = None) -> Optional[NetworkRecord]:
         owner = self.user_manager.get_user(owner_id)
         if not owner:
-            print("Владелец не найден")
+            log.info("Владелец не найден: %s", owner_id)
             return None
-        network = {
-            "id": self.next_network_id,
-            "name": name,
-            "owner_id": owner_id,
-            "participants_id": [owner_id],
-            "password": password,
-            "status": "active",
-            "created_at": datetime.now().strftime("%H:%M:%S"),
-            "max_participants": 10,
-        }
-        self.active_networks[self.next_network_id] = network
-        self.next_network_id += 1
-        print(f"Новая сеть создана: {name} (ID: {network['id']})")
+        network = NetworkRecord(self.next_network_id, name, owner_id, password, self.max_participants)
+        self.active_networks[network.id] = network
+        self.next_network_id += self.id_step
+        self.network_manager.set_network(owner_id, network.id)
+        log.info("Новая сеть создана: %s (ID: %s)", name, network.id,
+                 extra=fields(network_id=network.id, user_id=owner_id))
         return network
 
     def close_server(self, network_id: int, user_id: int) -> bool:
         if network_id not in self.active_networks:
-            print("Сеть не найдена")
+            log.info("Сеть не найдена: %s", network_id)
             return False
         network = self.active_networks[network_id]
-        if network["owner_id"] != user_id:
-            print("Только владелец может закрыть сеть")
+        if network.owner_id != user_id:
+            log.info("Только владелец может закрыть сеть")
             return False
-        for pid in list(network["participants_id"]):
+        for pid in list(network.participants_id):
             self.network_manager.disconnect_user(pid)
-        network["status"] = "closed"
+        network.status_code = NETWORK_CLOSED
         del self.active_networks[network_id]
-        print(f"Сеть {network['name']} закрылась")
+        if self.coalescer is not None:
+            self.coalescer.discard(network_id)
+        log.info("Сеть %s закрылась", network.name, extra=fields(network_id=network_id))
         return True
 
     def add_participant(self, network_id: int, user_id: int, password: str = None) -> bool:
         if network_id not in self.active_networks:
-            print("Сеть не найдена")
+            log.info("Сеть не найдена: %s", network_id)
             return False
         network = self.active_networks[network_id]
-        if network["password"] and network["password"] != password:
-            print("Неверный пароль")
+        if network.password and network.password != password:
+            log.info("Неверный пароль")
             return False
-        if user_id in network["participants_id"]:
-            print("Пользователь уже в сети")
+        if user_id in network.participants_id:
+            log.info("Пользователь уже в сети")
             return False
-        if len(network["participants_id"]) >= network["max_participants"]:
-            print("Сеть переполнена")
+        if len(network.participants_id) >= network.max_participants:
+            log.info("Сеть переполнена")
             return False
-        network["participants_id"].append(user_id)
+        network.participants_id.append(user_id)
+        self.network_manager.set_network(user_id, network_id)
         user = self.user_manager.get_user(user_id)
         uname = user["name"] if user else f"User_{user_id}"
-        print(f"Пользователь {uname} присоединился к сети {network['name']}")
+        log.info("Пользователь %s присоединился к сети %s", uname, network.name,
+                 extra=fields(network_id=network_id, user_id=user_id))
         self.notify_all_participants(network_id, f"Пользователь {uname} присоединился")
         return True
 
     def remove_participant(self, network_id: int, user_id: int) -> bool:
         if network_id not in self.active_networks:
-            print("Сеть не найдена")
+            log.info("Сеть не найдена: %s", network_id)
             return False
         network = self.active_networks[network_id]
-        if user_id not in network["participants_id"]:
-            print("Пользователь не в сети")
+        if user_id not in network.participants_id:
+            log.info("Пользователь не в сети")
             return False
-        network["participants_id"].remove(user_id)
+        network.participants_id.remove(user_id)
         self.network_manager.disconnect_user(user_id)
         user = self.user_manager.get_user(user_id)
         uname = user["name"] if user else f"User_{user_id}"
-        print(f"Пользователь {uname} покинул сеть")
+        log.info("Пользователь %s покинул сеть", uname, extra=fields(network_id=network_id, user_id=user_id))
         self.notify_all_participants(network_id, f"Пользователь {uname} покинул сеть")
         return True
 
-    def fireserver(self, user_id: int, network_id: int, message: str = ""):
-        if network_id in self.active_networks and user_id in self.active_networks[network_id]["participants_id"]:
-            user = self.user_manager.get_user(user_id)
-            uname = user["name"] if user else f"User_{user_id}"
-            print(f"Сервер получил сообщение от {uname} в сети {network_id}: {message}")
-        else:
-            print("Недействительное подключение")
+    def reap_idle(self, now: float = None) -> int:
+        """Снимает подключения без heartbeat и оборванные, которые не возобновили вовремя.
+
+        Пользователь покидает сеть и комнату из записи подключения (владелец
+        комнаты остается в ней), оставшееся TCP-подключение закрывается.
+        Возвращает число снятых подключений.
+        """
+        reaped = self.network_manager.reap_idle(now)
+        for info in reaped:
+            self._release(info)
+        if reaped:
+            log.info("Снято неактивных подключений: %s", len(reaped))
+        return len(reaped)
+
+    def _release(self, info: Dict, close: bool = True):
+        user_id = info["user_id"]
+        if close and self.transport is not None:
+            self.transport.close_user(user_id)
+        network = self.active_networks.get(info["network_id"])
+        if network is not None and user_id in network.participants_id:
+            self.remove_participant(network.id, user_id)
+        room = self.room_manager.get_room_by_id(info["room_id"])
+        if room is not None and user_id in room.participants_id and user_id != room.owner_id:
+            self.room_manager.room_leave(room.id_room, user_id)
+        log.debug("Подключение пользователя %s снято (%s)", user_id, info["status"],
+                 extra=fields(network_id=info["network_id"], user_id=user_id))
+
+    def membership(self, user_id: int) -> Tuple[Optional[int], Optional[int]]:
+        """Сеть и комната из записи подключения пользователя, если он все еще в них состоит"""
+        info = self.network_manager.get_connection_info(user_id)
+        if info is None:
+            return None, None
+        network = self.active_networks.get(info["network_id"])
+        network_id = network.id if network is not None and user_id in network.participants_id else None
+        room = self.room_manager.get_room_by_id(info["room_id"])
+        active = room is not None and room.status_code != ROOM_CLOSED and user_id in room.participants_id
+        return network_id, room.id_room if active else None
+
+    def fireserver(self, user_id: int, network_id: int, message: str = "") -> bool:
+        if network_id in self.active_networks and user_id in self.active_networks[network_id].participants_id:
+            log.debug("Сервер получил сообщение от %s в сети %s: %s", user_id, network_id, message)
+            return True
+        log.info("Недействительное подключение", extra=fields(network_id=network_id, user_id=user_id))
+        return False
 
     def notify_participant(self, user_id: int, message: str):
         if self.network_manager.is_user_connected(user_id):
-            print(f"Участник {user_id} уведомлён: {message}")
+            if self.transport is not None:
+                self.transport.send(user_id, {"op": "notify", "message": message})
+            log.debug("Участник %s уведомлён: %s", user_id, message)
 
     def notify_all_participants(self, network_id: int, message: str = ""):
         if network_id not in self.active_networks:
             return
 
-        network = self.active_networks[network_id]
-        connected = sum(1 for uid in network["participants_id"] if self.network_manager.is_user_connected(uid))
+        if self.coalescer is not None:
+            self.coalescer.add(network_id, message)
+            return
+        self._deliver_notifications(network_id, [message], False)
 
-        print(f"Все участники сети {network['name']} уведомлены ({connected} подключено): {message}")
+    def _deliver_notifications(self, network_id: int, messages: List[str], collapsed: bool):
+        """Одна рассылка участникам сети: сообщение, пакет сообщений или снимок состояния"""
+        network = self.active_networks.get(network_id)
+        if network is None:
+            return
 
-    def get_network_info(self, network_id: int) -> Optional[Dict]:
+        recipients = [uid for uid in network.participants_id if self.network_manager.is_user_connected(uid)]
+        connected = len(recipients)
+        if self.transport is not None and recipients:
+            if collapsed:
+                state = {k: v for k, v in network.items() if k != "password"}
+                payload = {"op": "state", "network_id": network_id, "events": len(messages), "data": state}
+            elif len(messages) == 1:
+                payload = {"op": "notify", "message": messages[0]}
+            else:
+                payload = {"op": "notify_batch", "network_id": network_id, "messages": messages}
+            self.transport.broadcast(recipients, payload)
+
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        if collapsed:
+            log.debug("Все участники сети %s получили снимок состояния (%s подключено): %s событий",
+                      network.name, connected, len(messages))
+        else:
+            for message in messages:
+                log.debug("Все участники сети %s уведомлены (%s подключено): %s", network.name, connected, message)
+
+    def get_network_info(self, network_id: int) -> Optional[NetworkRecord]:
         return self.active_networks.get(network_id)
 
-    def list_active_networks(self) -> List[Dict]:
-        return list(self.active_networks.values())
\ No newline at end of file
+    def list_active_networks(self) -> List[NetworkRecord]:
+        return list(self.active_networks.values())
+
+    def dump_state(self) -> Tuple[List[NetworkRecord], int]:
+        """Активные сети и следующий id - для снимка состояния"""
+        return list(self.active_networks.values()), self.next_network_id
+
+    def load_state(self, networks: Iterable[NetworkRecord], next_network_id: int):
+        """Заменяет сети восстановленными из снимка (подключения участников не сохраняются)"""
+        self.active_networks = {network.id: network for network in networks}
+        self.next_network_id = next_network_id
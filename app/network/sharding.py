@@ -0,0 +1,398 @@
+import asyncio
+import logging
+import multiprocessing
+import secrets
+from typing import Dict, List, Optional, Tuple
+
+from ..passwords import DEFAULT_COST, PasswordHasher
+from ..user_manager import MIN_PASSWORD_LENGTH
+from .protocol import CODEC_BINARY, decode_message, detect_codec, encode_message
+from .transport import ClientConnection, FrameError, encode_frame, read_frame
+
+log = logging.getLogger(__name__)
+
+# Операции и поле, по которому выбирается шард
+ROUTING_KEYS = {
+    "close_server": "network_id",
+    "join": "network_id",
+    "leave": "network_id",
+    "fire": "network_id",
+    "room_join": "room_id",
+    "room_leave": "room_id",
+    "start_game": "room_id",
+    "close_game": "game_id",
+}
+# Создание сети и комнаты идет на шард владельца: так правило
+# "одна активная комната на владельца" соблюдается в пределах одного шарда
+OWNER_ROUTED_OPS = ("create_server", "room_create")
+# Сколько ждать остановки процесса шарда после SIGTERM, секунд
+SHARD_STOP_TIMEOUT = 30
+# Адрес, на котором слушают шарды (не адрес роутера: шарды не должны быть видны снаружи)
+SHARD_HOST = "127.0.0.1"
+
+
+def shard_for_id(entity_id: int, shard_count: int) -> int:
+    """Шард-владелец сети, комнаты или игры (см. выдачу id в GameServerSystem)"""
+    return (entity_id - 1) % shard_count
+
+
+def _run_shard(shard_index: int, shard_count: int, host: str, port_pipe,
+               system_options: Dict = None, transport_options: Dict = None, log_options: Dict = None,
+               admin_key: str = None):
+    """Точка входа процесса шарда: свой GameServerSystem и TransportServer"""
+    import os
+    import signal
+
+    from ..log import configure_logging
+    from .game_server_system import GameServerSystem
+    from .transport import TransportServer
+
+    # Ctrl+C получает вся группа процессов; шарды останавливает роутер
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if log_options is not None:
+        configure_logging(**log_options)
+
+    system_options = dict(system_options or {})
+    for key in ("archive_dir", "snapshot_dir"):
+        if system_options.get(key):
+            # У каждого шарда свой каталог архива и снимков
+            system_options[key] = os.path.join(system_options[key], f"shard-{shard_index}")
+    if system_options.get("user_db"):
+        # Пользователи есть в каждом шарде: у каждого свой файл базы
+        directory, name = os.path.split(system_options["user_db"])
+        system_options["user_db"] = os.path.join(directory, f"shard-{shard_index}", name)
+
+    async def main():
+        system = GameServerSystem(shard_index, shard_count, **system_options)
+        transport = TransportServer(system.server, host=host, port=0, game_manager=system.game_manager,
+                                    journal=system.journal, admin_key=admin_key, **(transport_options or {}))
+        port_pipe.send(await transport.start())
+        port_pipe.close()
+
+        # Роутер останавливает шард через SIGTERM: сначала сохраняем состояние
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+        snapshots = asyncio.ensure_future(system.snapshot_loop())
+        reaper = asyncio.ensure_future(system.reaper_loop())
+        try:
+            await stop.wait()
+        finally:
+            snapshots.cancel()
+            reaper.cancel()
+            await transport.stop()
+            system.shutdown_system()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+class _Upstream:
+    """Подключение сессии роутера к одному шарду"""
+
+    __slots__ = ("reader", "writer", "relay_task")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.relay_task: Optional[asyncio.Task] = None
+
+
+class _RouterSession:
+    """Одно клиентское подключение к роутеру.
+
+    Кадры клиента пересылаются в нужный шард без перекодирования, а
+    ответы и уведомления всех шардов - обратно клиенту. Пароль проверяет
+    шард 0; остальные шарды выдают роутеру токены сессии, и подключение к
+    ним открывается лениво входом по токену. Пароль роутер не хранит.
+    """
+
+    def __init__(self, router: "ShardRouter", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.router = router
+        self.reader = reader
+        self.writer = writer
+        self.codec = CODEC_BINARY
+        self.user_id: Optional[int] = None
+        # Токены сессий остальных шардов: подключение к шарду открывается без пароля и KDF
+        self.shard_tokens: Dict[int, str] = {}
+        self.upstreams: Dict[int, _Upstream] = {}
+        self._opening: Dict[int, asyncio.Lock] = {}
+
+    async def run(self):
+        try:
+            while True:
+                payload = await read_frame(self.reader)
+                if payload is None:
+                    break
+                self.codec = detect_codec(payload)
+                await self._handle(payload, decode_message(payload))
+        except (FrameError, ValueError, ConnectionError) as e:
+            log.warning("Роутер: подключение закрыто из-за ошибки: %s", e)
+        finally:
+            for upstream in self.upstreams.values():
+                upstream.writer.close()
+                if upstream.relay_task is not None:
+                    upstream.relay_task.cancel()
+            self.writer.close()
+
+    def _reply(self, request: Dict, ok: bool, data) -> None:
+        response = {"op": "result", "id": request.get("id"), "ok": ok, "data": data}
+        self.writer.write(encode_frame(encode_message(response, self.codec)))
+
+    async def _handle(self, payload: bytes, request: Dict):
+        op = request.get("op")
+        if op == "ping":
+            self._reply(request, True, "pong")
+        elif op == "heartbeat":
+            # Клиент жив: подключения ко всем шардам тоже, даже если запросы идут в один
+            for upstream in self.upstreams.values():
+                upstream.writer.write(encode_frame(payload))
+        elif op in ("login", "login_token"):
+            # Пароль или токен (его выдал шард 0) проверяет шард 0
+            await self._login(payload, request)
+        elif op == "register":
+            ok, data = await self.router.register_user(request.get("name"), request.get("password"))
+            self._reply(request, ok, data)
+        elif op == "list_rooms":
+            self._reply(request, True, await self.router.get_active_rooms())
+        elif self.user_id is None:
+            self._reply(request, False, "Сначала войдите в систему")
+        else:
+            shard = self.router.route(op, request, self.user_id)
+            if shard is None:
+                self._reply(request, False, f"Неизвестная операция: {op}")
+                return
+            upstream = await self._ensure_upstream(shard)
+            if upstream is None:
+                if shard in self.shard_tokens:
+                    self._reply(request, False, "Шард недоступен")
+                else:
+                    self._reply(request, False, "Сессия истекла, войдите заново")
+                return
+            upstream.writer.write(encode_frame(payload))
+        await self.writer.drain()
+
+    async def _login(self, payload: bytes, request: Dict):
+        # Все шарды хранят одинаковый набор пользователей, проверку делает шард 0
+        upstream, response_frame, user = await self._handshake(0, payload)
+        if response_frame is not None:
+            self.writer.write(encode_frame(response_frame))
+        if upstream is None:
+            if response_frame is None:
+                self._reply(request, False, "Шард недоступен")
+            return
+        # Повторный вход: старые подключения к шардам больше не нужны
+        for old in self.upstreams.values():
+            old.writer.close()
+            old.relay_task.cancel()
+        self.upstreams.clear()
+        self.user_id = user["id"]
+        self._start_upstream(0, upstream)
+        self.shard_tokens = await self.router.issue_tokens(user["id"])
+
+    async def _handshake(self, shard: int, login_frame: bytes) -> Tuple[Optional[_Upstream], Optional[bytes], Optional[Dict]]:
+        """Открывает подключение к шарду и выполняет вход; (подключение, кадр ответа, пользователь)"""
+        host, port = self.router.shard_addresses[shard]
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            return None, None, None
+        writer.write(encode_frame(login_frame))
+        await writer.drain()
+        response_frame = await read_frame(reader)
+        if response_frame is None:
+            writer.close()
+            return None, None, None
+        response = decode_message(response_frame)
+        if not response.get("ok"):
+            writer.close()
+            return None, response_frame, None
+        return _Upstream(reader, writer), response_frame, response.get("data")
+
+    def _start_upstream(self, shard: int, upstream: _Upstream):
+        self.upstreams[shard] = upstream
+        upstream.relay_task = asyncio.get_running_loop().create_task(self._relay(upstream))
+
+    async def _ensure_upstream(self, shard: int) -> Optional[_Upstream]:
+        upstream = self.upstreams.get(shard)
+        if upstream is not None:
+            return upstream
+        lock = self._opening.setdefault(shard, asyncio.Lock())
+        async with lock:
+            upstream = self.upstreams.get(shard)
+            if upstream is None:
+                token = self.shard_tokens.get(shard)
+                if token is None:
+                    return None
+                frame = encode_message({"op": "login_token", "id": 0, "token": token}, self.codec)
+                upstream, response_frame, user = await self._handshake(shard, frame)
+                if upstream is None:
+                    if response_frame is not None:
+                        # Токен истек: без пароля подключиться к шарду уже нельзя
+                        del self.shard_tokens[shard]
+                    return None
+                self.shard_tokens[shard] = user["token"]
+                self._start_upstream(shard, upstream)
+        return upstream
+
+    async def _relay(self, upstream: _Upstream):
+        """Пересылает клиенту все кадры шарда как есть"""
+        try:
+            while True:
+                frame = await read_frame(upstream.reader)
+                if frame is None:
+                    break
+                self.writer.write(encode_frame(frame))
+                await self.writer.drain()
+        except (FrameError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            # Шард сам закрыл подключение (снял по тайм-ауту простоя или остановился):
+            # клиент переподключится по токену сессии, как при прямом подключении
+            if any(current is upstream for current in self.upstreams.values()):
+                self.writer.close()
+
+
+class ShardRouter:
+    """Шардированный режим: N процессов-шардов и тонкий роутер перед ними.
+
+    Каждый шард - отдельный процесс со своими RoomManager/GameManager/Server.
+    Сети, комнаты и игры распределяются по шардам по id, пользователи
+    регистрируются во всех шардах сразу (через роутер), поэтому их id
+    совпадают везде. Запросы вида list_rooms собираются со всех шардов.
+    """
+
+    def __init__(self, shard_count: int = 2, host: str = "127.0.0.1", port: int = 0, backlog: int = 1024,
+                 system_options: Dict = None, transport_options: Dict = None, log_options: Dict = None,
+                 shard_host: str = SHARD_HOST):
+        if shard_count < 1:
+            raise ValueError("Нужен хотя бы один шард")
+        self.shard_count = shard_count
+        self.host = host
+        # Внутренний адрес шардов: клиенты ходят только через роутер, иначе регистрация
+        # напрямую в одном шарде разошлась бы с id пользователей в остальных
+        self.shard_host = shard_host
+        self.port = port
+        self.backlog = backlog
+        # Параметры GameServerSystem и TransportServer каждого шарда
+        self.system_options = system_options or {}
+        self.transport_options = transport_options or {}
+        # Настройки журнала процессов шардов (configure_logging); None - журнал шардов выключен
+        self.log_options = log_options
+        self.shard_addresses: List[Tuple[str, int]] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._admin: List[ClientConnection] = []
+        # Ключ служебных подключений: регистрацию с готовым хешем шарды принимают только от роутера
+        self.admin_key = secrets.token_urlsafe(32)
+        self._register_lock: Optional[asyncio.Lock] = None
+        # Хеш пароля при регистрации считается в роутере один раз на все шарды,
+        # с той же стоимостью, что задана шардам (иначе шарды его не примут)
+        self.hasher = PasswordHasher(self.system_options.get("password_workers"),
+                                     self.system_options.get("password_cost", DEFAULT_COST))
+        self._tcp_server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        """Запускает процессы шардов и прием подключений; возвращает порт роутера"""
+        ctx = multiprocessing.get_context("spawn")
+        pipes = []
+        for index in range(self.shard_count):
+            parent_end, child_end = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=_run_shard,
+                                  args=(index, self.shard_count, self.shard_host, child_end,
+                                        self.system_options, self.transport_options, self.log_options,
+                                        self.admin_key),
+                                  daemon=True, name=f"shard-{index}")
+            process.start()
+            child_end.close()
+            self._processes.append(process)
+            pipes.append(parent_end)
+
+        loop = asyncio.get_running_loop()
+        for pipe in pipes:
+            port = await loop.run_in_executor(None, pipe.recv)
+            pipe.close()
+            self.shard_addresses.append((self.shard_host, port))
+
+        for host, port in self.shard_addresses:
+            admin = ClientConnection()
+            await admin.open(host, port)
+            ok, data = await admin.request("admin_login", key=self.admin_key)
+            if not ok:
+                raise RuntimeError(f"Шард {host}:{port} отклонил служебное подключение: {data}")
+            self._admin.append(admin)
+        self._register_lock = asyncio.Lock()
+
+        self._tcp_server = await asyncio.start_server(self._handle_client, self.host, self.port, backlog=self.backlog)
+        self.port = self._tcp_server.sockets[0].getsockname()[1]
+        log.info("Роутер слушает %s:%s, шардов: %s", self.host, self.port, self.shard_count)
+        return self.port
+
+    async def stop(self):
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            self._tcp_server = None
+        for admin in self._admin:
+            await admin.close()
+        self._admin.clear()
+        self.hasher.close()
+        for process in self._processes:
+            process.terminate()
+        # Шард при остановке сохраняет снимок состояния, на это нужно время:
+        # ждем процессы в пуле потоков, не останавливая цикл событий
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, process.join, SHARD_STOP_TIMEOUT)
+                               for process in self._processes))
+        self._processes.clear()
+
+    async def serve_forever(self):
+        if self._tcp_server is None:
+            await self.start()
+        try:
+            await self._tcp_server.serve_forever()
+        finally:
+            await self.stop()
+
+    def route(self, op: str, request: Dict, user_id: int) -> Optional[int]:
+        """Шард для запроса; None, если операция неизвестна роутеру"""
+        if op in OWNER_ROUTED_OPS:
+            return shard_for_id(user_id, self.shard_count)
+        key = ROUTING_KEYS.get(op)
+        if key is None:
+            return None
+        entity_id = request.get(key)
+        if not isinstance(entity_id, int) or entity_id < 1:
+            return 0
+        return shard_for_id(entity_id, self.shard_count)
+
+    async def register_user(self, name: str, password: str) -> Tuple[bool, object]:
+        """Регистрирует пользователя во всех шардах в одном и том же порядке"""
+        if not isinstance(password, str) or len(password) < MIN_PASSWORD_LENGTH:
+            return False, "Не удалось зарегистрировать пользователя"
+        # KDF считается до блокировки: регистрации не выстраиваются в очередь за хешированием
+        password_hash = await self.hasher.hash_async(password)
+        async with self._register_lock:
+            results = await asyncio.gather(*(admin.request("register_hashed", name=name, password_hash=password_hash)
+                                             for admin in self._admin))
+        return results[0]
+
+    async def issue_tokens(self, user_id: int) -> Dict[int, str]:
+        """Токены сессии пользователя во всех шардах, кроме 0 (пароль уже проверен шардом 0)"""
+        shards = range(1, self.shard_count)
+        results = await asyncio.gather(*(self._admin[shard].request("session_token", user_id=user_id)
+                                         for shard in shards))
+        return {shard: token for shard, (ok, token) in zip(shards, results) if ok}
+
+    async def get_active_rooms(self) -> List[Dict]:
+        """Активные комнаты всех шардов (scatter-gather), по возрастанию id"""
+        results = await asyncio.gather(*(admin.request("list_rooms") for admin in self._admin))
+        rooms = [room for ok, data in results if ok for room in data]
+        rooms.sort(key=lambda room: room["id_room"])
+        return rooms
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await _RouterSession(self, reader, writer).run()
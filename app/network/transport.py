@@ -0,0 +1,522 @@
+import asyncio
+import hmac
+import logging
+import struct
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from .broadcast import POLICY_DROP_OLDEST, Broadcaster, SendQueue
+from .protocol import CODEC_BINARY, decode_message, detect_codec, encode_message
+
+log = logging.getLogger(__name__)
+
+# Кадр: 4 байта длины (big-endian) + тело сообщения
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 1 << 20
+
+
+# Как часто клиент подает heartbeat, секунд (тайм-аут простоя на сервере - несколько периодов)
+HEARTBEAT_INTERVAL = 20.0
+# Сколько клиент ждет ответа на запрос, секунд
+REQUEST_TIMEOUT = 30.0
+
+# Операции, доступные без входа в систему
+PUBLIC_OPS = ("login", "login_token", "ping", "register", "admin_login", "list_rooms")
+# Операции только для служебного подключения роутера шардов (после admin_login)
+ADMIN_OPS = ("register_hashed", "session_token")
+# Ответ на запрос, обработчик которого завершился исключением
+INTERNAL_ERROR = "Внутренняя ошибка сервера"
+
+
+class FrameError(Exception):
+    """Нарушение протокола кадров"""
+
+
+def encode_frame(payload: bytes) -> bytes:
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Кадр слишком большой: {len(payload)} байт")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Читает один кадр; None, если соединение закрыто"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"Кадр слишком большой: {length} байт")
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class Connection:
+    """Одно TCP-подключение к серверу"""
+
+    __slots__ = ("conn_id", "reader", "writer", "peer", "user_id", "queue", "codec", "admin")
+
+    def __init__(self, conn_id: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.conn_id = conn_id
+        self.reader = reader
+        self.writer = writer
+        self.peer: Tuple = writer.get_extra_info("peername") or ("", 0)
+        self.user_id: Optional[int] = None
+        self.queue: Optional[SendQueue] = None
+        # Формат сообщений определяется по первому запросу клиента
+        self.codec = CODEC_BINARY
+        # Служебное подключение роутера шардов
+        self.admin = False
+
+    def close(self):
+        if self.queue is not None:
+            self.queue.close()
+        elif not self.writer.is_closing():
+            self.writer.close()
+
+
+class TransportServer:
+    """Asyncio TCP-транспорт для Server.
+
+    Все подключения обслуживаются одним циклом событий. Клиент сначала
+    выполняет login, после чего его запросы вызывают методы Server
+    (create_server, add_participant, fireserver ...), а уведомления
+    Server отправляются подключенным пользователям через send().
+    """
+
+    def __init__(self, server, host: str = "127.0.0.1", port: int = 0, backlog: int = 1024,
+                 max_queue: int = 256, slow_policy: str = POLICY_DROP_OLDEST, game_manager=None,
+                 max_connections: int = None, journal=None, admin_key: str = None):
+        self.server = server
+        # Ключ служебного подключения роутера (None - операции ADMIN_OPS недоступны)
+        self.admin_key = admin_key
+        self.game_manager = game_manager
+        # Журнал изменений (WriteAheadLog): ответ на изменяющий запрос уходит после fsync
+        self.journal = journal
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.connections: Dict[int, Connection] = {}  # user_id -> подключение
+        self.broadcaster = Broadcaster(max_queue, slow_policy)
+        self._next_conn_id = 1
+        self._tcp_server: Optional[asyncio.AbstractServer] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # Вход и регистрация ждут KDF в пуле хеширования, остальные операции синхронные
+        self._async_handlers: Dict[str, Callable] = {
+            "login": self._op_login,
+            "register": self._op_register,
+        }
+        self._handlers: Dict[str, Callable] = {
+            "login_token": self._op_login_token,
+            "admin_login": self._op_admin_login,
+            "ping": self._op_ping,
+            "register_hashed": self._op_register_hashed,
+            "session_token": self._op_session_token,
+            "list_rooms": self._op_list_rooms,
+            "room_create": self._op_room_create,
+            "create_server": self._op_create_server,
+            "close_server": self._op_close_server,
+            "join": self._op_join,
+            "leave": self._op_leave,
+            "fire": self._op_fire,
+            "room_join": self._op_room_join,
+            "room_leave": self._op_room_leave,
+            "start_game": self._op_start_game,
+            "close_game": self._op_close_game,
+        }
+        server.attach_transport(self)
+
+    async def start(self) -> int:
+        """Запускает прием подключений; возвращает фактический порт"""
+        self._tcp_server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                      backlog=self.backlog)
+        self.port = self._tcp_server.sockets[0].getsockname()[1]
+        log.info("Сервер слушает %s:%s", self.host, self.port)
+        return self.port
+
+    async def stop(self):
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            for conn in list(self.connections.values()):
+                conn.close()
+            # Дожидаемся завершения обработчиков закрытых подключений
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._tcp_server.wait_closed()
+            self._tcp_server = None
+
+    async def serve_forever(self):
+        if self._tcp_server is None:
+            await self.start()
+        async with self._tcp_server:
+            await self._tcp_server.serve_forever()
+
+    def is_connected(self, user_id: int) -> bool:
+        return user_id in self.connections
+
+    def send(self, user_id: int, message: Dict) -> bool:
+        """Отправляет сообщение пользователю, если он подключен"""
+        conn = self.connections.get(user_id)
+        if conn is None:
+            return False
+        return self.broadcaster.enqueue(conn.queue, encode_frame(encode_message(message, conn.codec)))
+
+    def close_user(self, user_id: int) -> bool:
+        """Закрывает подключение пользователя без возможности возобновить его"""
+        conn = self.connections.pop(user_id, None)
+        if conn is None:
+            return False
+        conn.user_id = None
+        conn.close()
+        return True
+
+    def broadcast(self, user_ids: Iterable[int], message: Dict) -> int:
+        """Рассылает сообщение подключенным пользователям; кодируется один раз на формат"""
+        connections = self.connections
+        queues_by_codec: Dict[str, list] = {}
+        for uid in user_ids:
+            conn = connections.get(uid)
+            if conn is not None:
+                queues_by_codec.setdefault(conn.codec, []).append(conn.queue)
+
+        delivered = 0
+        for codec, queues in queues_by_codec.items():
+            frame = encode_frame(encode_message(message, codec))
+            delivered += self.broadcaster.broadcast(queues, frame)
+        return delivered
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.max_connections is not None and len(self._tasks) >= self.max_connections:
+            log.warning("Достигнут лимит подключений, подключение отклонено")
+            writer.close()
+            return
+
+        conn = Connection(self._next_conn_id, reader, writer)
+        self._next_conn_id += 1
+        conn.queue = self.broadcaster.register(conn.conn_id, writer)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        heartbeat = self.server.network_manager.heartbeat
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload is None:
+                    break
+                conn.codec = detect_codec(payload)
+                request = decode_message(payload)
+                # Любой кадр - признак жизни; heartbeat ничего больше не делает и ответа не ждет
+                if conn.user_id is not None:
+                    heartbeat(conn.user_id)
+                if request.get("op") == "heartbeat":
+                    continue
+                journal = self.journal
+                appended = journal.appended if journal is not None else 0
+                handler = self._async_handlers.get(request.get("op"))
+                if handler is not None:
+                    # Пока считается KDF, цикл событий обслуживает другие подключения
+                    try:
+                        ok, data = await handler(conn, request)
+                    except Exception:
+                        log.exception("Ошибка в обработчике %s от %s", request.get("op"), conn.peer)
+                        ok, data = False, INTERNAL_ERROR
+                    response = {"op": "result", "id": request.get("id"), "ok": ok, "data": data}
+                else:
+                    response = self._dispatch(conn, request)
+                if journal is not None and journal.appended != appended:
+                    # Пока идет fsync, другие подключения обрабатываются и их записи
+                    # попадают в ту же группу
+                    await journal.sync()
+                frame = encode_frame(encode_message(response, conn.codec))
+                if not self.broadcaster.enqueue(conn.queue, frame, force=True):
+                    break
+        except (FrameError, ValueError, OSError) as e:
+            log.warning("Подключение %s закрыто из-за ошибки: %s", conn.peer, e)
+        finally:
+            self._drop(conn)
+            self._tasks.discard(task)
+
+    def _drop(self, conn: Connection):
+        if conn.user_id is not None and self.connections.get(conn.user_id) is conn:
+            del self.connections[conn.user_id]
+            # Запись подключения сохраняется: клиент может вернуться по токену сессии
+            self.server.network_manager.suspend_connection(conn.user_id)
+        self.broadcaster.unregister(conn.conn_id)
+        conn.close()
+
+    def _dispatch(self, conn: Connection, request: Dict) -> Dict:
+        op = request.get("op")
+        handler = self._handlers.get(op)
+        if handler is None:
+            ok, data = False, f"Неизвестная операция: {op}"
+        elif op in ADMIN_OPS:
+            if conn.admin:
+                ok, data = self._call(handler, conn, request)
+            else:
+                ok, data = False, "Операция недоступна"
+        elif op not in PUBLIC_OPS and conn.user_id is None:
+            ok, data = False, "Сначала войдите в систему"
+        else:
+            ok, data = self._call(handler, conn, request)
+        return {"op": "result", "id": request.get("id"), "ok": ok, "data": data}
+
+    def _call(self, handler, conn: Connection, request: Dict) -> Tuple[bool, Any]:
+        """Вызывает обработчик; исключение становится ответом ok=False, а не обрывом подключения"""
+        try:
+            ok, data = handler(conn, request)
+        except Exception:
+            log.exception("Ошибка в обработчике %s от %s", request.get("op"), conn.peer)
+            return False, INTERNAL_ERROR
+        return ok, data
+
+    def _ensure_registered(self, conn: Connection):
+        manager = self.server.network_manager
+        if not manager.is_user_connected(conn.user_id):
+            # Оборванное подключение возобновляется вместе с сетью и комнатой
+            if manager.resume_connection(conn.user_id, conn.peer[0], conn.peer[1]) is None:
+                manager.register_connection(conn.user_id, conn.peer[0], conn.peer[1])
+
+    def _session(self, user, token: str) -> Dict:
+        network_id, room_id = self.server.membership(user["id"])
+        return {"id": user["id"], "name": user["name"], "token": token, "network_id": network_id, "room_id": room_id}
+
+    async def _op_login(self, conn: Connection, request: Dict):
+        users = self.server.user_manager
+        user = await users.authenticate_user_async(request.get("name"), request.get("password"))
+        if not user:
+            return False, "Неверные данные для входа"
+        self._bind_user(conn, user["id"])
+        return True, self._session(user, users.open_session(user["id"]))
+
+    def _op_login_token(self, conn: Connection, request: Dict):
+        # Вход по токену сессии из ответа login: без проверки пароля, токен заменяется новым
+        users = self.server.user_manager
+        user = users.authenticate_token(request.get("token"))
+        if not user:
+            return False, "Сессия не найдена или истекла"
+        users.close_session(request.get("token"))
+        self._bind_user(conn, user["id"])
+        return True, self._session(user, users.open_session(user["id"]))
+
+    def _op_admin_login(self, conn: Connection, request: Dict):
+        key = request.get("key")
+        if self.admin_key is None or not isinstance(key, str) \
+                or not hmac.compare_digest(key.encode("utf-8"), self.admin_key.encode("utf-8")):
+            return False, "Неверный ключ"
+        conn.admin = True
+        return True, None
+
+    def _bind_user(self, conn: Connection, user_id: int):
+        # Повторный вход вытесняет старое подключение пользователя
+        old = self.connections.get(user_id)
+        if old is not None and old is not conn:
+            old.user_id = None
+            old.close()
+        conn.user_id = user_id
+        self.connections[user_id] = conn
+        self._ensure_registered(conn)
+
+    def _op_ping(self, conn: Connection, request: Dict):
+        return True, "pong"
+
+    async def _op_register(self, conn: Connection, request: Dict):
+        user = await self.server.user_manager.create_user_async(request.get("name"), request.get("password"))
+        if not user:
+            return False, "Не удалось зарегистрировать пользователя"
+        return True, {"id": user["id"], "name": user["name"]}
+
+    def _op_register_hashed(self, conn: Connection, request: Dict):
+        # Роутер шардов считает хеш пароля один раз и рассылает его всем шардам
+        users = self.server.user_manager
+        password_hash = request.get("password_hash")
+        user = None
+        if users.hasher.is_hash(password_hash):
+            user = users.create_user_hashed(request.get("name"), password_hash)
+        if not user:
+            return False, "Не удалось зарегистрировать пользователя"
+        return True, {"id": user["id"], "name": user["name"]}
+
+    def _op_session_token(self, conn: Connection, request: Dict):
+        users = self.server.user_manager
+        user_id = request.get("user_id")
+        if users.get_user(user_id) is None:
+            return False, "Пользователь не найден"
+        return True, users.open_session(user_id)
+
+    def _op_list_rooms(self, conn: Connection, request: Dict):
+        rooms = self.server.room_manager.get_active_rooms()
+        return True, [{k: v for k, v in room.items() if k != "password"} for room in rooms]
+
+    def _op_room_create(self, conn: Connection, request: Dict):
+        room = self.server.room_manager.room_create(
+            conn.user_id,
+            request.get("access"),
+            password=request.get("password"),
+            maxplayers=request.get("maxplayers") or 2,
+            name=request.get("name"),
+        )
+        if not room:
+            return False, "Не удалось создать комнату"
+        self.server.network_manager.set_room(conn.user_id, room.id_room)
+        return True, {k: v for k, v in room.items() if k != "password"}
+
+    def _op_create_server(self, conn: Connection, request: Dict):
+        network = self.server.create_server(conn.user_id, request.get("name", "Новая сеть"), request.get("password"))
+        if not network:
+            return False, "Не удалось создать сеть"
+        return True, {k: v for k, v in network.items() if k != "password"}
+
+    def _op_close_server(self, conn: Connection, request: Dict):
+        ok = self.server.close_server(request.get("network_id"), conn.user_id)
+        return ok, None if ok else "Не удалось закрыть сеть"
+
+    def _op_join(self, conn: Connection, request: Dict):
+        self._ensure_registered(conn)
+        ok = self.server.add_participant(request.get("network_id"), conn.user_id, request.get("password"))
+        return ok, None if ok else "Не удалось присоединиться к сети"
+
+    def _op_leave(self, conn: Connection, request: Dict):
+        ok = self.server.remove_participant(request.get("network_id"), conn.user_id)
+        return ok, None if ok else "Не удалось покинуть сеть"
+
+    def _op_fire(self, conn: Connection, request: Dict):
+        ok = self.server.fireserver(conn.user_id, request.get("network_id"), request.get("message", ""))
+        return ok, None if ok else "Недействительное подключение"
+
+    def _op_room_join(self, conn: Connection, request: Dict):
+        ok, msg = self.server.room_manager.room_join(request.get("room_id"), conn.user_id, request.get("password"))
+        if ok:
+            self.server.network_manager.set_room(conn.user_id, request.get("room_id"))
+        return ok, msg
+
+    def _op_room_leave(self, conn: Connection, request: Dict):
+        ok, msg = self.server.room_manager.room_leave(request.get("room_id"), conn.user_id)
+        if ok:
+            self.server.network_manager.set_room(conn.user_id, None)
+        return ok, msg
+
+    def _op_start_game(self, conn: Connection, request: Dict):
+        if self.game_manager is None:
+            return False, "Игры на этом сервере недоступны"
+        ok, msg = self.game_manager.start_game(request.get("room_id"), conn.user_id, self.server.room_manager)
+        if not ok:
+            return False, msg
+        # Клиенту нужен id игры, чтобы потом ее завершить
+        return True, self.game_manager.get_game_by_room(request.get("room_id")).to_dict()
+
+    def _op_close_game(self, conn: Connection, request: Dict):
+        if self.game_manager is None:
+            return False, "Игры на этом сервере недоступны"
+        return self.game_manager.close_game(request.get("game_id"), conn.user_id, self.server.room_manager)
+
+
+class ClientConnection:
+    """Асинхронное подключение клиента к TransportServer.
+
+    Запросы и ответы сопоставляются по id; уведомления сервера
+    передаются в on_notify и складываются в очередь notifications.
+    Последний снимок состояния сети (при склейке уведомлений) - в last_state.
+    """
+
+    def __init__(self, on_notify: Callable[[str], None] = None, codec: str = CODEC_BINARY,
+                 heartbeat_interval: float = None, request_timeout: float = REQUEST_TIMEOUT):
+        self.on_notify = on_notify
+        self.codec = codec
+        self.request_timeout = request_timeout
+        # Период heartbeat (None - не посылать): иначе сервер с тайм-аутом простоя
+        # снимет подключение, пока клиент молчит
+        self.heartbeat_interval = heartbeat_interval
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.notifications: "asyncio.Queue[str]" = asyncio.Queue()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 1
+        self._read_task: Optional[asyncio.Task] = None
+        self.last_state: Optional[Dict] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def open(self, host: str, port: int):
+        self._reader, self._writer = await asyncio.open_connection(host, port)
+        loop = asyncio.get_running_loop()
+        self._read_task = loop.create_task(self._read_loop())
+        if self.heartbeat_interval:
+            self._heartbeat_task = loop.create_task(self._heartbeat_loop())
+
+    async def request(self, op: str, **fields) -> Tuple[bool, object]:
+        """Отправляет запрос и ждет ответ сервера не дольше request_timeout секунд"""
+        if not self.is_open:
+            return False, "Нет подключения"
+        request_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+
+        message = dict(fields, op=op, id=request_id)
+        self._writer.write(encode_frame(encode_message(message, self.codec)))
+        await self._writer.drain()
+        try:
+            response = await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(request_id, None)
+            return False, "Нет ответа от сервера"
+        return response.get("ok", False), response.get("data")
+
+    async def close(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        if self._read_task is not None:
+            await self._read_task
+            self._read_task = None
+
+    async def _heartbeat_loop(self):
+        # Шлется и при других запросах: через роутер heartbeat доходит до всех шардов
+        frame = encode_frame(encode_message({"op": "heartbeat"}, self.codec))
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if not self.is_open:
+                break
+            self._writer.write(frame)
+
+    def _notify(self, text: str):
+        self.notifications.put_nowait(text)
+        if self.on_notify:
+            self.on_notify(text)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                payload = await read_frame(self._reader)
+                if payload is None:
+                    break
+                message = decode_message(payload)
+                if message.get("op") == "result":
+                    future = self._pending.pop(message.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(message)
+                elif message.get("op") == "notify":
+                    self._notify(message.get("message", ""))
+                elif message.get("op") == "notify_batch":
+                    for text in message.get("messages") or []:
+                        self._notify(text)
+                elif message.get("op") == "state":
+                    self.last_state = message.get("data")
+                    self._notify(f"Состояние сети обновлено ({message.get('events')} событий)")
+        except (FrameError, ValueError, ConnectionError):
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result({"ok": False, "data": "Подключение закрыто"})
+            self._pending.clear()
@@ -0,0 +1,182 @@
+"""Хеширование паролей с солью (scrypt, без него - PBKDF2-SHA256).
+
+Одна проверка пароля стоит десятки миллисекунд процессорного времени,
+поэтому PasswordHasher выполняет ее в ограниченном пуле потоков (hashlib
+отпускает GIL на время вычисления) или процессов и возвращает Future или
+корутину: цикл событий сервера и цикл Tk при этом не останавливаются.
+
+Хеш хранится строкой "scrypt$<log2 n>$<r>$<p>$<соль>$<хеш>" или
+"pbkdf2_sha256$<итерации>$<соль>$<хеш>" (соль и хеш в base64). Строка
+без такого префикса считается паролем, сохраненным открытым текстом
+прежними версиями, и сравнивается как есть.
+
+Принимаются только хеши с параметрами самого сервера (r=8, p=1,
+стоимость не выше max_cost): иначе один хеш с огромной стоимостью
+занял бы пул проверки паролей на часы.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+SCRYPT = "scrypt"
+PBKDF2 = "pbkdf2_sha256"
+# log2 параметра n для scrypt: 2^14 - около 16 МБ памяти и 50 мс на проверку
+DEFAULT_COST = 14
+_SCRYPT_R = 8
+_SCRYPT_P = 1
+_SALT_SIZE = 16
+_HASH_SIZE = 32
+
+
+def _maxmem(n: int, r: int) -> int:
+    # scrypt занимает около 128 * n * r байт; запас - на служебные буферы OpenSSL
+    return 256 * n * r + (1 << 20)
+
+
+def _pbkdf2_iterations(cost: int) -> int:
+    return 37 << cost
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password: str, cost: int = DEFAULT_COST) -> str:
+    """Хеш пароля со случайной солью"""
+    salt = os.urandom(_SALT_SIZE)
+    secret = password.encode("utf-8")
+    if hasattr(hashlib, "scrypt"):
+        n = 1 << cost
+        digest = hashlib.scrypt(secret, salt=salt, n=n, r=_SCRYPT_R, p=_SCRYPT_P,
+                                maxmem=_maxmem(n, _SCRYPT_R), dklen=_HASH_SIZE)
+        return f"{SCRYPT}${cost}${_SCRYPT_R}${_SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    # Сборка Python без scrypt в OpenSSL: PBKDF2 примерно той же стоимости
+    iterations = _pbkdf2_iterations(cost)
+    digest = hashlib.pbkdf2_hmac("sha256", secret, salt, iterations, _HASH_SIZE)
+    return f"{PBKDF2}${iterations}${_b64(salt)}${_b64(digest)}"
+
+
+def _parse_hash(stored: str, max_cost: int) -> Optional[Tuple[str, int, bytes, bytes]]:
+    """(алгоритм, log2 n или число итераций, соль, хеш); None - формат или параметры не наши"""
+    parts = stored.split("$")
+    try:
+        if parts[0] == SCRYPT and len(parts) == 6:
+            cost, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            if r != _SCRYPT_R or p != _SCRYPT_P or not 1 <= cost <= max_cost:
+                return None
+            work = cost
+        elif parts[0] == PBKDF2 and len(parts) == 4:
+            work = int(parts[1])
+            if not 1 <= work <= _pbkdf2_iterations(max_cost):
+                return None
+        else:
+            return None
+        salt = base64.b64decode(parts[-2], validate=True)
+        expected = base64.b64decode(parts[-1], validate=True)
+    except (ValueError, binascii.Error):
+        return None
+    if len(salt) != _SALT_SIZE or len(expected) != _HASH_SIZE:
+        return None
+    return parts[0], work, salt, expected
+
+
+def is_password_hash(value, max_cost: int = DEFAULT_COST) -> bool:
+    """Строка в формате hash_password с допустимыми параметрами"""
+    return isinstance(value, str) and _parse_hash(value, max_cost) is not None
+
+
+def verify_password(password: str, stored: str, max_cost: int = DEFAULT_COST) -> bool:
+    """Сравнивает пароль с хешем за время, не зависящее от места расхождения"""
+    if not isinstance(password, str) or not isinstance(stored, str):
+        return False
+    secret = password.encode("utf-8")
+    if not stored.startswith((SCRYPT + "$", PBKDF2 + "$")):
+        return hmac.compare_digest(secret, stored.encode("utf-8"))
+    parsed = _parse_hash(stored, max_cost)
+    if parsed is None:
+        return False
+    algorithm, work, salt, expected = parsed
+    if algorithm == SCRYPT:
+        n = 1 << work
+        digest = hashlib.scrypt(secret, salt=salt, n=n, r=_SCRYPT_R, p=_SCRYPT_P,
+                                maxmem=_maxmem(n, _SCRYPT_R), dklen=_HASH_SIZE)
+    else:
+        digest = hashlib.pbkdf2_hmac("sha256", secret, salt, work, _HASH_SIZE)
+    return hmac.compare_digest(digest, expected)
+
+
+class PasswordHasher:
+    """Пул для hash_password и verify_password: workers потоков (или процессов).
+
+    Пул создается при первом обращении. Синхронные hash и verify считают
+    в вызывающем потоке - для журнала, демо и тестов.
+    """
+
+    def __init__(self, workers: int = None, cost: int = DEFAULT_COST, processes: bool = False,
+                 max_cost: int = None):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.cost = cost
+        # Наибольшая стоимость принимаемых хешей; выше cost - только чтобы после
+        # снижения cost продолжали работать пароли, захешированные раньше
+        self.max_cost = max(cost, max_cost or cost)
+        self.processes = processes
+        self._executor: Optional[Executor] = None
+        # Хеш для проверки несуществующих пользователей: отказ стоит столько же,
+        # сколько неверный пароль, и не выдает, есть ли такое имя
+        self._dummy: Optional[str] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="kdf")
+        return self._executor
+
+    def _stored(self, stored: Optional[str]) -> str:
+        if stored is not None:
+            return stored
+        if self._dummy is None:
+            self._dummy = hash_password("", self.cost)
+        return self._dummy
+
+    def hash(self, password: str) -> str:
+        return hash_password(password, self.cost)
+
+    def is_hash(self, value) -> bool:
+        """Хеш, который этот сервер готов хранить и проверять"""
+        return is_password_hash(value, self.max_cost)
+
+    def verify(self, password: str, stored: Optional[str]) -> bool:
+        """Проверка пароля; stored=None - пользователя нет, всегда False"""
+        return verify_password(password, self._stored(stored), self.max_cost) and stored is not None
+
+    def hash_future(self, password: str) -> Future:
+        return self.executor.submit(hash_password, password, self.cost)
+
+    def verify_future(self, password: str, stored: Optional[str]) -> Future:
+        """Future с результатом проверки (bool)"""
+        future = self.executor.submit(verify_password, password, self._stored(stored), self.max_cost)
+        if stored is not None:
+            return future
+        result: Future = Future()
+        future.add_done_callback(lambda done: result.set_result(False))
+        return result
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self.hash_future(password))
+
+    async def verify_async(self, password: str, stored: Optional[str]) -> bool:
+        return await asyncio.wrap_future(self.verify_future(password, stored))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -1,22 +1,386 @@
+import hashlib
+import heapq
 import random
+import secrets
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него работает чистый Python
+    np = None
+
+# Имя поля с весом записи в каталоге (по умолчанию вес 1)
+WEIGHT_KEY = "weight"
+
+
+class WeightedSampler:
+    """Взвешенный выбор из каталога за O(1) (alias-метод Уокера/Воуза).
+
+    Таблицы строятся один раз за O(n), после чего каждый выбор
+    требует одного случайного числа и одного сравнения.
+    """
+
+    def __init__(self, items: List[Dict], weight_key: str = WEIGHT_KEY):
+        if not items:
+            raise ValueError("Пустой каталог")
+
+        weights = []
+        for item in items:
+            w = item.get(weight_key, 1) if isinstance(item, dict) else 1
+            w = float(w)
+            if w < 0:
+                raise ValueError(f"Отрицательный вес: {w}")
+            weights.append(w)
+
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("Сумма весов должна быть больше нуля")
+
+        self.items = items
+        self.weights = weights
+        self.total = total
+        self._positive = sum(1 for w in weights if w > 0)
+        self.size = n = len(items)
+        self.prob: List[float] = [0.0] * n
+        self.alias: List[int] = [0] * n
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        # Остатки из-за погрешности округления считаем полными ячейками
+        for i in large + small:
+            self.prob[i] = 1.0
+            self.alias[i] = i
+
+        # Массивы NumPy строятся лениво при первом пакетном выборе
+        self._np_prob = None
+        self._np_alias = None
+
+    def sample_index(self, rng: random.Random = None) -> int:
+        """Возвращает индекс случайной записи с учетом весов"""
+        u = (rng or random).random() * self.size
+        i = int(u)
+        if i >= self.size:
+            i = self.size - 1
+        return i if (u - i) < self.prob[i] else self.alias[i]
+
+    def sample(self, rng: random.Random = None) -> Dict:
+        """Возвращает случайную запись с учетом весов"""
+        return self.items[self.sample_index(rng)]
+
+    def sample_indices(self, count: int, replace: bool = True, rng=None) -> List[int]:
+        """Пакетный выбор индексов за один вызов.
+
+        rng может быть random.Random или numpy.random.Generator; если NumPy
+        установлен и rng не задан, используется векторизованный генератор.
+        """
+        if count <= 0:
+            return []
+        if not replace and count > self.positive_count():
+            raise ValueError("Недостаточно записей для выбора без повторов")
+
+        if np is not None and (rng is None or isinstance(rng, np.random.Generator)):
+            return self._sample_indices_np(count, replace, rng or _get_np_rng())
+
+        rng = rng or random
+        if replace:
+            return [self.sample_index(rng) for _ in range(count)]
+
+        # Без повторов: ключи Эфраимидиса-Спиракиса u^(1/w), берем count наибольших
+        keys = ((rng.random() ** (1.0 / w), i) for i, w in enumerate(self.weights) if w > 0)
+        return [i for _, i in heapq.nlargest(count, keys)]
+
+    def sample_many(self, count: int, replace: bool = True, rng=None) -> List[Dict]:
+        """Пакетный выбор записей (см. sample_indices)"""
+        items = self.items
+        return [items[i] for i in self.sample_indices(count, replace, rng)]
+
+    def sample_hands(self, hands: int, size: int, rng=None) -> List[List[Dict]]:
+        """Пакетный выбор hands наборов по size записей за один вызов.
+
+        Внутри набора записи не повторяются, наборы независимы друг от друга.
+        """
+        if hands <= 0 or size <= 0:
+            return [[] for _ in range(max(hands, 0))]
+        if size > self.positive_count():
+            raise ValueError("Недостаточно записей для выбора без повторов")
+
+        items = self.items
+        if np is not None and (rng is None or isinstance(rng, np.random.Generator)):
+            rows = self._sample_hands_np(hands, size, rng or _get_np_rng())
+            return [[items[i] for i in row] for row in rows]
+
+        rng = rng or random
+        weighted = [(1.0 / w, i) for i, w in enumerate(self.weights) if w > 0]
+        return [[items[i] for _, i in heapq.nlargest(size, ((rng.random() ** e, i) for e, i in weighted))]
+                for _ in range(hands)]
+
+    def positive_count(self) -> int:
+        """Количество записей с ненулевым весом"""
+        return self._positive
+
+    def _sample_indices_np(self, count: int, replace: bool, gen) -> List[int]:
+        if not replace:
+            p = np.asarray(self.weights, dtype=np.float64) / self.total
+            return gen.choice(self.size, size=count, replace=False, p=p).tolist()
+
+        if self._np_prob is None:
+            self._np_prob = np.asarray(self.prob, dtype=np.float64)
+            self._np_alias = np.asarray(self.alias, dtype=np.int64)
+        u = gen.random(count) * self.size
+        idx = np.minimum(u.astype(np.int64), self.size - 1)
+        accept = (u - idx) < self._np_prob[idx]
+        return np.where(accept, idx, self._np_alias[idx]).tolist()
+
+    def _sample_hands_np(self, hands: int, size: int, gen) -> List[List[int]]:
+        # Ключи Гумбеля log(w) + G для всей матрицы hands x n, в каждой строке
+        # берем size наибольших - то же распределение, что и без повторов
+        weights = np.asarray(self.weights, dtype=np.float64)
+        positive = np.flatnonzero(weights > 0)
+        keys = np.log(weights[positive]) + gen.gumbel(size=(hands, positive.size))
+        top = np.argpartition(-keys, size - 1, axis=1)[:, :size]
+        return positive[top].tolist()
+
+
+def new_seed() -> int:
+    """Новое 64-битное зерно для потока игры"""
+    return secrets.randbits(64)
+
+
+def _derive_seed(seed: int, path: Tuple) -> int:
+    """Детерминированно выводит зерно подпотока из корневого зерна и пути"""
+    digest = hashlib.blake2b(repr((seed,) + path).encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest, "big")
+
+
+class RngStream(random.Random):
+    """Воспроизводимый поток случайных чисел игры.
+
+    Поток с тем же зерном и путем всегда выдает ту же последовательность.
+    spawn(key) создает независимый подпоток (например, на игрока), который
+    можно отдать отдельному потоку или процессу: у каждого подпотока
+    собственное состояние, а сам объект сериализуется через pickle.
+    """
+
+    def __init__(self, seed: int = None, path: Tuple = ()):
+        self.root_seed = new_seed() if seed is None else int(seed)
+        self.path = tuple(path)
+        self._children: Dict = {}
+        super().__init__(_derive_seed(self.root_seed, self.path))
+
+    def spawn(self, key) -> "RngStream":
+        """Новый подпоток с начала последовательности"""
+        return RngStream(self.root_seed, self.path + (key,))
+
+    def substream(self, key) -> "RngStream":
+        """Подпоток по ключу, общий для всех вызовов с этим ключом"""
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self.spawn(key)
+        return child
+
+    def numpy(self):
+        """Независимый numpy.random.Generator с тем же происхождением"""
+        if np is None:
+            raise RuntimeError("NumPy не установлен")
+        return np.random.default_rng(_derive_seed(self.root_seed, self.path + ("numpy",)))
+
+    def __reduce__(self):
+        return self.__class__, (self.root_seed, self.path), self.getstate()
+
+
+class CardDeck:
+    """Колода без повторов для одной игры.
+
+    Хранит только массив индексов в общий каталог (без копий словарей).
+    Каждый вызов draw — один шаг тасования Фишера-Йетса, поэтому выбор
+    стоит O(1), а колода перетасовывается лениво по мере вытягивания.
+    Когда карты заканчиваются, колода начинается заново.
+    """
+
+    __slots__ = ("items", "order", "pos", "last", "reshuffles")
+
+    def __init__(self, items: List[Dict], weight_key: str = WEIGHT_KEY):
+        self.items = items
+        # Карточки с нулевым весом в колоду не попадают
+        indices = [i for i, item in enumerate(items)
+                   if not isinstance(item, dict) or float(item.get(weight_key, 1)) > 0]
+        self.order = array("I", indices)
+        self.pos = 0
+        self.last = -1
+        self.reshuffles = 0
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def remaining(self) -> int:
+        """Сколько карточек осталось до перетасовки"""
+        return len(self.order) - self.pos
+
+    def draw_index(self, rng: random.Random = None) -> int:
+        """Вытягивает индекс следующей карточки"""
+        order = self.order
+        n = len(order)
+        if n == 0:
+            raise ValueError("Колода пуста")
+
+        rng = rng or random
+        if self.pos >= n:
+            self.pos = 0
+            self.reshuffles += 1
+
+        pos = self.pos
+        j = pos + int(rng.random() * (n - pos))
+        if j >= n:
+            j = n - 1
+        # Сразу после перетасовки не повторяем последнюю вытянутую карточку:
+        # выбираем равномерно среди остальных n - 1 позиций, пропуская позицию last
+        if pos == 0 and n > 1 and order[j] == self.last:
+            k = int(rng.random() * (n - 1))
+            if k >= n - 1:
+                k = n - 2
+            j = k + 1 if k >= j else k
+        order[pos], order[j] = order[j], order[pos]
+        self.pos = pos + 1
+        self.last = order[pos]
+        return self.last
+
+    def draw(self, rng: random.Random = None) -> Dict:
+        """Вытягивает следующую карточку"""
+        return self.items[self.draw_index(rng)]
+
+    def draw_many(self, count: int, rng: random.Random = None) -> List[Dict]:
+        """Вытягивает count карточек подряд"""
+        return [self.draw(rng) for _ in range(count)]
+
+
+_np_rng = None
+
+
+def _get_np_rng():
+    """Общий генератор NumPy для пакетных выборов без явного rng"""
+    global _np_rng
+    if _np_rng is None:
+        _np_rng = np.random.default_rng()
+    return _np_rng
+
+
+# Сэмплеры, построенные по конкретному списку (список -> сэмплер).
+# DataManager отдает один и тот же объект списка, пока файл не изменился,
+# поэтому новый объект означает, что каталог перечитан и таблицы нужно перестроить.
+_samplers_by_data: Dict[int, Tuple[List, int, WeightedSampler]] = {}
+_MAX_CACHED_SAMPLERS = 16
+
+# Сэмплеры каталогов DataManager: ключ -> (версия каталога, сэмплер)
+_samplers_by_source: Dict[str, Tuple[int, WeightedSampler]] = {}
+
+
+def get_sampler(data: List[Dict]) -> WeightedSampler:
+    """Возвращает (и при необходимости строит) сэмплер для списка записей"""
+    entry = _samplers_by_data.get(id(data))
+    if entry and entry[0] is data and entry[1] == len(data):
+        return entry[2]
+
+    sampler = WeightedSampler(data)
+    if len(_samplers_by_data) >= _MAX_CACHED_SAMPLERS:
+        _samplers_by_data.pop(next(iter(_samplers_by_data)))
+    _samplers_by_data[id(data)] = (data, len(data), sampler)
+    return sampler
+
+
+def get_catalog_sampler(data_manager, source_key: str) -> Optional[WeightedSampler]:
+    """Сэмплер каталога DataManager; перестраивается только при смене версии"""
+    data = data_manager.get_data(source_key)
+    if not data:
+        return None
+
+    version = data_manager.get_version(source_key)
+    entry = _samplers_by_source.get(source_key)
+    if entry and entry[0] == version and entry[1].items is data:
+        return entry[1]
+
+    sampler = WeightedSampler(data)
+    _samplers_by_source[source_key] = (version, sampler)
+    return sampler
+
 
 def RandomCar(data):
     """Функция для выбора случайного автомобиля из данных"""
     try:
         # Проверяем что data - список и в нем есть элементы
         if data and isinstance(data, list) and len(data) > 0:
-            return random.choice(data)
+            return get_sampler(data).sample()
         return {}
     except:
         # Возвращаем пустой словарь при любой ошибке
         return {}
 
+def RandomCars(data, count: int, replace: bool = True, rng=None) -> List[Dict]:
+    """Пакетный выбор count автомобилей за один вызов"""
+    try:
+        if data and isinstance(data, list) and count > 0:
+            return get_sampler(data).sample_many(count, replace, rng)
+        return []
+    except Exception:
+        return []
+
 def RandomCard(data):
     """Функция для выбора случайной карточки из данных"""
     try:
         # Такая же простая логика как в RandomCar
         if data and isinstance(data, list) and len(data) > 0:
-            return random.choice(data)
+            return get_sampler(data).sample()
         return {}
     except:
-        return {}
\ No newline at end of file
+        return {}
+
+def RandomCards(data, count: int, replace: bool = True, rng=None) -> List[Dict]:
+    """Пакетный выбор count карточек за один вызов"""
+    try:
+        if data and isinstance(data, list) and count > 0:
+            return get_sampler(data).sample_many(count, replace, rng)
+        return []
+    except Exception:
+        return []
+
+def deal_to_participants(participants_id: List[int], cars, cards, hand_size: int = 1, rng=None) -> Dict[int, Dict]:
+    """Раздает всем участникам по машине и по hand_size карточек.
+
+    Все машины и все карточки выбираются двумя пакетными вызовами.
+    Внутри одной руки карточки не повторяются, если каталог позволяет.
+    """
+    result: Dict[int, Dict] = {uid: {"car": {}, "cards": []} for uid in participants_id}
+    if not participants_id:
+        return result
+
+    if cars:
+        for uid, car in zip(participants_id, RandomCars(cars, len(participants_id), rng=rng)):
+            result[uid]["car"] = car
+
+    if cards and hand_size > 0:
+        try:
+            sampler = get_sampler(cards)
+        except Exception:
+            return result
+        if hand_size <= sampler.positive_count():
+            hands = sampler.sample_hands(len(participants_id), hand_size, rng=rng)
+            for uid, hand in zip(participants_id, hands):
+                result[uid]["cards"] = hand
+        else:
+            drawn = sampler.sample_many(hand_size * len(participants_id), rng=rng)
+            for n, uid in enumerate(participants_id):
+                result[uid]["cards"] = drawn[n * hand_size:(n + 1) * hand_size]
+    return result
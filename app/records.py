@@ -0,0 +1,219 @@
+"""Компактные записи пользователей, комнат, игр и сетей.
+
+Записи хранят поля в __slots__, статус - целым кодом, время создания и
+завершения - значением time.monotonic(). Для UI, транспорта и архива каждая
+запись работает как словарь со старыми ключами: record["status"] вернет
+строку статуса, record["created_at"] - время "ЧЧ:ММ:СС", dict(record) и
+record.copy() - обычный dict. Внутри менеджеров поля читаются как атрибуты.
+"""
+
+import time
+from collections.abc import MutableMapping
+from datetime import datetime
+from operator import attrgetter
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOM_STATUSES = ("waiting", "started", "closed")
+ROOM_WAITING, ROOM_STARTED, ROOM_CLOSED = range(3)
+ACTIVE_STATUSES = ("waiting", "started")
+
+GAME_STATUSES = ("active", "ended")
+GAME_ACTIVE, GAME_ENDED = range(2)
+
+NETWORK_STATUSES = ("active", "closed")
+NETWORK_ACTIVE, NETWORK_CLOSED = range(2)
+
+# Сдвиг между time.monotonic() и настенным временем: для показа меток как "ЧЧ:ММ:СС"
+# и для перевода их в настенное время в снимках состояния
+WALL_OFFSET = time.time() - time.monotonic()
+
+
+def format_clock(timestamp: Optional[float]) -> Optional[str]:
+    """Монотонная метка времени в виде "ЧЧ:ММ:СС" (как прежнее поле created_at)"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp + WALL_OFFSET).strftime("%H:%M:%S")
+
+
+def _status_field(statuses: Tuple[str, ...]) -> Tuple[Callable, Callable]:
+    codes = {status: code for code, status in enumerate(statuses)}
+
+    def get(record):
+        return statuses[record.status_code]
+
+    def set_(record, value):
+        if value not in codes:
+            raise ValueError(f"Неизвестный статус: {value}")
+        record.status_code = codes[value]
+
+    return get, set_
+
+
+def _clock_field(attr: str) -> Tuple[Callable, None]:
+    read = attrgetter(attr)
+    return (lambda record: format_clock(read(record))), None
+
+
+class Record(MutableMapping):
+    """База записей: словарный доступ к фиксированному набору ключей.
+
+    KEYS - ключи словаря в прежнем порядке; OPTIONAL - ключи, которых нет
+    в словаре, пока значение None (как раньше отсутствовали seed и ended_at);
+    COMPUTED - ключи, вычисляемые из других полей: ключ -> (чтение, запись).
+    """
+
+    __slots__ = ()
+    KEYS: Tuple[str, ...] = ()
+    OPTIONAL: frozenset = frozenset()
+    COMPUTED: Dict[str, Tuple[Callable, Optional[Callable]]] = {}
+    _getters: Dict[str, Callable] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._getters = {key: cls.COMPUTED[key][0] if key in cls.COMPUTED else attrgetter(key) for key in cls.KEYS}
+
+    def __getitem__(self, key):
+        getter = self._getters.get(key)
+        if getter is None:
+            raise KeyError(key)
+        value = getter(self)
+        if value is None and key in self.OPTIONAL:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self._getters:
+            raise KeyError(f"У записи {type(self).__name__} нет поля {key}")
+        computed = self.COMPUTED.get(key)
+        if computed is None:
+            setattr(self, key, value)
+        elif computed[1] is not None:
+            computed[1](self, value)
+        else:
+            raise KeyError(f"Поле {key} вычисляется и не изменяется напрямую")
+
+    def __delitem__(self, key):
+        if key not in self.OPTIONAL:
+            raise KeyError(f"Поле {key} обязательно")
+        self[key] = None
+
+    def __iter__(self):
+        optional = self.OPTIONAL
+        for key, getter in self._getters.items():
+            if key not in optional or getter(self) is not None:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict:
+        optional = self.OPTIONAL
+        result = {}
+        for key, getter in self._getters.items():
+            value = getter(self)
+            if value is not None or key not in optional:
+                # Списки копируются: словарь не должен менять запись
+                result[key] = list(value) if type(value) is list else value
+        return result
+
+    def copy(self) -> Dict:
+        return self.to_dict()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class UserRecord(Record):
+    __slots__ = ("id", "name", "password")
+    KEYS = ("id", "name", "password")
+
+    def __init__(self, user_id: int, name: str, password: str):
+        self.id = user_id
+        self.name = name
+        self.password = password
+
+
+def _room_name(room: "RoomRecord") -> str:
+    # Имя по умолчанию не хранится в каждой записи, а строится из id
+    return room.name if room.name is not None else f"Комната {room.id_room}"
+
+
+def _set_room_name(room: "RoomRecord", value):
+    room.name = value
+
+
+class RoomRecord(Record):
+    __slots__ = ("id_room", "owner_id", "access", "password", "maxplayers", "name", "participants_id",
+                 "status_code", "created")
+    KEYS = ("id_room", "owner_id", "access", "password", "maxplayers", "name", "participants_id", "status",
+            "created_at")
+    COMPUTED = {
+        "name": (_room_name, _set_room_name),
+        "status": _status_field(ROOM_STATUSES),
+        "created_at": _clock_field("created"),
+    }
+
+    def __init__(self, room_id: int, owner_id: int, access: str, password: Optional[str], maxplayers: int,
+                 name: Optional[str] = None):
+        self.id_room = room_id
+        self.owner_id = owner_id
+        self.access = access
+        self.password = password
+        self.maxplayers = maxplayers
+        self.name = name
+        self.participants_id: List[int] = [owner_id]
+        self.status_code = ROOM_WAITING
+        self.created = time.monotonic()
+
+    @property
+    def status(self) -> str:
+        return ROOM_STATUSES[self.status_code]
+
+
+class GameRecord(Record):
+    __slots__ = ("id_game", "room_id", "owner_id", "participants_id", "created", "status_code", "seed", "ended")
+    KEYS = ("id_game", "room_id", "owner_id", "participants_id", "created_at", "status", "seed", "ended_at")
+    OPTIONAL = frozenset(("seed", "ended_at"))
+    COMPUTED = {
+        "created_at": _clock_field("created"),
+        "status": _status_field(GAME_STATUSES),
+        "ended_at": _clock_field("ended"),
+    }
+
+    def __init__(self, game_id: int, room_id: int, owner_id: int, participants_id: List[int], seed: int = None):
+        self.id_game = game_id
+        self.room_id = room_id
+        self.owner_id = owner_id
+        self.participants_id = participants_id
+        self.created = time.monotonic()
+        self.status_code = GAME_ACTIVE
+        self.seed = seed
+        self.ended: Optional[float] = None
+
+    @property
+    def status(self) -> str:
+        return GAME_STATUSES[self.status_code]
+
+
+class NetworkRecord(Record):
+    __slots__ = ("id", "name", "owner_id", "participants_id", "password", "status_code", "created",
+                 "max_participants")
+    KEYS = ("id", "name", "owner_id", "participants_id", "password", "status", "created_at", "max_participants")
+    COMPUTED = {
+        "status": _status_field(NETWORK_STATUSES),
+        "created_at": _clock_field("created"),
+    }
+
+    def __init__(self, network_id: int, name: str, owner_id: int, password: Optional[str], max_participants: int):
+        self.id = network_id
+        self.name = name
+        self.owner_id = owner_id
+        self.participants_id: List[int] = [owner_id]
+        self.password = password
+        self.status_code = NETWORK_ACTIVE
+        self.created = time.monotonic()
+        self.max_participants = max_participants
+
+    @property
+    def status(self) -> str:
+        return NETWORK_STATUSES[self.status_code]
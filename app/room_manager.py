@@ -1,38 +1,90 @@
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple, Union
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 
+from .archive import RecordArchive, RetentionQueue
 from .game_manager import GameManager
+from .log import fields
+from .records import ROOM_CLOSED, ROOM_STATUSES, ROOM_STARTED, ROOM_WAITING, RoomRecord
+
+log = logging.getLogger(__name__)
+
 
 class RoomManager:
-    def __init__(self):
-        self.rooms: List[Dict] = []
+    def __init__(self, archive: RecordArchive = None, retention_ttl: float = None, retention_max: int = None):
+        # Комнаты по id_room (порядок вставки = порядок создания)
+        self.rooms: Dict[int, RoomRecord] = {}
         self.next_room_id = 1
-
-    def _validate_room(self, room_id: int, check_active: bool = False) -> Tuple[Optional[Dict], Optional[str]]:
-        room = self.get_room_by_id(room_id)
-        if not room:
+        # Шаг выдачи id (при шардировании у каждого шарда свой остаток по модулю)
+        self.id_step = 1
+        # Индексы: владелец -> id активной комнаты, код статуса -> id комнат.
+        # Участники хранятся только списком в записи: он ограничен maxplayers
+        self._active_by_owner: Dict[int, int] = {}
+        self._ids_by_status: List[Set[int]] = [set() for _ in ROOM_STATUSES]
+        # Закрытые комнаты уходят в архив по TTL или по количеству (если архив задан)
+        self.archive = archive
+        self._retention = RetentionQueue(retention_ttl, retention_max)
+        # Журнал предзаписи изменений (WriteAheadLog), если задан
+        self.journal = None
+
+    def _validate_room(self, room_id: int, check_active: bool = False) -> Tuple[Optional[RoomRecord], Optional[str]]:
+        room = self.rooms.get(room_id)
+        if room is None:
             return None, "Комната не найдена"
 
         # Для присоединения допускаем только комнаты в статусе "waiting"
-        if check_active and room["status"] != "waiting":
+        if check_active and room.status_code != ROOM_WAITING:
             return None, "Комната недоступна для присоединения"
 
         return room, None
 
-    def room_list(self) -> List[Dict]:
-        return self.rooms
-
-    def get_active_rooms(self) -> List[Dict]:
+    def _set_status(self, room: RoomRecord, status_code: int):
+        """Меняет статус комнаты и обновляет индексы"""
+        room_id = room.id_room
+        self._ids_by_status[room.status_code].discard(room_id)
+        self._ids_by_status[status_code].add(room_id)
+        room.status_code = status_code
+
+        if status_code != ROOM_CLOSED:
+            self._active_by_owner[room.owner_id] = room_id
+        elif self._active_by_owner.get(room.owner_id) == room_id:
+            del self._active_by_owner[room.owner_id]
+
+    def set_room_status(self, room_id: int, status: str) -> bool:
+        room = self.rooms.get(room_id)
+        if room is None or status not in ROOM_STATUSES:
+            return False
+        self._set_status(room, ROOM_STATUSES.index(status))
+        return True
+
+    def room_list(self) -> List[RoomRecord]:
+        return list(self.rooms.values())
+
+    def get_rooms_by_status(self, status: str) -> List[RoomRecord]:
+        if status not in ROOM_STATUSES:
+            return []
+        ids = self._ids_by_status[ROOM_STATUSES.index(status)]
+        return [self.rooms[room_id] for room_id in sorted(ids)]
+
+    def get_active_rooms(self) -> List[RoomRecord]:
         # Отображаем все комнаты, которые не закрыты
-        return [room for room in self.rooms if room["status"] in ["waiting", "started"]]
+        ids = self._ids_by_status[ROOM_WAITING] | self._ids_by_status[ROOM_STARTED]
+        return [self.rooms[room_id] for room_id in sorted(ids)]
+
+    def count_active_rooms(self) -> int:
+        return len(self._ids_by_status[ROOM_WAITING]) + len(self._ids_by_status[ROOM_STARTED])
+
+    def get_active_room_by_owner(self, owner_id: int) -> Optional[RoomRecord]:
+        room_id = self._active_by_owner.get(owner_id)
+        return self.rooms.get(room_id) if room_id is not None else None
+
+    def get_room_by_id(self, room_id: int) -> Optional[RoomRecord]:
+        return self.rooms.get(room_id)
 
-    def get_room_by_id(self, room_id: int) -> Optional[Dict]:
-        for room in self.rooms:
-            if room["id_room"] == room_id:
-                return room
-        return None
+    def is_participant(self, room_id: int, user_id: int) -> bool:
+        room = self.rooms.get(room_id)
+        return room is not None and user_id in room.participants_id
 
-    def room_create(self, owner_id: int, access: str, password: str = None, maxplayers: int = 2, name: str = None) -> Optional[Dict]:
+    def room_create(self, owner_id: int, access: str, password: str = None, maxplayers: int = 2, name: str = None) -> Optional[RoomRecord]:
         if access not in ["private", "public"]:
             return None
 
@@ -43,29 +95,26 @@ class RoomManager:
             return None
 
         # Один владелец не может иметь больше одной активной комнаты
-        for room in self.rooms:
-            if room.get("owner_id") == owner_id and room.get("status") in ["waiting", "started"]:
-                print(f"Пользователь {owner_id} уже имеет активную комнату #{room.get('id_room')}")
-                return None
-
-        room_name = name.strip() if isinstance(name, str) and name.strip() else f"Комната {self.next_room_id}"
-
-        room = {
-            "id_room": self.next_room_id,
-            "owner_id": owner_id,
-            "access": access,
-            "password": password,
-            "maxplayers": maxplayers,
-            "name": room_name,
-            "participants_id": [owner_id],
-            "status": "waiting",
-            "created_at": datetime.now().strftime("%H:%M:%S"),
-        }
-
-        self.rooms.append(room)
-        self.next_room_id += 1
-
-        print(f"Создана новая комната: id={room['id_room']}, access={room['access']}, maxplayers={room['maxplayers']}, name={room['name']}")
+        active_id = self._active_by_owner.get(owner_id)
+        if active_id is not None:
+            log.info("Пользователь %s уже имеет активную комнату #%s", owner_id, active_id)
+            return None
+
+        # Без имени запись хранит None, а "Комната <id>" строится при чтении
+        room_name = name.strip() if isinstance(name, str) and name.strip() else None
+        room = RoomRecord(self.next_room_id, owner_id, access, password, maxplayers, room_name)
+
+        room_id = room.id_room
+        self.rooms[room_id] = room
+        self._ids_by_status[ROOM_WAITING].add(room_id)
+        self._active_by_owner[owner_id] = room_id
+        self.next_room_id += self.id_step
+        if self.journal is not None:
+            self.journal.append("room_create", owner_id, access, password, maxplayers, room_name)
+
+        if log.isEnabledFor(logging.INFO):
+            log.info("Создана новая комната: id=%s, access=%s, maxplayers=%s, name=%s", room_id, access, maxplayers,
+                     room["name"], extra=fields(room_id=room_id, user_id=owner_id))
 
         return room
 
@@ -74,11 +123,16 @@ class RoomManager:
 
         if err:
             return False, err
-        if room["owner_id"] != user_id:
+        if room.owner_id != user_id:
             return False, "Закрывать комнату может только владелец"
-        if room["status"] == "closed":
+        if room.status_code == ROOM_CLOSED:
             return False, "Комната уже закрыта"
-        room["status"] = "closed"
+        self._set_status(room, ROOM_CLOSED)
+        if self.journal is not None:
+            self.journal.append("room_end", room_id, user_id)
+        if self.archive is not None:
+            self._retention.push(room_id)
+            self.archive_closed_rooms()
         return True, f"Комната #{room_id} закрыта"
 
     def room_join(self, room_id: int, user_id: int, password: str = None) -> Tuple[bool, str]:
@@ -87,19 +141,24 @@ class RoomManager:
         if err:
             return False, err
 
-        if room["access"] == "private":
+        if room.access == "private":
             if not password:
                 return False, "Для этой комнаты требуется пароль"
-            if password != room["password"]:
+            if password != room.password:
                 return False, "Неверный пароль"
 
-        if user_id in room["participants_id"]:
+        # Поиск по списку: участников не больше maxplayers, а множество рядом
+        # удвоило бы память на комнату
+        members = room.participants_id
+        if user_id in members:
             return False, "Пользователь уже в комнате"
 
-        if len(room["participants_id"]) >= room["maxplayers"]:
+        if len(members) >= room.maxplayers:
             return False, "Комната переполнена"
 
-        room["participants_id"].append(user_id)
+        members.append(user_id)
+        if self.journal is not None:
+            self.journal.append("room_join", room_id, user_id, password)
 
         return True, f"Пользователь {user_id} присоединился к комнате #{room_id}"
 
@@ -109,13 +168,16 @@ class RoomManager:
         if err:
             return False, err
 
-        if user_id == room["owner_id"]:
+        if user_id == room.owner_id:
             return False, "Владелец не может покинуть свою комнату (закройте ее)"
 
-        if user_id not in room["participants_id"]:
+        members = room.participants_id
+        if user_id not in members:
             return False, "Пользователь не в комнате"
 
-        room["participants_id"].remove(user_id)
+        members.remove(user_id)
+        if self.journal is not None:
+            self.journal.append("room_leave", room_id, user_id)
 
         return True, f"Пользователь {user_id} покинул комнату #{room_id}"
 
@@ -125,7 +187,7 @@ class RoomManager:
         if err:
             return False, err
 
-        return True, room["participants_id"]
+        return True, room.participants_id
 
     def delete_room(self, room_id: int, user_id: int) -> Tuple[bool, str]:
         room, err = self._validate_room(room_id)
@@ -133,10 +195,16 @@ class RoomManager:
         if err:
             return False, err
 
-        if room["owner_id"] != user_id:
+        if room.owner_id != user_id:
             return False, "Удалять комнату может только владелец"
 
-        self.rooms = [r for r in self.rooms if r["id_room"] != room_id]
+        del self.rooms[room_id]
+        if self.journal is not None:
+            self.journal.append("delete_room", room_id, user_id)
+        self._retention.discard(room_id)
+        self._ids_by_status[room.status_code].discard(room_id)
+        if self._active_by_owner.get(room.owner_id) == room_id:
+            del self._active_by_owner[room.owner_id]
 
         return True, f"Комната #{room_id} удалена"
 
@@ -144,6 +212,47 @@ class RoomManager:
         room, err = self._validate_room(room_id)
 
         if err:
+            # Закрытая комната могла уже уйти в архив
+            archived = self.get_archived_room(room_id)
+            if archived:
+                return True, archived
             return False, err
 
-        return True, room.copy()
\ No newline at end of file
+        return True, room.copy()
+
+    def get_archived_room(self, room_id: int) -> Optional[Dict]:
+        if self.archive is None:
+            return None
+        return self.archive.get(room_id)
+
+    def archive_closed_rooms(self, now: float = None) -> int:
+        """Переносит в архив закрытые комнаты, вышедшие за пределы хранения."""
+        if self.archive is None:
+            return 0
+
+        records = []
+        for room_id in self._retention.pop_expired(now):
+            room = self.rooms.pop(room_id, None)
+            if room is None:
+                continue
+            self._ids_by_status[ROOM_CLOSED].discard(room_id)
+            records.append(room.to_dict())
+
+        self.archive.extend(records)
+        return len(records)
+
+    def dump_state(self) -> Tuple[List[RoomRecord], int, List[Tuple[int, float]]]:
+        """Комнаты, следующий id и очередь на архивацию - для снимка состояния"""
+        return list(self.rooms.values()), self.next_room_id, self._retention.entries()
+
+    def load_state(self, rooms: Iterable[RoomRecord], next_room_id: int, retained: Iterable[Tuple[int, float]] = ()):
+        """Заменяет комнаты восстановленными из снимка и перестраивает индексы"""
+        self.rooms = {room.id_room: room for room in rooms}
+        self.next_room_id = next_room_id
+        self._ids_by_status = [set() for _ in ROOM_STATUSES]
+        self._active_by_owner = {}
+        for room_id, room in self.rooms.items():
+            self._ids_by_status[room.status_code].add(room_id)
+            if room.status_code != ROOM_CLOSED:
+                self._active_by_owner[room.owner_id] = room_id
+        self._retention.load(retained)
\ No newline at end of file
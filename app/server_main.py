@@ -0,0 +1,200 @@
+"""Выделенный сервер без графического интерфейса.
+
+Модуль не импортирует customtkinter и UI-модули приложения: в него
+попадают только GameServerSystem, транспорт и их зависимости.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import signal
+from typing import Dict, List, Optional
+
+from .log import LOG_FORMATS, configure_logging, parse_levels
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONFIG: Dict = {
+    "host": "0.0.0.0",
+    "port": 8765,
+    "backlog": 1024,
+    # Лимиты
+    "max_connections": None,
+    "max_participants": 10,
+    "max_queue": 256,
+    "slow_policy": "drop_oldest",
+    "coalesce_window": None,
+    # Хранение закрытых комнат и завершенных игр
+    "archive_dir": None,
+    "retention_ttl": None,
+    "retention_max": None,
+    # Снимки состояния: каталог (None - выключены) и период сохранения в секундах
+    # (None - только при остановке)
+    "snapshot_dir": None,
+    "snapshot_interval": None,
+    # Журнал изменений пользователей, комнат и игр поверх снимков (нужен snapshot_dir)
+    "wal": False,
+    # Файл SQLite с пользователями (None - пользователи только в памяти и в снимках)
+    "user_db": None,
+    # Стоимость scrypt (log2 n) и число потоков хеширования паролей (None - по числу ядер, не больше 4)
+    "password_cost": 14,
+    "password_workers": None,
+    # Через сколько секунд без heartbeat подключение снимается (None - никогда)
+    "idle_timeout": 60.0,
+    # Шардирование (1 - один процесс) и внутренний адрес процессов-шардов
+    "shards": 1,
+    "shard_host": "127.0.0.1",
+    # HTTP-порт текстовой выгрузки метрик (None - выключена; только без шардирования)
+    "metrics_port": None,
+    # Журнал: общий уровень, уровни модулей ("app.network=DEBUG,...") и формат plain/text/json
+    "log_level": "INFO",
+    "log_levels": "",
+    "log_format": "text",
+}
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Выделенный сервер CarRoulette без UI")
+    parser.add_argument("--config", help="JSON-файл с настройками (ключи как в DEFAULT_CONFIG)")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--backlog", type=int)
+    parser.add_argument("--max-connections", type=int)
+    parser.add_argument("--max-participants", type=int)
+    parser.add_argument("--max-queue", type=int)
+    parser.add_argument("--slow-policy", choices=("drop_new", "drop_oldest", "disconnect"))
+    parser.add_argument("--coalesce-window", type=float)
+    parser.add_argument("--archive-dir")
+    parser.add_argument("--retention-ttl", type=float)
+    parser.add_argument("--retention-max", type=int)
+    parser.add_argument("--snapshot-dir")
+    parser.add_argument("--snapshot-interval", type=float)
+    parser.add_argument("--wal", action="store_true", default=None, help="вести журнал изменений (нужен --snapshot-dir)")
+    parser.add_argument("--user-db", help="файл SQLite с пользователями")
+    parser.add_argument("--password-cost", type=int, help="log2 параметра n для scrypt")
+    parser.add_argument("--password-workers", type=int)
+    parser.add_argument("--idle-timeout", type=float, help="секунд без heartbeat до снятия подключения")
+    parser.add_argument("--shards", type=int)
+    parser.add_argument("--shard-host", help="внутренний адрес шардов (по умолчанию 127.0.0.1)")
+    parser.add_argument("--metrics-port", type=int)
+    parser.add_argument("--log-level")
+    parser.add_argument("--log-levels", help="уровни модулей: app.network=DEBUG,app.user_manager=WARNING")
+    parser.add_argument("--log-format", choices=LOG_FORMATS)
+    return parser
+
+
+def load_config(argv: Optional[List[str]] = None) -> Dict:
+    """Настройки: значения по умолчанию, затем файл --config, затем аргументы"""
+    args = build_arg_parser().parse_args(argv)
+    config = dict(DEFAULT_CONFIG)
+
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as file:
+            from_file = json.load(file)
+        unknown = set(from_file) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Неизвестные ключи в конфигурации: {', '.join(sorted(unknown))}")
+        config.update(from_file)
+
+    for key, value in vars(args).items():
+        if key != "config" and value is not None:
+            config[key] = value
+    return config
+
+
+def _system_options(config: Dict) -> Dict:
+    return {
+        "archive_dir": config["archive_dir"],
+        "retention_ttl": config["retention_ttl"],
+        "retention_max": config["retention_max"],
+        "max_participants": config["max_participants"],
+        "snapshot_dir": config["snapshot_dir"],
+        "snapshot_interval": config["snapshot_interval"],
+        "wal": config["wal"],
+        "user_db": config["user_db"],
+        "password_cost": config["password_cost"],
+        "password_workers": config["password_workers"],
+        "idle_timeout": config["idle_timeout"],
+        "coalesce_window": config["coalesce_window"],
+    }
+
+
+def _transport_options(config: Dict) -> Dict:
+    return {
+        "backlog": config["backlog"],
+        "max_queue": config["max_queue"],
+        "slow_policy": config["slow_policy"],
+        "max_connections": config["max_connections"],
+    }
+
+
+def _log_options(config: Dict) -> Dict:
+    levels = config["log_levels"]
+    return {
+        "level": config["log_level"],
+        "module_levels": parse_levels(levels) if isinstance(levels, str) else dict(levels),
+        "fmt": config["log_format"],
+    }
+
+
+async def serve(config: Dict):
+    """Запускает сервер и работает до SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    if config["shards"] > 1:
+        if config["metrics_port"] is not None:
+            log.warning("Выгрузка метрик в шардированном режиме не поддерживается")
+        from .network.sharding import ShardRouter
+
+        router = ShardRouter(config["shards"], config["host"], config["port"], config["backlog"],
+                             system_options=_system_options(config),
+                             transport_options=_transport_options(config), log_options=_log_options(config),
+                             shard_host=config["shard_host"])
+        await router.start()
+        try:
+            await stop.wait()
+        finally:
+            await router.stop()
+        return
+
+    from .network.game_server_system import GameServerSystem
+    from .network.transport import TransportServer
+
+    system = GameServerSystem(**_system_options(config))
+    transport = TransportServer(system.server, host=config["host"], port=config["port"],
+                                game_manager=system.game_manager, journal=system.journal,
+                                **_transport_options(config))
+    await transport.start()
+    snapshots = asyncio.ensure_future(system.snapshot_loop())
+    reaper = asyncio.ensure_future(system.reaper_loop())
+    metrics_server = None
+    if config["metrics_port"] is not None:
+        from .metrics import start_metrics_server
+
+        metrics_server = await start_metrics_server(system.metrics, config["host"], config["metrics_port"])
+    try:
+        await stop.wait()
+    finally:
+        snapshots.cancel()
+        reaper.cancel()
+        if metrics_server is not None:
+            metrics_server.close()
+        await transport.stop()
+        system.shutdown_system()
+
+
+def main(argv: Optional[List[str]] = None):
+    config = load_config(argv)
+    configure_logging(**_log_options(config))
+    asyncio.run(serve(config))
+
+
+if __name__ == "__main__":
+    main()
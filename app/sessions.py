@@ -0,0 +1,85 @@
+"""Токены сессий: повторный вход без проверки пароля.
+
+SessionTokens хранит токены пользователей UserManager в компактном
+кольцевом буфере.
+"""
+
+import base64
+import hmac
+import secrets
+import struct
+import time
+from array import array
+from typing import Optional
+
+_SLOT = struct.Struct(">I")
+_SECRET_SIZE = 16
+
+
+class SessionTokens:
+    """Токены сессий пользователей: кольцевой буфер из capacity ячеек.
+
+    Токен - номер ячейки и 16 случайных байт (base64url, 27 символов). В
+    ячейке лежат id пользователя, срок действия и случайная часть токена:
+    три массива, около 32 байт на ячейку, без объекта на каждую сессию.
+    Проверка токена - разбор номера ячейки и одно сравнение. Срок жизни
+    у всех токенов одинаковый, поэтому новый токен занимает ячейку самого
+    старого; если за ttl выдано больше capacity токенов, старейшие
+    перестают действовать раньше срока.
+
+    Массивы растут по мере выдачи токенов до capacity ячеек: менеджер,
+    который не выдал ни одного токена (UI, бенчмарки), памяти под буфер
+    не занимает.
+    """
+
+    def __init__(self, ttl: float = 300.0, capacity: int = 1 << 16):
+        self.ttl = ttl
+        self.capacity = capacity
+        self._user_ids = array("q")
+        self._expires = array("d")
+        self._secrets = bytearray()
+        self._next = 0
+
+    def issue(self, user_id: int) -> str:
+        slot = self._next
+        self._next = (slot + 1) % self.capacity
+        secret = secrets.token_bytes(_SECRET_SIZE)
+        expires = time.monotonic() + self.ttl
+        if slot == len(self._user_ids):
+            # Буфер еще не заполнен: ячейка дописывается в конец
+            self._user_ids.append(user_id)
+            self._expires.append(expires)
+            self._secrets += secret
+        else:
+            self._user_ids[slot] = user_id
+            self._expires[slot] = expires
+            self._secrets[slot * _SECRET_SIZE:(slot + 1) * _SECRET_SIZE] = secret
+        return base64.urlsafe_b64encode(_SLOT.pack(slot) + secret).rstrip(b"=").decode("ascii")
+
+    def _slot(self, token: str) -> Optional[int]:
+        """Ячейка действующего токена"""
+        if not isinstance(token, str) or len(token) != 27:
+            return None
+        try:
+            raw = base64.b64decode(token + "=", altchars=b"-_", validate=True)
+        except ValueError:
+            return None
+        if len(raw) != _SLOT.size + _SECRET_SIZE:
+            return None
+        (slot,) = _SLOT.unpack_from(raw)
+        if slot >= len(self._expires) or self._expires[slot] <= time.monotonic():
+            return None
+        stored = self._secrets[slot * _SECRET_SIZE:(slot + 1) * _SECRET_SIZE]
+        return slot if hmac.compare_digest(stored, raw[_SLOT.size:]) else None
+
+    def resolve(self, token: str) -> Optional[int]:
+        """id пользователя по действующему токену"""
+        slot = self._slot(token)
+        return self._user_ids[slot] if slot is not None else None
+
+    def revoke(self, token: str) -> bool:
+        slot = self._slot(token)
+        if slot is None:
+            return False
+        self._expires[slot] = 0.0
+        return True
@@ -0,0 +1,434 @@
+"""Снимки состояния GameServerSystem: пользователи, комнаты, игры и сети.
+
+Снимок - бинарный файл из колонок: одно поле всех записей одного типа
+хранится подряд (числа - массивом array, строки - одной строкой UTF-8
+и массивом длин). Колонка читается одним вызовом, без разбора записи
+за записью, поэтому миллион комнат восстанавливается за секунды.
+
+Файл пишется атомарно: во временный файл рядом, fsync и os.replace,
+так что после сбоя на диске остается прежний целый снимок. В потоке
+цикла событий поля только копируются в колонки; кодирование и запись
+на диск в save_async идут в отдельном потоке.
+
+Монотонные метки времени при записи переводятся в настенное время и
+обратно при чтении: time.monotonic() не переживает перезапуск. Колоды
+игр не сохраняются, потоки случайных чисел восстанавливаются по зерну.
+"""
+
+import asyncio
+import gc
+import logging
+import math
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from itertools import accumulate, chain
+from typing import List, Optional, Sequence, Tuple
+
+from .records import WALL_OFFSET, GameRecord, NetworkRecord, RoomRecord, UserRecord
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"CRSNAP"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FILE = "state.snap"
+
+# Заголовок: сигнатура, версия, порядок байт колонок (0 - little, 1 - big), шард, число шардов
+# и первый сегмент журнала, не вошедший в снимок (с версии 2)
+_PREFIX = struct.Struct(">6sH")
+_HEADER_V1 = struct.Struct(">6sHBII")
+_HEADER = struct.Struct(">6sHBIIQ")
+_U32 = struct.Struct(">I")
+_U64 = struct.Struct(">Q")
+_LITTLE, _BIG = 0, 1
+_NATIVE_ORDER = _LITTLE if sys.byteorder == "little" else _BIG
+
+
+class SnapshotError(ValueError):
+    """Файл снимка поврежден или не подходит этому серверу"""
+
+
+# --- Запись колонок -----------------------------------------------------------
+
+
+def _put_u64(out: bytearray, value: int):
+    out += _U64.pack(value)
+
+
+def _put_bytes(out: bytearray, data: bytes):
+    out += _U64.pack(len(data))
+    out += data
+
+
+def _put_array(out: bytearray, typecode: str, values):
+    _put_bytes(out, array(typecode, values).tobytes())
+
+
+def _put_strings(out: bytearray, values: Sequence[Optional[str]]):
+    # Длины в символах и строки одним блоком UTF-8; None пишутся пустыми, их позиции - отдельно
+    _put_array(out, "q", [0 if value is None else len(value) for value in values])
+    _put_bytes(out, "".join([value for value in values if value is not None]).encode("utf-8"))
+    _put_array(out, "q", [index for index, value in enumerate(values) if value is None])
+
+
+def _put_times(out: bytearray, values: Sequence[Optional[float]]):
+    # Монотонное время -> настенное, None -> NaN
+    _put_array(out, "d", [math.nan if value is None else value + WALL_OFFSET for value in values])
+
+
+class _Columns:
+    """Колонки снимка, скопированные из записей.
+
+    Копирование идет в цикле событий и дает согласованный срез состояния;
+    перевод колонок в байты (encode) можно отдать другому потоку.
+    """
+
+    __slots__ = ("header", "_writes")
+
+    def __init__(self, header: bytes):
+        self.header = header
+        self._writes: List[Tuple] = []
+
+    def add(self, write, *args):
+        self._writes.append((write, args))
+
+    def id_lists(self, lists: Sequence[List[int]]):
+        # Списки участников изменяемые, поэтому копируются сразу, одним плоским списком
+        self.add(_put_array, "q", [len(ids) for ids in lists])
+        self.add(_put_array, "q", list(chain.from_iterable(lists)))
+
+    def retention(self, entries: List[Tuple[int, float]]):
+        self.add(_put_array, "q", [record_id for record_id, _ in entries])
+        self.add(_put_times, [closed_at for _, closed_at in entries])
+
+    def encode(self) -> bytes:
+        out = bytearray(self.header)
+        for write, args in self._writes:
+            write(out, *args)
+        out += _U32.pack(zlib.crc32(out))
+        return bytes(out)
+
+
+# --- Чтение колонок -----------------------------------------------------------
+
+
+class _Reader:
+    __slots__ = ("buf", "pos", "swap")
+
+    def __init__(self, buf: memoryview, pos: int, swap: bool):
+        self.buf = buf
+        self.pos = pos
+        self.swap = swap
+
+    def u64(self) -> int:
+        value = _U64.unpack_from(self.buf, self.pos)[0]
+        self.pos += _U64.size
+        return value
+
+    def bytes(self) -> memoryview:
+        length = self.u64()
+        end = self.pos + length
+        if end > len(self.buf):
+            raise SnapshotError("Снимок обрезан")
+        data = self.buf[self.pos:end]
+        self.pos = end
+        return data
+
+    def array(self, typecode: str) -> array:
+        values = array(typecode)
+        values.frombytes(self.bytes())
+        if self.swap:
+            values.byteswap()
+        return values
+
+    def strings(self) -> List[Optional[str]]:
+        ends = list(accumulate(self.array("q")))
+        text = str(self.bytes(), "utf-8")
+        result: List[Optional[str]] = [text[start:end] for start, end in zip(chain((0,), ends), ends)]
+        for index in self.array("q"):
+            result[index] = None
+        return result
+
+    def id_lists(self) -> List[List[int]]:
+        counts = self.array("q")
+        flat = self.array("q")
+        result = []
+        append = result.append
+        pos = 0
+        for count in counts:
+            append(flat[pos:pos + count].tolist())
+            pos += count
+        return result
+
+    def retention(self) -> List[Tuple[int, float]]:
+        ids = self.array("q")
+        return list(zip(ids, (closed_at - WALL_OFFSET for closed_at in self.array("d"))))
+
+
+# --- Секции -------------------------------------------------------------------
+
+
+def _collect_users(columns: _Columns, users: List[UserRecord], next_id: int):
+    columns.add(_put_u64, next_id)
+    columns.add(_put_array, "q", [user.id for user in users])
+    columns.add(_put_strings, [user.name for user in users])
+    columns.add(_put_strings, [user.password for user in users])
+
+
+def _read_users(reader: _Reader) -> Tuple[List[UserRecord], int]:
+    next_id = reader.u64()
+    ids = reader.array("q")
+    names = reader.strings()
+    passwords = reader.strings()
+    return list(map(UserRecord, ids, names, passwords)), next_id
+
+
+def _collect_rooms(columns: _Columns, rooms: List[RoomRecord], next_id: int, retained: List[Tuple[int, float]]):
+    columns.add(_put_u64, next_id)
+    columns.add(_put_array, "q", [room.id_room for room in rooms])
+    columns.add(_put_array, "q", [room.owner_id for room in rooms])
+    columns.add(_put_strings, [room.access for room in rooms])
+    columns.add(_put_strings, [room.password for room in rooms])
+    columns.add(_put_array, "q", [room.maxplayers for room in rooms])
+    columns.add(_put_strings, [room.name for room in rooms])
+    columns.id_lists([room.participants_id for room in rooms])
+    columns.add(_put_array, "B", [room.status_code for room in rooms])
+    columns.add(_put_times, [room.created for room in rooms])
+    columns.retention(retained)
+
+
+def _read_rooms(reader: _Reader) -> Tuple[List[RoomRecord], int, List[Tuple[int, float]]]:
+    next_id = reader.u64()
+    columns = (reader.array("q"), reader.array("q"), reader.strings(), reader.strings(), reader.array("q"),
+               reader.strings(), reader.id_lists(), reader.array("B"), reader.array("d"))
+    rooms = []
+    append = rooms.append
+    for room_id, owner_id, access, password, maxplayers, name, participants, status, created in zip(*columns):
+        room = RoomRecord(room_id, owner_id, access, password, maxplayers, name)
+        room.participants_id = participants
+        room.status_code = status
+        room.created = created - WALL_OFFSET
+        append(room)
+    return rooms, next_id, reader.retention()
+
+
+def _collect_games(columns: _Columns, games: List[GameRecord], next_id: int, retained: List[Tuple[int, float]]):
+    columns.add(_put_u64, next_id)
+    columns.add(_put_array, "q", [game.id_game for game in games])
+    columns.add(_put_array, "q", [game.room_id for game in games])
+    columns.add(_put_array, "q", [game.owner_id for game in games])
+    columns.id_lists([game.participants_id for game in games])
+    columns.add(_put_array, "B", [game.status_code for game in games])
+    columns.add(_put_times, [game.created for game in games])
+    # Зерно 64-битное без запасного значения, поэтому наличие зерна - отдельная колонка
+    columns.add(_put_array, "B", [game.seed is not None for game in games])
+    columns.add(_put_array, "Q", [game.seed or 0 for game in games])
+    columns.add(_put_times, [game.ended for game in games])
+    columns.retention(retained)
+
+
+def _read_games(reader: _Reader) -> Tuple[List[GameRecord], int, List[Tuple[int, float]]]:
+    next_id = reader.u64()
+    columns = (reader.array("q"), reader.array("q"), reader.array("q"), reader.id_lists(), reader.array("B"),
+               reader.array("d"), reader.array("B"), reader.array("Q"), reader.array("d"))
+    games = []
+    append = games.append
+    for game_id, room_id, owner_id, participants, status, created, has_seed, seed, ended in zip(*columns):
+        game = GameRecord(game_id, room_id, owner_id, participants, seed if has_seed else None)
+        game.status_code = status
+        game.created = created - WALL_OFFSET
+        game.ended = None if math.isnan(ended) else ended - WALL_OFFSET
+        append(game)
+    return games, next_id, reader.retention()
+
+
+def _collect_networks(columns: _Columns, networks: List[NetworkRecord], next_id: int):
+    columns.add(_put_u64, next_id)
+    columns.add(_put_array, "q", [network.id for network in networks])
+    columns.add(_put_strings, [network.name for network in networks])
+    columns.add(_put_array, "q", [network.owner_id for network in networks])
+    columns.add(_put_strings, [network.password for network in networks])
+    columns.add(_put_array, "q", [network.max_participants for network in networks])
+    columns.id_lists([network.participants_id for network in networks])
+    columns.add(_put_array, "B", [network.status_code for network in networks])
+    columns.add(_put_times, [network.created for network in networks])
+
+
+def _read_networks(reader: _Reader) -> Tuple[List[NetworkRecord], int]:
+    next_id = reader.u64()
+    columns = (reader.array("q"), reader.strings(), reader.array("q"), reader.strings(), reader.array("q"),
+               reader.id_lists(), reader.array("B"), reader.array("d"))
+    networks = []
+    append = networks.append
+    for network_id, name, owner_id, password, max_participants, participants, status, created in zip(*columns):
+        network = NetworkRecord(network_id, name, owner_id, password, max_participants)
+        network.participants_id = participants
+        network.status_code = status
+        network.created = created - WALL_OFFSET
+        append(network)
+    return networks, next_id
+
+
+# --- Снимок целиком -----------------------------------------------------------
+
+
+def collect_snapshot(system, journal_segment: int = 0) -> _Columns:
+    """Копирует состояние GameServerSystem в колонки (в потоке цикла событий)"""
+    columns = _Columns(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, _NATIVE_ORDER,
+                                    system.shard_index, system.shard_count, journal_segment))
+    _collect_users(columns, *system.user_manager.dump_state())
+    _collect_rooms(columns, *system.room_manager.dump_state())
+    _collect_games(columns, *system.game_manager.dump_state())
+    _collect_networks(columns, *system.server.dump_state())
+    return columns
+
+
+def encode_snapshot(system) -> bytes:
+    """Состояние GameServerSystem в байтах снимка"""
+    return collect_snapshot(system).encode()
+
+
+def decode_snapshot(data: bytes, system) -> int:
+    """Заменяет состояние менеджеров GameServerSystem содержимым снимка.
+
+    Возвращает номер первого сегмента журнала, который нужно повторить поверх снимка.
+    """
+    if len(data) < _HEADER.size + _U32.size:
+        raise SnapshotError("Снимок обрезан")
+    body = memoryview(data)[:-_U32.size]
+    if zlib.crc32(body) != _U32.unpack_from(data, len(body))[0]:
+        raise SnapshotError("Контрольная сумма снимка не совпадает")
+
+    magic, version = _PREFIX.unpack_from(body)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError("Файл не является снимком состояния")
+    if version == 1:
+        header = _HEADER_V1
+        _, _, order, shard_index, shard_count = header.unpack_from(body)
+        journal_segment = 0
+    elif version == SNAPSHOT_VERSION:
+        header = _HEADER
+        _, _, order, shard_index, shard_count, journal_segment = header.unpack_from(body)
+    else:
+        raise SnapshotError(f"Неподдерживаемая версия снимка: {version}")
+    # От шарда и числа шардов зависит выдача id: чужой снимок дал бы повторные id
+    if (shard_index, shard_count) != (system.shard_index, system.shard_count):
+        raise SnapshotError(f"Снимок шарда {shard_index} из {shard_count}, "
+                            f"а сервер - шард {system.shard_index} из {system.shard_count}")
+
+    reader = _Reader(body, header.size, order != _NATIVE_ORDER)
+    users = _read_users(reader)
+    rooms = _read_rooms(reader)
+    games = _read_games(reader)
+    networks = _read_networks(reader)
+    if reader.pos != len(body):
+        raise SnapshotError("Лишние данные в конце снимка")
+
+    system.user_manager.load_state(*users)
+    system.room_manager.load_state(*rooms)
+    system.game_manager.load_state(*games)
+    system.server.load_state(*networks)
+    return journal_segment
+
+
+def write_atomic(path: str, data: bytes):
+    """Пишет файл целиком или не меняет его: временный файл, fsync, os.replace"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    # Переименование переживет сбой питания только после fsync каталога (на Windows его нет)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class SnapshotStore:
+    """Файл снимков состояния одного GameServerSystem.
+
+    С журналом (WriteAheadLog) каждый снимок начинает новый сегмент журнала,
+    а после записи снимка удаляет сегменты, которые в него уже вошли.
+    """
+
+    def __init__(self, path: str, journal=None):
+        self.path = path
+        self.journal = journal
+        # Номер последнего снятого и последнего записанного снимка: запись
+        # из потока, начатая раньше, не затирает более новый снимок
+        self._taken = 0
+        self._written = 0
+        self._write_lock = threading.Lock()
+        self.last_saved: Optional[float] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _capture(self, system) -> Tuple[int, _Columns, int]:
+        start = time.perf_counter()
+        # Смена сегмента и копирование идут подряд в одном потоке: все, что
+        # записано в журнал до смены, попадет в снимок, а все, что после, - нет
+        segment = self.journal.rotate() if self.journal is not None else 0
+        columns = collect_snapshot(system, segment)
+        self._taken += 1
+        log.debug("Состояние снято за %.3f с", time.perf_counter() - start)
+        return self._taken, columns, segment
+
+    def _write(self, number: int, columns: _Columns, segment: int):
+        with self._write_lock:
+            if number <= self._written:
+                return
+            start = time.perf_counter()
+            data = columns.encode()
+            write_atomic(self.path, data)
+            self._written = number
+            if self.journal is not None:
+                self.journal.discard_before(segment)
+            self.last_saved = time.monotonic()
+            log.info("Снимок состояния сохранен: %s (%s байт, %.3f с)", self.path, len(data),
+                     time.perf_counter() - start)
+
+    def save(self, system):
+        """Снимает состояние и пишет его на диск в вызывающем потоке"""
+        self._write(*self._capture(system))
+
+    async def save_async(self, system):
+        """Копирует состояние в цикле событий, а кодирует и пишет на диск в отдельном потоке"""
+        await asyncio.get_running_loop().run_in_executor(None, self._write, *self._capture(system))
+
+    def load(self, system) -> bool:
+        """Восстанавливает состояние из файла и журнал поверх него; False - снимка еще нет"""
+        try:
+            with open(self.path, "rb") as file:
+                data: Optional[bytes] = file.read()
+        except FileNotFoundError:
+            data = None
+        start = time.perf_counter()
+        # Миллионы новых объектов подряд запускали бы сборщик мусора снова и
+        # снова, а циклов среди записей нет: на время разбора он отключается
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            segment = decode_snapshot(data, system) if data is not None else 0
+            if self.journal is not None:
+                self.journal.replay(system, segment)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if data is None:
+            return False
+        log.info("Состояние восстановлено из %s за %.3f с: пользователей %s, комнат %s, игр %s, сетей %s",
+                 self.path, time.perf_counter() - start, system.user_manager.count_users(),
+                 len(system.room_manager.rooms), len(system.game_manager.games),
+                 len(system.server.active_networks))
+        return True
@@ -1,40 +1,144 @@
-from typing import Optional, List, Dict
+import logging
+from concurrent.futures import Future
+from typing import Optional, Iterable, List, Dict, Tuple
+
+from .log import fields
+from .passwords import PasswordHasher
+from .records import UserRecord
+from .sessions import SessionTokens
+from .user_store import MemoryUserStore
+
+log = logging.getLogger(__name__)
+
+# Минимальная длина пароля (проверяется до хеширования)
+MIN_PASSWORD_LENGTH = 3
+
 
 class UserManager:
-    def __init__(self):
-        self._users: List[Dict] = []
-        self._next_id: int = 1
+    def __init__(self, store=None, hasher: PasswordHasher = None, sessions: SessionTokens = None):
+        # Хранилище с поиском по id и по имени (имена уникальны): по умолчанию
+        # в памяти, SQLiteUserStore сохраняет пользователей между запусками
+        self.store = store if store is not None else MemoryUserStore()
+        self._next_id: int = self.store.next_id()
+        # Пароли хранятся хешами; KDF считается в пуле hasher (методы *_async и *_future)
+        self.hasher = hasher if hasher is not None else PasswordHasher()
+        # Токены, выданные после входа: повторный вход по токену без проверки пароля
+        self.sessions = sessions if sessions is not None else SessionTokens()
+        # Журнал предзаписи изменений (WriteAheadLog), если задан
+        self.journal = None
 
-    def create_user(self, name: str = "Новый игрок", password: str = None) -> Optional[Dict]:
+    def _can_create(self, name: str, password: str) -> bool:
+        if not isinstance(password, str) or len(password) < MIN_PASSWORD_LENGTH:
+            log.info("Пароль короткий или его нет")
+            return False
+        if self.store.get_by_name(name) is not None:
+            log.info("Имя пользователя уже занято: %s", name)
+            return False
+        return True
 
-        if password is None or len(password) < 3:
-            print("Пароль короткий или его нет")
+    def create_user(self, name: str = "Новый игрок", password: str = None) -> Optional[UserRecord]:
+        """Создает пользователя; хеш пароля считается в вызывающем потоке"""
+        if not self._can_create(name, password):
             return None
+        return self.create_user_hashed(name, self.hasher.hash(password))
 
-        user = {
-            "id": self._next_id,
-            "name": name,
-            "password": password
-        }
+    async def create_user_async(self, name: str = "Новый игрок", password: str = None) -> Optional[UserRecord]:
+        """Как create_user, но хеш считается в пуле hasher, не занимая цикл событий"""
+        if not self._can_create(name, password):
+            return None
+        return self.create_user_hashed(name, await self.hasher.hash_async(password))
 
-        self._users.append(user)
+    def create_user_hashed(self, name: str, password_hash: str) -> Optional[UserRecord]:
+        """Создает пользователя с уже посчитанным хешем пароля (hasher.hash_future, журнал)"""
+        # Пока считался хеш, имя могли занять
+        if self.store.get_by_name(name) is not None:
+            log.info("Имя пользователя уже занято: %s", name)
+            return None
+
+        user = UserRecord(self._next_id, name, password_hash)
+
+        self.store.add(user)
         self._next_id += 1
+        if self.journal is not None:
+            self.journal.append("create_user", name, password_hash)
 
-        print(f"Создался новый пользователь: {user['id'], user['name']}")
+        log.info("Создался новый пользователь: %s", name, extra=fields(user_id=user.id))
         return user
 
-    def get_user(self, user_id: int) -> Optional[Dict]:
-        print(f"Получены данные пользователя:{user_id}")
+    def get_user(self, user_id: int) -> Optional[UserRecord]:
+        log.debug("Получены данные пользователя: %s", user_id)
+
+        return self.store.get(user_id)
 
-        return next((user for user in self._users if user["id"] == user_id), None)
+    def get_user_by_name(self, name: str) -> Optional[UserRecord]:
+        return self.store.get_by_name(name)
+
+    def authenticate_user(self, name: str, password: str) -> Optional[UserRecord]:
+        """Проверка пароля в вызывающем потоке"""
+        user = self.store.get_by_name(name)
+        if self.hasher.verify(password, user.password if user else None):
+            log.debug("Пользователь вошёл в аккаунт: %s", name)
+            return user
+        return None
 
-    def authenticate_user(self, name: str, password: str) -> Optional[Dict]:
-        for user in self._users:
-            if user["name"] == name and user["password"] == password:
-                print(f"Пользовать вошёл в аккаунт: {name, password}")
-                return user
+    async def authenticate_user_async(self, name: str, password: str) -> Optional[UserRecord]:
+        """Проверка пароля в пуле hasher"""
+        user = self.store.get_by_name(name)
+        if await self.hasher.verify_async(password, user.password if user else None):
+            log.debug("Пользователь вошёл в аккаунт: %s", name)
+            return user
         return None
 
+    def authenticate_future(self, name: str, password: str) -> Future:
+        """Future с пользователем или None; для UI, который опрашивает его по таймеру"""
+        user = self.store.get_by_name(name)
+        result: Future = Future()
+
+        def done(verified: Future):
+            try:
+                result.set_result(user if verified.result() else None)
+            except Exception as e:
+                result.set_exception(e)
+
+        self.hasher.verify_future(password, user.password if user else None).add_done_callback(done)
+        return result
+
+    def open_session(self, user_id: int) -> str:
+        """Выдает токен сессии для повторного входа без пароля"""
+        return self.sessions.issue(user_id)
+
+    def authenticate_token(self, token: str) -> Optional[UserRecord]:
+        """Пользователь по действующему токену сессии"""
+        user_id = self.sessions.resolve(token)
+        return self.store.get(user_id) if user_id is not None else None
+
+    def close_session(self, token: str) -> bool:
+        """Отзывает токен сессии (выход или замена токена при повторном входе)"""
+        return self.sessions.revoke(token)
+
     def list_users(self) -> List[Dict]:
-        print("Получен список пользователей")
-        return [user.copy() for user in self._users]
+        log.debug("Получен список пользователей")
+        return [user.copy() for user in self.store.all()]
+
+    def count_users(self) -> int:
+        return self.store.count()
+
+    def dump_state(self) -> Tuple[List[UserRecord], int]:
+        """Записи пользователей и следующий id - для снимка состояния.
+
+        Постоянное хранилище само переживает перезапуск: в снимок попадают только
+        записи, еще не вставленные в базу, а не полный SELECT на каждый снимок.
+        """
+        if self.store.persistent:
+            return self.store.pending(), self._next_id
+        return self.store.all(), self._next_id
+
+    def load_state(self, users: Iterable[UserRecord], next_id: int):
+        """Загружает пользователей из снимка в хранилище (постоянное хранилище только дополняется)"""
+        self.store.load(users)
+        self._next_id = max(next_id, self.store.next_id())
+
+    def close(self):
+        """Дописывает накопленные изменения хранилища, закрывает его и пул хеширования"""
+        self.store.close()
+        self.hasher.close()
@@ -0,0 +1,307 @@
+"""Хранилища пользователей для UserManager.
+
+MemoryUserStore держит записи в словарях по id и по имени и живет до
+перезапуска. SQLiteUserStore хранит пользователей в файле SQLite (первичный
+ключ id и уникальный индекс по имени), поэтому учетные записи переживают
+перезапуск. Перед базой стоит ограниченный LRU-кэш записей: get_user на
+пути сообщений почти всегда обслуживается из памяти.
+
+Новые пользователи сразу видны в кэше, а в базу попадают пачками: в цикле
+событий все записи, накопленные за итерацию и за время предыдущей вставки,
+вставляются одной транзакцией в отдельном потоке. Без цикла событий (UI,
+демо) запись вставляется сразу. Соединения с базой берутся из пула и
+переиспользуются потоками. Сами хранилища рассчитаны на один поток-владелец
+(цикл событий или UI), в других потоках выполняется только вставка.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .records import UserRecord
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS users ("
+    " id INTEGER PRIMARY KEY,"
+    " name TEXT NOT NULL UNIQUE,"
+    " password TEXT NOT NULL)"
+)
+_COLUMNS = "id, name, password"
+
+
+class MemoryUserStore:
+    """Пользователи в памяти: индексы по id и по имени (имена уникальны)"""
+
+    persistent = False
+
+    def __init__(self):
+        self._by_id: Dict[int, UserRecord] = {}
+        self._by_name: Dict[str, UserRecord] = {}
+        # Поиск - это сразу dict.get, без лишнего вызова на пути сообщений;
+        # поэтому load меняет словари на месте, а не заменяет их
+        self.get: Callable[[int], Optional[UserRecord]] = self._by_id.get
+        self.get_by_name: Callable[[str], Optional[UserRecord]] = self._by_name.get
+
+    def add(self, user: UserRecord):
+        self._by_id[user.id] = user
+        self._by_name[user.name] = user
+
+    def count(self) -> int:
+        return len(self._by_id)
+
+    def all(self) -> List[UserRecord]:
+        return list(self._by_id.values())
+
+    def next_id(self) -> int:
+        return max(self._by_id, default=0) + 1
+
+    def load(self, users: Iterable[UserRecord]):
+        """Заменяет пользователей восстановленными из снимка"""
+        by_id = {user.id: user for user in users}
+        self._by_id.clear()
+        self._by_id.update(by_id)
+        self._by_name.clear()
+        self._by_name.update((user.name, user) for user in by_id.values())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ConnectionPool:
+    """Пул соединений SQLite: не больше size соединений, общих для всех потоков"""
+
+    def __init__(self, path: str, size: int = 4):
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        # WAL-режим: чтение не ждет вставки; NORMAL - без fsync на каждую транзакцию
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Соединение из пула на время блока with"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def close(self):
+        """Закрывает свободные соединения; занятые закроются при возврате"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class SQLiteUserStore:
+    """Пользователи в файле SQLite с LRU-кэшем записей и пакетной вставкой"""
+
+    persistent = True
+
+    def __init__(self, path: str, pool_size: int = 4, cache_size: int = 65536):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.cache_size = cache_size
+        self._pool = ConnectionPool(path, pool_size)
+        with self._pool.connection() as conn:
+            with conn:
+                conn.execute(_SCHEMA)
+            self._count, max_id = conn.execute("SELECT COUNT(*), MAX(id) FROM users").fetchone()
+        self._max_id = max_id or 0
+
+        # Кэш: id -> запись в порядке давности обращения и имя -> запись для тех же записей
+        self._cache: "OrderedDict[int, UserRecord]" = OrderedDict()
+        self._cache_names: Dict[str, UserRecord] = {}
+        self.hits = 0
+        self.misses = 0
+
+        # Записи, еще не вставленные в базу: очередь на вставку и индексы для поиска
+        self._batch: List[UserRecord] = []
+        self._pending_by_id: Dict[int, UserRecord] = {}
+        self._pending_by_name: Dict[str, UserRecord] = {}
+        self._flushing = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self.batches = 0
+
+    # --- Кэш ------------------------------------------------------------------
+
+    def _remember(self, user: UserRecord):
+        cache = self._cache
+        cache[user.id] = user
+        self._cache_names[user.name] = user
+        if len(cache) > self.cache_size:
+            _, evicted = cache.popitem(last=False)
+            self._cache_names.pop(evicted.name, None)
+
+    def _select_one(self, where: str, value) -> Optional[UserRecord]:
+        self.misses += 1
+        with self._pool.connection() as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM users WHERE {where} = ?", (value,)).fetchone()
+        if row is None:
+            return None
+        user = UserRecord(*row)
+        self._remember(user)
+        return user
+
+    # --- Чтение ---------------------------------------------------------------
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        user = self._cache.get(user_id)
+        if user is not None:
+            self._cache.move_to_end(user_id)
+            self.hits += 1
+            return user
+        user = self._pending_by_id.get(user_id)
+        if user is not None:
+            self._remember(user)
+            return user
+        return self._select_one("id", user_id)
+
+    def get_by_name(self, name: str) -> Optional[UserRecord]:
+        user = self._cache_names.get(name)
+        if user is not None:
+            self._cache.move_to_end(user.id)
+            self.hits += 1
+            return user
+        user = self._pending_by_name.get(name)
+        if user is not None:
+            self._remember(user)
+            return user
+        return self._select_one("name", name)
+
+    def count(self) -> int:
+        return self._count
+
+    def all(self) -> List[UserRecord]:
+        """Все пользователи по возрастанию id (записи из базы - новые объекты)"""
+        with self._pool.connection() as conn:
+            users = {row[0]: UserRecord(*row) for row in conn.execute(f"SELECT {_COLUMNS} FROM users")}
+        users.update(self._pending_by_id)
+        return [users[user_id] for user_id in sorted(users)]
+
+    def pending(self) -> List[UserRecord]:
+        """Пользователи, еще не записанные в базу, по возрастанию id"""
+        return [self._pending_by_id[user_id] for user_id in sorted(self._pending_by_id)]
+
+    def next_id(self) -> int:
+        return self._max_id + 1
+
+    # --- Запись ---------------------------------------------------------------
+
+    def add(self, user: UserRecord):
+        """Добавляет пользователя: сразу в кэш, в базу - со следующей пачкой"""
+        self._batch.append(user)
+        self._pending_by_id[user.id] = user
+        self._pending_by_name[user.name] = user
+        self._remember(user)
+        self._count += 1
+        self._max_id = max(self._max_id, user.id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if not self._flushing:
+            self._flushing = True
+            self._flush_task = loop.create_task(self._flush_loop())
+
+    def _insert(self, users: List[UserRecord]):
+        rows = [(user.id, user.name, user.password) for user in users]
+        with self._pool.connection() as conn:
+            with conn:
+                conn.executemany(f"INSERT INTO users ({_COLUMNS}) VALUES (?, ?, ?)", rows)
+
+    def _written(self, users: List[UserRecord]):
+        for user in users:
+            self._pending_by_id.pop(user.id, None)
+            self._pending_by_name.pop(user.name, None)
+        self.batches += 1
+
+    async def _flush_loop(self):
+        # Пока идет вставка, новые записи копятся и уходят следующей транзакцией
+        loop = asyncio.get_running_loop()
+        try:
+            while self._batch:
+                users, self._batch = self._batch, []
+                try:
+                    await loop.run_in_executor(None, self._insert, users)
+                except sqlite3.Error:
+                    # Записи остаются в памяти и повторятся со следующей пачкой
+                    log.exception("Не удалось записать пользователей в %s", self.path)
+                    self._batch[:0] = users
+                    break
+                self._written(users)
+        finally:
+            self._flushing = False
+
+    def flush(self):
+        """Сразу вставляет в базу все накопленные записи"""
+        if not self._batch:
+            return
+        users, self._batch = self._batch, []
+        try:
+            self._insert(users)
+        except sqlite3.Error:
+            self._batch[:0] = users
+            raise
+        self._written(users)
+
+    def load(self, users: Iterable[UserRecord]):
+        """Добавляет пользователей из снимка, которых еще нет в базе.
+
+        База сама переживает перезапуск и может быть новее снимка,
+        поэтому она не заменяется, а только дополняется.
+        """
+        self.flush()
+        rows = [(user.id, user.name, user.password) for user in users]
+        with self._pool.connection() as conn:
+            with conn:
+                conn.executemany(f"INSERT OR IGNORE INTO users ({_COLUMNS}) VALUES (?, ?, ?)", rows)
+            self._count, max_id = conn.execute("SELECT COUNT(*), MAX(id) FROM users").fetchone()
+        self._max_id = max_id or 0
+
+    def close(self):
+        self.flush()
+        self._pool.close()
@@ -0,0 +1,266 @@
+"""Журнал предзаписи (WAL) изменений пользователей, комнат и игр.
+
+Менеджеры дописывают в журнал каждое успешное изменение: create_user,
+room_create, room_join, room_leave, room_end, delete_room, start_game и
+close_game. Запись - кадр из длины, CRC32 и JSON-списка [операция,
+время, аргументы...]. При запуске журнал проигрывается поверх последнего
+снимка теми же методами менеджеров, поэтому id и состояние совпадают
+с прежними.
+
+Групповая фиксация: кадр сразу пишется в файл, а fsync выполняется в
+отдельном потоке одним вызовом на все кадры, накопившиеся с прошлого
+fsync. Кому нужна надежная запись (транспорту перед ответом клиенту),
+тот ждет sync(). Без цикла событий (демо, UI) кадры сразу отдаются ОС,
+а fsync выполняется при смене сегмента и при закрытии.
+
+Журнал делится на сегменты wal-<номер>.log. Снимок состояния начинает
+новый сегмент и запоминает его номер; после записи снимка более старые
+сегменты удаляются.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Tuple
+
+from .records import WALL_OFFSET
+
+log = logging.getLogger(__name__)
+
+# Кадр: длина и CRC32 тела (big-endian), затем тело
+_FRAME = struct.Struct(">II")
+_SEGMENT_NAME = re.compile(r"^wal-(\d+)\.log$")
+
+
+class JournalError(ValueError):
+    """Журнал поврежден не в конце последнего сегмента"""
+
+
+def _segment_name(number: int) -> str:
+    return f"wal-{number:08d}.log"
+
+
+# --- Повтор операций ----------------------------------------------------------
+
+
+def _replay_create_user(system, ts: float, name: str, password_hash: str) -> bool:
+    users = system.user_manager
+    # Постоянное хранилище (SQLiteUserStore) уже может содержать этого пользователя
+    if users.store.persistent and users.get_user_by_name(name) is not None:
+        return True
+    # В журнале хеш пароля, повтор не считает KDF заново
+    return users.create_user_hashed(name, password_hash) is not None
+
+
+def _replay_room_create(system, ts: float, owner_id: int, access: str, password, maxplayers: int, name) -> bool:
+    room = system.room_manager.room_create(owner_id, access, password, maxplayers, name)
+    if room is None:
+        return False
+    room.created = ts - WALL_OFFSET
+    return True
+
+
+def _replay_room_join(system, ts: float, room_id: int, user_id: int, password) -> bool:
+    return system.room_manager.room_join(room_id, user_id, password)[0]
+
+
+def _replay_room_leave(system, ts: float, room_id: int, user_id: int) -> bool:
+    return system.room_manager.room_leave(room_id, user_id)[0]
+
+
+def _replay_room_end(system, ts: float, room_id: int, user_id: int) -> bool:
+    return system.room_manager.room_end(room_id, user_id)[0]
+
+
+def _replay_delete_room(system, ts: float, room_id: int, user_id: int) -> bool:
+    return system.room_manager.delete_room(room_id, user_id)[0]
+
+
+def _replay_start_game(system, ts: float, room_id: int, user_id: int, seed: int) -> bool:
+    games = system.game_manager
+    ok, _ = games.start_game(room_id, user_id, system.room_manager, seed)
+    if ok:
+        games.get_game_by_room(room_id).created = ts - WALL_OFFSET
+    return ok
+
+
+def _replay_close_game(system, ts: float, game_id: int, user_id: int) -> bool:
+    games = system.game_manager
+    ok, _ = games.close_game(game_id, user_id, system.room_manager)
+    game = games.games.get(game_id)
+    if ok and game is not None:
+        game.ended = ts - WALL_OFFSET
+    return ok
+
+
+REPLAY: Dict[str, Callable[..., bool]] = {
+    "create_user": _replay_create_user,
+    "room_create": _replay_room_create,
+    "room_join": _replay_room_join,
+    "room_leave": _replay_room_leave,
+    "room_end": _replay_room_end,
+    "delete_room": _replay_delete_room,
+    "start_game": _replay_start_game,
+    "close_game": _replay_close_game,
+}
+
+
+class WriteAheadLog:
+    """Журнал изменений в каталоге directory: сегменты wal-<номер>.log"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Каждый запуск пишет в новый сегмент, прежние только читаются при повторе
+        existing = self._segments()
+        self.segment = existing[-1] + 1 if existing else 0
+        self._file = open(os.path.join(directory, _segment_name(self.segment)), "ab")
+        # Число дописанных кадров и число кадров, уже сброшенных на диск
+        self.appended = 0
+        self._durable = 0
+        self.batches = 0
+        self._flushing = False
+        self._waiters: List[Tuple[int, asyncio.Future]] = []
+        # fsync идет в другом потоке: замок не дает закрыть файл посреди fsync
+        self._lock = threading.Lock()
+
+    def _segments(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    @property
+    def pending(self) -> bool:
+        """Есть кадры, еще не сброшенные на диск"""
+        return self._durable < self.appended
+
+    def append(self, op: str, *args):
+        """Дописывает операцию; на диск она попадет со следующей группой"""
+        body = json.dumps([op, time.time(), *args], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self._file.write(_FRAME.pack(len(body), zlib.crc32(body)) + body)
+        self.appended += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._file.flush()
+            return
+        if not self._flushing:
+            self._flushing = True
+            loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        # Пока идет fsync, новые кадры копятся и уходят следующей группой
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending and not self._file.closed:
+                target = self.appended
+                self._file.flush()
+                await loop.run_in_executor(None, self._fsync)
+                self._durable = max(self._durable, target)
+                self.batches += 1
+                self._wake()
+        except (OSError, ValueError) as e:
+            log.exception("Не удалось сбросить журнал на диск")
+            for _, future in self._waiters:
+                if not future.done():
+                    future.set_exception(OSError(f"Журнал не записан: {e}"))
+            self._waiters.clear()
+        finally:
+            self._flushing = False
+
+    def _fsync(self):
+        with self._lock:
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+
+    def _wake(self):
+        waiting = []
+        for target, future in self._waiters:
+            if target > self._durable:
+                waiting.append((target, future))
+            elif not future.done():
+                future.set_result(None)
+        self._waiters = waiting
+
+    async def sync(self):
+        """Ждет, пока все уже дописанные кадры не окажутся на диске"""
+        target = self.appended
+        if self._durable >= target:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((target, future))
+        if not self._flushing:
+            self._flushing = True
+            asyncio.get_running_loop().create_task(self._flush_loop())
+        await future
+
+    def _close_segment(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._durable = self.appended
+        self._wake()
+
+    def rotate(self) -> int:
+        """Закрывает текущий сегмент и начинает новый; возвращает номер нового сегмента"""
+        self._close_segment()
+        self.segment += 1
+        self._file = open(os.path.join(self.directory, _segment_name(self.segment)), "ab")
+        return self.segment
+
+    def discard_before(self, segment: int):
+        """Удаляет сегменты с номерами меньше segment (их изменения уже в снимке)"""
+        for number in self._segments():
+            if number < segment:
+                os.remove(os.path.join(self.directory, _segment_name(number)))
+
+    def replay(self, system, from_segment: int = 0) -> int:
+        """Повторяет операции сегментов от from_segment до текущего; возвращает их число.
+
+        Вызывается до подключения журнала к менеджерам, чтобы повтор
+        не записывался заново. Недописанный кадр в конце последнего
+        сегмента (сбой посреди записи) отрезается.
+        """
+        self.discard_before(from_segment)
+        segments = [number for number in self._segments() if number < self.segment]
+        count = failed = 0
+        for index, number in enumerate(segments):
+            path = os.path.join(self.directory, _segment_name(number))
+            with open(path, "rb") as file:
+                data = file.read()
+            pos = 0
+            while pos < len(data):
+                end = pos + _FRAME.size
+                length, crc = _FRAME.unpack_from(data, pos) if end <= len(data) else (0, None)
+                body = data[end:end + length]
+                if crc is None or len(body) < length or zlib.crc32(body) != crc:
+                    if index != len(segments) - 1:
+                        raise JournalError(f"Сегмент журнала {path} поврежден на смещении {pos}")
+                    log.warning("Недописанный кадр в конце журнала %s отрезан (смещение %s)", path, pos)
+                    with open(path, "r+b") as file:
+                        file.truncate(pos)
+                    break
+                op, ts, *args = json.loads(body)
+                if not REPLAY[op](system, ts, *args):
+                    failed += 1
+                count += 1
+                pos = end + length
+        if failed:
+            log.warning("При повторе журнала не выполнено операций: %s из %s", failed, count)
+        if count:
+            log.info("Из журнала повторено операций: %s (сегментов %s)", count, len(segments))
+        return count
+
+    def close(self):
+        if not self._file.closed:
+            self._close_segment()
@@ -0,0 +1,304 @@
+"""Бенчмарки менеджеров на 10^3..10^6 сущностей: операций в секунду и память.
+
+Результаты можно сохранить в базовый файл (JSON) и сравнить с ним
+следующий прогон: падение скорости или рост памяти больше порога
+считается регрессией, и процесс завершается с кодом 1. Сравнивать имеет
+смысл только прогоны на одной машине; на шумных машинах помогает --repeat.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_managers [--sizes 1000,10000,100000,1000000] [--only users,rooms]
+    python -m benchmarks.bench_managers --save benchmarks/baseline.json
+    python -m benchmarks.bench_managers --compare benchmarks/baseline.json [--threshold 0.2]
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.game_manager import GameManager
+from app.network.network_manager import NetworkManager
+from app.passwords import PasswordHasher
+from app.random_tools import RandomCar, RandomCard
+from app.room_manager import RoomManager
+from app.user_manager import UserManager
+
+# 10^6 запускается явно (--sizes ...,1000000): под tracemalloc нужно несколько ГБ памяти
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_THRESHOLD = 0.2
+# Стоимость scrypt в бенчмарке пользователей: замеряются индексы и хранилище,
+# а не KDF (одна проверка при рабочей стоимости 14 - десятки миллисекунд)
+BENCH_PASSWORD_COST = 1
+# Тайм-аут простоя подключений в бенчмарке heartbeat и снятия по тайм-ауту, секунд
+BENCH_IDLE_TIMEOUT = 60.0
+# Минимальное время замера для запросов, которые обходят всю коллекцию
+MIN_SCAN_SECONDS = 0.2
+
+
+def _repeats(n: int) -> int:
+    """Сколько раз повторять замер: на малых n один проход слишком короткий и шумный"""
+    return max(1, min(5, 300_000 // n))
+
+
+def _best_ops_per_sec(op: Callable[[object], object], ops: int, repeat: int,
+                      setup: Callable[[], object] = lambda: None) -> float:
+    """Лучший результат из repeat замеров op(setup()); setup в замер не входит"""
+    best = 0.0
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        start = time.perf_counter()
+        op(state)
+        elapsed = time.perf_counter() - start
+        best = max(best, ops / elapsed if elapsed else float("inf"))
+    return best
+
+
+def _repeat_per_sec(func: Callable[[], object]) -> float:
+    """Вызывает func, пока не наберется MIN_SCAN_SECONDS (не меньше 3 раз)"""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if calls >= 3 and elapsed >= MIN_SCAN_SECONDS:
+            return calls / elapsed
+
+
+def _memory(build: Callable[[object], object], setup: Callable[[], object] = lambda: None) -> int:
+    """Объем памяти, удерживаемой результатом build(setup()) (отдельный проход под tracemalloc).
+
+    setup строит нужное build состояние до начала трассировки. Замер - живые
+    блоки, выделенные под трассировкой, поэтому освобождение памяти setup
+    не вычитается из результата и он не бывает отрицательным.
+    """
+    state = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        keep = build(state)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del keep, state
+    return size
+
+
+def _result(ops_per_sec: float, mem_bytes: int = None) -> Dict:
+    result = {"ops_per_sec": round(ops_per_sec, 1)}
+    if mem_bytes is not None:
+        result["mem_bytes"] = mem_bytes
+    return result
+
+
+# --- Наполнение менеджеров ----------------------------------------------------
+
+
+def _fill_users(n: int) -> UserManager:
+    manager = UserManager(hasher=PasswordHasher(cost=BENCH_PASSWORD_COST))
+    for i in range(n):
+        manager.create_user(f"user{i}", f"pw{i}")
+    return manager
+
+
+def _fill_rooms(n: int) -> RoomManager:
+    manager = RoomManager()
+    for owner_id in range(1, n + 1):
+        manager.room_create(owner_id, "public", maxplayers=4)
+    return manager
+
+
+def _fill_games(rooms: RoomManager, n: int) -> GameManager:
+    manager = GameManager()
+    for room_id in range(1, n + 1):
+        manager.start_game(room_id, room_id, rooms, seed=room_id)
+    return manager
+
+
+def _fill_connections(n: int, idle_timeout: float = None) -> NetworkManager:
+    manager = NetworkManager(idle_timeout=idle_timeout)
+    for user_id in range(1, n + 1):
+        manager.simulate_connection(user_id)
+    return manager
+
+
+def _catalog(n: int) -> List[Dict]:
+    rnd = random.Random(n)
+    return [{"id": i, "name": f"item{i}", "weight": rnd.randint(1, 100)} for i in range(n)]
+
+
+# --- Бенчмарки ----------------------------------------------------------------
+
+
+def bench_users(n: int, repeat: int) -> Dict[str, Dict]:
+    mem = _memory(lambda _: _fill_users(n))
+    create = _best_ops_per_sec(lambda _: _fill_users(n), n, repeat)
+    manager = _fill_users(n)
+    names = [f"user{i}" for i in random.Random(1).sample(range(n), n)]
+    auth = _best_ops_per_sec(lambda _: [manager.authenticate_user(name, "pw" + name[4:]) for name in names],
+                             n, repeat)
+    return {
+        "create_user": _result(create, mem),
+        "authenticate_user": _result(auth),
+    }
+
+
+def bench_rooms(n: int, repeat: int) -> Dict[str, Dict]:
+    mem = _memory(lambda _: _fill_rooms(n))
+    create = _best_ops_per_sec(lambda _: _fill_rooms(n), n, repeat)
+    join = _best_ops_per_sec(lambda m: [m.room_join(room_id, n + room_id) for room_id in range(1, n + 1)],
+                             n, repeat, setup=lambda: _fill_rooms(n))
+    scan = _repeat_per_sec(_fill_rooms(n).get_active_rooms)
+    return {
+        "room_create": _result(create, mem),
+        "room_join": _result(join),
+        "get_active_rooms": _result(scan),
+    }
+
+
+def bench_games(n: int, repeat: int) -> Dict[str, Dict]:
+    mem = _memory(lambda rooms: _fill_games(rooms, n), setup=lambda: _fill_rooms(n))
+    start = _best_ops_per_sec(lambda rooms: _fill_games(rooms, n), n, repeat, setup=lambda: _fill_rooms(n))
+    manager = _fill_games(_fill_rooms(n), n)
+    lookup = _best_ops_per_sec(lambda _: [manager.get_game_by_room(room_id) for room_id in range(1, n + 1)],
+                               n, repeat)
+    return {
+        "start_game": _result(start, mem),
+        "get_game_by_room": _result(lookup),
+    }
+
+
+def bench_connections(n: int, repeat: int) -> Dict[str, Dict]:
+    mem = _memory(lambda _: _fill_connections(n))
+    connect = _best_ops_per_sec(lambda _: _fill_connections(n), n, repeat)
+    disconnect = _best_ops_per_sec(lambda m: [m.disconnect_user(user_id) for user_id in range(1, n + 1)],
+                                   n, repeat, setup=lambda: _fill_connections(n))
+    manager = _fill_connections(n, BENCH_IDLE_TIMEOUT)
+    heartbeat = _best_ops_per_sec(lambda _: [manager.heartbeat(user_id) for user_id in range(1, n + 1)],
+                                  n, repeat)
+    # Все n подключений простаивают дольше тайм-аута и снимаются за один вызов
+    reap = _best_ops_per_sec(lambda m: m.reap_idle(time.monotonic() + 2 * BENCH_IDLE_TIMEOUT),
+                             n, repeat, setup=lambda: _fill_connections(n, BENCH_IDLE_TIMEOUT))
+    return {
+        "simulate_connection": _result(connect, mem),
+        "disconnect_user": _result(disconnect),
+        "heartbeat": _result(heartbeat),
+        "reap_idle": _result(reap),
+    }
+
+
+def bench_random(n: int, repeat: int) -> Dict[str, Dict]:
+    """RandomCar/RandomCard по каталогу из n записей; таблица выборки строится до замера"""
+    cars, cards = _catalog(n), _catalog(n)
+    RandomCar(cars)
+    RandomCard(cards)
+    car = _best_ops_per_sec(lambda _: [RandomCar(cars) for _ in range(n)], n, repeat)
+    card = _best_ops_per_sec(lambda _: [RandomCard(cards) for _ in range(n)], n, repeat)
+    return {
+        "RandomCar": _result(car),
+        "RandomCard": _result(card),
+    }
+
+
+BENCHMARKS: Dict[str, Callable[[int, int], Dict[str, Dict]]] = {
+    "users": bench_users,
+    "rooms": bench_rooms,
+    "games": bench_games,
+    "connections": bench_connections,
+    "random": bench_random,
+}
+
+
+def run(sizes, only=None, repeat: int = None) -> Dict[str, Dict]:
+    """Возвращает {"<операция>@<n>": {"ops_per_sec": ..., "mem_bytes": ...}}"""
+    results: Dict[str, Dict] = {}
+    groups = [name for name in BENCHMARKS if not only or name in only]
+    # Журнал приложения не настраивается: замеряется работа менеджеров с выключенным журналом
+    for n in sizes:
+        for group in groups:
+            measured = BENCHMARKS[group](n, repeat or _repeats(n))
+            for op, result in measured.items():
+                results[f"{op}@{n}"] = result
+                _print_row(op, n, result)
+    return results
+
+
+def _print_row(op: str, n: int, result: Dict):
+    mem = result.get("mem_bytes")
+    mem_text = f"{mem / n:>10.1f}" if mem is not None else f"{'-':>10}"
+    print(f"{op:<20} {n:>9} {result['ops_per_sec']:>14,.0f} {mem_text}")
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Список регрессий: скорость ниже базовой или память выше базовой больше чем на threshold"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            change = result["ops_per_sec"] / base["ops_per_sec"] - 1
+            regressions.append(f"{key}: ops/sec {base['ops_per_sec']:,.0f} -> {result['ops_per_sec']:,.0f} ({change:+.0%})")
+        if base.get("mem_bytes") and result.get("mem_bytes") is not None \
+                and result["mem_bytes"] > base["mem_bytes"] * (1 + threshold):
+            change = result["mem_bytes"] / base["mem_bytes"] - 1
+            regressions.append(f"{key}: память {base['mem_bytes']:,} -> {result['mem_bytes']:,} байт ({change:+.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help="размеры через запятую")
+    parser.add_argument("--only", help=f"группы через запятую: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, help="повторов каждого замера (по умолчанию зависит от n)")
+    parser.add_argument("--save", metavar="PATH", help="сохранить результаты как базовые")
+    parser.add_argument("--compare", metavar="PATH", help="сравнить с базовым файлом")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимое относительное ухудшение (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = set(args.only.split(",")) if args.only else None
+    if only and only - set(BENCHMARKS):
+        parser.error(f"Неизвестные группы: {', '.join(sorted(only - set(BENCHMARKS)))}")
+
+    print(f"{'операция':<20} {'n':>9} {'оп/с':>14} {'байт/шт':>10}")
+    results = run(sizes, only, args.repeat)
+
+    if args.save:
+        payload = {
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+            },
+            "results": results,
+        }
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(payload, file, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Результаты сохранены: {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Регрессии (порог {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"Регрессий нет (порог {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
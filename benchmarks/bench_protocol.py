@@ -0,0 +1,66 @@
+"""Сравнение бинарного протокола с JSON: скорость кодирования/декодирования и размер.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_protocol [--iterations N]
+"""
+
+import argparse
+import json
+import time
+
+from app.network.protocol import decode_binary, encode_binary
+
+SAMPLE_MESSAGES = {
+    "room_join": {"op": "room_join", "id": 17, "room_id": 4021, "password": None},
+    "fire": {"op": "fire", "id": 18, "network_id": 12, "message": "Привет от Игрока1"},
+    "notify": {"op": "notify", "message": "Пользователь Игрок2 присоединился"},
+    "result_room": {
+        "op": "result", "id": 19, "ok": True,
+        "data": {
+            "id_room": 4021, "owner_id": 77, "access": "public", "password": None,
+            "maxplayers": 4, "name": "Комната 4021", "participants_id": [77, 78, 79],
+            "status": "waiting", "created_at": "12:30:01",
+        },
+    },
+    "result_game": {
+        "op": "result", "id": 20, "ok": True,
+        "data": {
+            "id_game": 930, "room_id": 4021, "owner_id": 77, "participants_id": [77, 78, 79],
+            "created_at": "12:31:10", "status": "active", "seed": 1234567890123,
+        },
+    },
+}
+
+
+def _json_encode(message):
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _time_per_op(func, arg, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations
+
+
+def run(iterations: int = 100_000):
+    print(f"{'сообщение':<12} {'формат':<7} {'байт':>5} {'encode, мкс':>12} {'decode, мкс':>12}")
+    for name, message in SAMPLE_MESSAGES.items():
+        binary = encode_binary(message)
+        text = _json_encode(message)
+        assert decode_binary(binary) == json.loads(text), name
+
+        rows = (
+            ("binary", binary, encode_binary, decode_binary),
+            ("json", text, _json_encode, json.loads),
+        )
+        for codec, payload, encode, decode in rows:
+            enc = _time_per_op(encode, message, iterations) * 1e6
+            dec = _time_per_op(decode, payload, iterations) * 1e6
+            print(f"{name:<12} {codec:<7} {len(payload):>5} {enc:>12.2f} {dec:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    run(parser.parse_args().iterations)
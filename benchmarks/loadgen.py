@@ -0,0 +1,283 @@
+"""Синтетическая нагрузка на GameServerSystem: тысячи клиентов.
+
+Пользователи делятся на группы по --room-size. В каждой группе все
+регистрируются и входят, владелец создает сеть и комнату, остальные в
+них вступают, владелец запускает игру, каждый участник отправляет
+--fires сообщений fireserver, затем игра завершается и сеть закрывается.
+По каждой операции выводятся число вызовов, ошибки, пропускная
+способность и задержки p50/p99.
+
+Режимы:
+    inproc - прямые вызовы GameServerSystem через create_client();
+    tcp    - клиенты ClientConnection по TCP; без --port сервер
+             поднимается в этом же процессе.
+
+Запуск из корня репозитория:
+    python -m benchmarks.loadgen --users 2000 --room-size 4 --fires 5
+    python -m benchmarks.loadgen --mode tcp --users 1000 --concurrency 100 --rate 5000
+    python -m benchmarks.loadgen --mode tcp --host 127.0.0.1 --port 8765 --users 1000
+"""
+
+import argparse
+import asyncio
+import secrets
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.log import configure_logging
+from app.network.game_server_system import GameServerSystem
+from app.network.protocol import CODEC_BINARY, CODEC_JSON
+from app.network.transport import ClientConnection, TransportServer
+
+# Стоимость scrypt локального сервера по умолчанию: нагрузка проверяет транспорт
+# и менеджеры, а не KDF (ее цена видна с --password-cost 14)
+LOADGEN_PASSWORD_COST = 1
+
+OPERATIONS = ("connect", "register", "login", "create_server", "join", "room_create", "room_join",
+              "start_game", "fire", "close_game", "leave", "close_server")
+
+
+class LatencyStats:
+    """Задержки и ошибки по операциям"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, op: str, elapsed: float, ok: bool):
+        self.samples.setdefault(op, []).append(elapsed)
+        if not ok:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    @staticmethod
+    def _percentile(ordered: List[float], q: float) -> float:
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def report(self) -> List[Dict]:
+        duration = (self.finished or time.perf_counter()) - self.started
+        rows = []
+        for op in OPERATIONS:
+            samples = self.samples.get(op)
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            rows.append({
+                "op": op,
+                "count": len(ordered),
+                "errors": self.errors.get(op, 0),
+                # Пропускная способность - за все время прогона, задержки - по каждому вызову
+                "ops_per_sec": len(ordered) / duration if duration else 0.0,
+                "p50_ms": self._percentile(ordered, 0.50) * 1e3,
+                "p99_ms": self._percentile(ordered, 0.99) * 1e3,
+                "max_ms": ordered[-1] * 1e3,
+            })
+        return rows
+
+    def print_report(self):
+        duration = (self.finished or time.perf_counter()) - self.started
+        total = sum(len(s) for s in self.samples.values())
+        print(f"Длительность: {duration:.2f} с, операций: {total}, в среднем {total / duration:.0f} оп/с")
+        print(f"{'операция':<13} {'вызовов':>8} {'ошибок':>7} {'оп/с':>10} {'p50, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+        for row in self.report():
+            print(f"{row['op']:<13} {row['count']:>8} {row['errors']:>7} {row['ops_per_sec']:>10.0f} "
+                  f"{row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['max_ms']:>9.3f}")
+
+
+class Pacer:
+    """Ограничивает общую частоту операций значением rate в секунду (0 - без ограничения)"""
+
+    def __init__(self, rate: float = 0.0):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.perf_counter()
+
+    def delay(self) -> float:
+        if not self.interval:
+            return 0.0
+        now = time.perf_counter()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        return slot - now
+
+
+def _groups(users: int, room_size: int) -> List[List[int]]:
+    indices = list(range(users))
+    return [indices[i:i + room_size] for i in range(0, users, room_size)]
+
+
+# --- Режим inproc -------------------------------------------------------------
+
+
+def run_inproc(users: int, room_size: int, fires: int, rate: float, prefix: str,
+               password_cost: int = LOADGEN_PASSWORD_COST) -> LatencyStats:
+    system = GameServerSystem(password_cost=password_cost)
+    server, rooms, games = system.server, system.room_manager, system.game_manager
+    stats = LatencyStats()
+    pacer = Pacer(rate)
+
+    def timed(op: str, func, *args):
+        delay = pacer.delay()
+        if delay:
+            time.sleep(delay)
+        start = time.perf_counter()
+        result = func(*args)
+        stats.record(op, time.perf_counter() - start, bool(result[0] if isinstance(result, tuple) else result))
+        return result
+
+    for group in _groups(users, room_size):
+        clients = []
+        for index in group:
+            client = system.create_client()
+            name, password = f"{prefix}{index}", f"pw{index}"
+            timed("register", client.register_player, name, password)
+            timed("login", client.login, name, password)
+            clients.append(client)
+
+        owner_id = clients[0].player["id"]
+        member_ids = [c.player["id"] for c in clients[1:]]
+
+        network = timed("create_server", server.create_server, owner_id, f"Сеть {owner_id}")
+        for uid in member_ids:
+            system.network_manager.register_connection(uid, "127.0.0.1", 0)
+            timed("join", server.add_participant, network["id"], uid)
+
+        room = timed("room_create", rooms.room_create, owner_id, "public", None, max(2, len(clients)))
+        for uid in member_ids:
+            timed("room_join", rooms.room_join, room["id_room"], uid)
+
+        timed("start_game", games.start_game, room["id_room"], owner_id, rooms)
+        game = games.get_game_by_room(room["id_room"])
+        for _ in range(fires):
+            for client in clients:
+                timed("fire", server.fireserver, client.player["id"], network["id"], "ping")
+
+        timed("close_game", games.close_game, game["id_game"], owner_id, rooms)
+        for uid in member_ids:
+            timed("leave", server.remove_participant, network["id"], uid)
+        timed("close_server", server.close_server, network["id"], owner_id)
+
+    stats.stop()
+    system.shutdown_system()
+    return stats
+
+
+# --- Режим tcp ----------------------------------------------------------------
+
+
+async def _run_tcp_group(host: str, port: int, group: List[int], fires: int, codec: str, prefix: str,
+                         stats: LatencyStats, pacer: Pacer):
+    async def timed(op: str, connection: ClientConnection, **fields) -> Tuple[bool, object]:
+        delay = pacer.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        start = time.perf_counter()
+        ok, data = await connection.request(op, **fields)
+        stats.record(op, time.perf_counter() - start, ok)
+        return ok, data
+
+    connections = []
+    try:
+        for _ in group:
+            connection = ClientConnection(codec=codec)
+            start = time.perf_counter()
+            await connection.open(host, port)
+            stats.record("connect", time.perf_counter() - start, True)
+            connections.append(connection)
+
+        for index, connection in zip(group, connections):
+            name, password = f"{prefix}{index}", f"pw{index}"
+            await timed("register", connection, name=name, password=password)
+            ok, _ = await timed("login", connection, name=name, password=password)
+            if not ok:
+                return
+
+        owner, members = connections[0], connections[1:]
+        ok, network = await timed("create_server", owner, name=f"Сеть {prefix}{group[0]}")
+        if not ok:
+            return
+        await asyncio.gather(*(timed("join", m, network_id=network["id"]) for m in members))
+
+        ok, room = await timed("room_create", owner, access="public", maxplayers=max(2, len(connections)))
+        if not ok:
+            return
+        await asyncio.gather(*(timed("room_join", m, room_id=room["id_room"]) for m in members))
+
+        ok, game = await timed("start_game", owner, room_id=room["id_room"])
+        for _ in range(fires):
+            await asyncio.gather(*(timed("fire", c, network_id=network["id"], message="ping")
+                                   for c in connections))
+        if ok:
+            await timed("close_game", owner, game_id=game["id_game"])
+        await asyncio.gather(*(timed("leave", m, network_id=network["id"]) for m in members))
+        await timed("close_server", owner, network_id=network["id"])
+    finally:
+        for connection in connections:
+            await connection.close()
+
+
+async def run_tcp(users: int, room_size: int, fires: int, rate: float, prefix: str, concurrency: int,
+                  codec: str, host: str = "127.0.0.1", port: Optional[int] = None,
+                  password_cost: int = LOADGEN_PASSWORD_COST) -> LatencyStats:
+    system = transport = None
+    if port is None:
+        system = GameServerSystem(password_cost=password_cost)
+        transport = TransportServer(system.server, host=host, port=0, game_manager=system.game_manager)
+        port = await transport.start()
+
+    stats = LatencyStats()
+    pacer = Pacer(rate)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def guarded(group: List[int]):
+        async with limit:
+            await _run_tcp_group(host, port, group, fires, codec, prefix, stats, pacer)
+
+    try:
+        await asyncio.gather(*(guarded(group) for group in _groups(users, room_size)))
+        stats.stop()
+    finally:
+        if transport is not None:
+            await transport.stop()
+            system.shutdown_system()
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inproc", "tcp"), default="inproc")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--room-size", type=int, default=4, help="участников в комнате и сети, включая владельца")
+    parser.add_argument("--fires", type=int, default=5, help="сообщений fireserver от каждого участника")
+    parser.add_argument("--rate", type=float, default=0.0, help="операций в секунду всего, 0 - без ограничения")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременно работающих групп (tcp)")
+    parser.add_argument("--codec", choices=(CODEC_BINARY, CODEC_JSON), default=CODEC_BINARY)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="порт готового сервера; без него сервер запускается локально")
+    parser.add_argument("--password-cost", type=int, default=LOADGEN_PASSWORD_COST,
+                        help="стоимость scrypt локального сервера (log2 n); 14 - как на рабочем сервере")
+    parser.add_argument("--verbose", action="store_true", help="выводить журнал сервера (уровень INFO)")
+    args = parser.parse_args(argv)
+    if args.room_size < 2:
+        parser.error("--room-size должен быть не меньше 2")
+
+    # Уникальный префикс имен: прогоны против одного сервера не конфликтуют
+    prefix = f"load_{secrets.token_hex(3)}_"
+    if args.verbose:
+        configure_logging("INFO", fmt="text")
+    if args.mode == "inproc":
+        stats = run_inproc(args.users, args.room_size, args.fires, args.rate, prefix, args.password_cost)
+    else:
+        stats = asyncio.run(run_tcp(args.users, args.room_size, args.fires, args.rate, prefix,
+                                    args.concurrency, args.codec, args.host, args.port, args.password_cost))
+
+    print(f"Режим: {args.mode}, пользователей: {args.users}, в комнате: {args.room_size}, fire: {args.fires}")
+    stats.print_report()
+
+
+if __name__ == "__main__":
+    main()
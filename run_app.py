@@ -1,8 +1,15 @@
+import argparse
+
 from app.App import CarApp
+from app.log import configure_logging
 
 
 def main():
-    app = CarApp()
+    parser = argparse.ArgumentParser(description="CarRoulette for Forza")
+    parser.add_argument("--user-db", help="файл SQLite с пользователями (по умолчанию - только в памяти)")
+    args = parser.parse_args()
+    configure_logging()
+    app = CarApp(args.user_db)
     app.mainloop()
 
 